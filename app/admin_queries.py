@@ -0,0 +1,120 @@
+"""后台列表页的查询层
+
+- 文件列表使用键集分页（按 created_at, id 倒序，以上一页最后一行作为游标），翻到多深都只读取
+  一页的数据，不需要 OFFSET 和 COUNT(*)
+- 一页文件的下载记录用一条查询批量加载，每个文件最多取 limit 条（按文件和时间的索引逐个取前
+  N 条），模板中不再逐行触发 file.downloads 的延迟加载；更多记录通过单个文件的下载记录页查看
+- 一页文件的压缩版本同样用一条查询批量加载
+"""
+from datetime import datetime
+
+from sqlalchemy import select, tuple_, union_all
+
+from models import db, BlobVariant, FileRecord, DownloadRecord
+
+
+class KeysetPage:
+    """键集分页结果，cursor_of 把一行转换为游标字符串（默认 "<ISO时间>_<id>" 形式）"""
+
+    def __init__(self, items, has_next, has_prev, cursor_of):
+        self.items = items
+        self.has_next = has_next
+        self.has_prev = has_prev
+        self.next_cursor = cursor_of(items[-1]) if items else None
+        self.prev_cursor = cursor_of(items[0]) if items else None
+
+
+def encode_cursor(value, row_id):
+    return f"{value.isoformat() if value else ''}_{row_id}"
+
+
+def decode_cursor(cursor):
+    """解析游标，格式不合法时返回 None（视为第一页）"""
+    try:
+        value, row_id = cursor.rsplit('_', 1)
+        return datetime.fromisoformat(value), int(row_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def keyset_paginate(query, time_column, id_column, per_page, after=None, before=None):
+    """对按 (time_column, id_column) 倒序的查询做键集分页
+
+    after 为当前页最后一行的游标（下一页），before 为当前页第一行的游标（上一页）。
+    """
+    key = tuple_(time_column, id_column)
+    before_key = decode_cursor(before) if before else None
+    after_key = decode_cursor(after) if after else None
+
+    if before_key:
+        # 向前翻页：正序取紧挨着游标的一页，再翻转回倒序
+        rows = query.filter(key > before_key).order_by(time_column.asc(), id_column.asc()).limit(per_page + 1).all()
+        has_prev = len(rows) > per_page
+        rows = rows[:per_page][::-1]
+        has_next = True
+    else:
+        if after_key:
+            query = query.filter(key < after_key)
+        rows = query.order_by(time_column.desc(), id_column.desc()).limit(per_page + 1).all()
+        has_next = len(rows) > per_page
+        rows = rows[:per_page]
+        has_prev = after_key is not None
+
+    return KeysetPage(rows, has_next, has_prev,
+                      lambda row: encode_cursor(getattr(row, time_column.key), row.id))
+
+
+def paginate_files(query, per_page, after=None, before=None):
+    """文件列表分页（按上传时间倒序）"""
+    return keyset_paginate(query, FileRecord.created_at, FileRecord.id, per_page, after, before)
+
+
+def stored_variants(md5s):
+    """批量加载文件实体已保存的压缩版本，返回 {md5: [(encoding, size)]}（按大小升序）"""
+    result = {md5: [] for md5 in md5s}
+    if not result:
+        return result
+    rows = db.session.execute(
+        select(BlobVariant.md5, BlobVariant.encoding, BlobVariant.size)
+        .where(BlobVariant.md5.in_(result), BlobVariant.stored == True)
+        .order_by(BlobVariant.size)
+    )
+    for md5, encoding, size in rows:
+        result[md5].append((encoding, size))
+    return result
+
+
+def recent_downloads(file_ids, limit):
+    """批量加载每个文件最近的 limit 条下载记录，返回 {file_id: [DownloadRecord]}
+
+    每个文件多取一条用于判断是否还有更多记录，调用方用 has_more_downloads 判断。
+    """
+    result = {file_id: [] for file_id in file_ids}
+    if not file_ids or limit <= 0:
+        return result
+
+    # 每个文件一个带 LIMIT 的子查询（走 file_id, download_time 索引），合并为一条语句
+    per_file = [
+        select(DownloadRecord.id).where(DownloadRecord.file_id == file_id)
+        .order_by(DownloadRecord.download_time.desc(), DownloadRecord.id.desc())
+        .limit(limit + 1).subquery().select()
+        for file_id in file_ids
+    ]
+    records = db.session.scalars(
+        select(DownloadRecord)
+        .where(DownloadRecord.id.in_(union_all(*per_file)))
+        .order_by(DownloadRecord.download_time.desc(), DownloadRecord.id.desc())
+    )
+    for record in records:
+        result[record.file_id].append(record)
+    return result
+
+
+def has_more_downloads(downloads, limit):
+    return len(downloads) > limit
+
+
+def paginate_downloads(file_id, per_page, after=None, before=None):
+    """单个文件的下载记录分页（按下载时间倒序）"""
+    query = DownloadRecord.query.filter(DownloadRecord.file_id == file_id)
+    return keyset_paginate(query, DownloadRecord.download_time, DownloadRecord.id, per_page, after, before)
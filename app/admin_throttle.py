@@ -0,0 +1,118 @@
+"""管理员登录防护（不占用 worker 的延迟）
+
+原来失败的登录在请求中 time.sleep 2~4 秒，少量攻击者就能占满同时负责下载的 worker。这里
+把延迟改为“冷却期”：密码错误后同一IP在 delay 秒内的登录请求直接返回 429 和 Retry-After，
+不校验密码也不计入失败次数，请求立即结束。
+
+封锁规则不变：block_time 秒内失败 max_attempts 次后，下一次登录尝试会封锁该IP block_time 秒，
+封锁记录和失败记录仍写入 admin_login_attempt 表。每个IP的状态（最近的失败时间、封锁截止
+时间、冷却截止时间）缓存在进程内，封锁期间和缓存有效期（state_ttl 秒）内不查询数据库；
+缓存过期后从数据库重新加载，以获得其他 worker 记录的失败和封锁。
+"""
+import math
+import threading
+import time
+from collections import OrderedDict, deque, namedtuple
+from datetime import timedelta
+
+from sqlalchemy import func
+
+from models import db, eastern8_now, AdminLoginAttempt
+
+# allowed: 是否允许校验密码；retry_after: 被拒绝时建议等待的秒数；message: 提示信息
+LoginVerdict = namedtuple('LoginVerdict', ['allowed', 'retry_after', 'message'])
+
+
+class _LoginState:
+    __slots__ = ('failures', 'blocked_until', 'cooldown_until', 'loaded_at')
+
+    def __init__(self, max_attempts, failures, blocked_until, loaded_at):
+        self.failures = deque(failures, maxlen=max_attempts)  # 最近的失败时间，从早到晚
+        self.blocked_until = blocked_until
+        self.cooldown_until = None
+        self.loaded_at = loaded_at
+
+
+class AdminLoginThrottle:
+    def __init__(self, max_attempts, block_time, delay, state_ttl, max_ips):
+        self.max_attempts = max_attempts
+        self.block_time = timedelta(seconds=block_time)
+        self.delay = timedelta(seconds=delay)
+        self.state_ttl = state_ttl
+        self.max_ips = max_ips
+        self._states = OrderedDict()  # ip -> _LoginState，按最近访问排序
+        self._lock = threading.Lock()
+
+    def check(self, ip):
+        """登录前检查，返回 LoginVerdict"""
+        now = eastern8_now()
+        state = self._state(ip, now)
+
+        if state.blocked_until and state.blocked_until > now:
+            remaining = _seconds(state.blocked_until - now)
+            return LoginVerdict(False, remaining, f"管理员登录尝试过于频繁，请等待 {remaining} 秒后再试")
+
+        recent_failures = sum(1 for t in state.failures if t > now - self.block_time)
+        if recent_failures >= self.max_attempts:
+            # 封锁IP（写入数据库，其他 worker 重新加载状态时生效）
+            state.blocked_until = now + self.block_time
+            db.session.add(AdminLoginAttempt(ip=ip, blocked_until=state.blocked_until, successful=False))
+            db.session.commit()
+            return LoginVerdict(False, _seconds(self.block_time),
+                                f"管理员登录尝试次数过多，IP已被暂时封锁{self.block_time.total_seconds()/60}分钟")
+
+        if state.cooldown_until and state.cooldown_until > now:
+            remaining = _seconds(state.cooldown_until - now)
+            return LoginVerdict(False, remaining, f"登录失败后请等待 {remaining} 秒再试")
+
+        return LoginVerdict(True, 0, "")
+
+    def record_failure(self, ip):
+        now = eastern8_now()
+        state = self._state(ip, now)
+        with self._lock:
+            state.failures.append(now)
+            state.cooldown_until = now + self.delay
+        db.session.add(AdminLoginAttempt(ip=ip, successful=False))
+        db.session.commit()
+
+    def record_success(self, ip):
+        db.session.add(AdminLoginAttempt(ip=ip, successful=True))
+        db.session.commit()
+
+    def _state(self, ip, now):
+        with self._lock:
+            state = self._states.get(ip)
+            if state is not None:
+                self._states.move_to_end(ip)
+                blocked = state.blocked_until and state.blocked_until > now
+                if blocked or time.monotonic() - state.loaded_at < self.state_ttl:
+                    return state
+
+        loaded = self._load(ip, now)
+        with self._lock:
+            if state is not None:
+                # 保留本进程的冷却期
+                loaded.cooldown_until = state.cooldown_until
+            self._states[ip] = loaded
+            self._states.move_to_end(ip)
+            while len(self._states) > self.max_ips:
+                self._states.popitem(last=False)
+        return loaded
+
+    def _load(self, ip, now):
+        """从数据库加载IP的封锁状态和窗口内最近的失败时间"""
+        blocked_until = db.session.query(func.max(AdminLoginAttempt.blocked_until)).filter(
+            AdminLoginAttempt.ip == ip,
+            AdminLoginAttempt.blocked_until > now
+        ).scalar()
+        failures = db.session.query(AdminLoginAttempt.attempt_time).filter(
+            AdminLoginAttempt.ip == ip,
+            AdminLoginAttempt.attempt_time > now - self.block_time,
+            AdminLoginAttempt.successful == False
+        ).order_by(AdminLoginAttempt.attempt_time.desc()).limit(self.max_attempts).all()
+        return _LoginState(self.max_attempts, sorted(t for t, in failures), blocked_until, time.monotonic())
+
+
+def _seconds(delta):
+    return max(1, math.ceil(delta.total_seconds()))
@@ -1,21 +1,48 @@
-from flask import Flask, render_template, request, send_from_directory, abort, redirect, url_for, flash, session
-from models import db, FileRecord, init_db, generate_md5_filename, safe_filename,DownloadRecord,check_admin_login_attempt,AdminLoginAttempt
+from flask import Flask, render_template, request, send_file, send_from_directory, abort, redirect, url_for, flash, session, g, jsonify
+from models import db, FileRecord, init_db, safe_filename, ChunkedUpload, claim_download
 from config import Config
+from ingest import StreamingUploadRequest, ensure_stored, store_upload
+from download_session import DownloadVerdict, requested_bytes, resolve_range, find_active_session, start_session, touch_session
+from chunked_upload import ChunkError, create_upload, write_chunk, received_chunks, finish_upload, settle_upload, discard_upload
+from code_cache import CodeCache
+from download_log import DownloadLogWriter
+from rate_window import create_rate_window
+from brute_force import create_brute_force_tracker
+from admin_throttle import AdminLoginThrottle
+from query_plan import check_query_plans
+from admin_queries import paginate_files, paginate_downloads, recent_downloads, stored_variants
+from search_index import search_files, rebuild_search_index
+from blobstore import acquire_blob, release_share, remove_unreferenced_file, rebuild_blob_refs, ensure_blob_refs
+from stats import record_upload, record_removal, record_toggle, record_claim, dashboard_stats, reconcile_stats, ensure_stats
+from maintenance import CleanupScheduler, format_result
+from serving import ServerSettings, serve
+from async_download import AsyncDownloadServer, content_disposition
+from storage import create_storage, migrate_flat_files
+from compression import CompressionSettings, Compressor, compress_blob, load_variants, negotiate
+from metrics import Metrics
+from share_codes import generate_codes
+from bulk_upload import bundle_name, collect_paths, ensure_local_files, ensure_uploaded_files, publish_bundle, publish_files, store_local_files, store_uploaded_files, write_csv
+from bundle import load_archive
+from thumbnails import PENDING, ThumbnailCache, ThumbnailSettings, Thumbnailer
 from datetime import datetime, timedelta
 
+import mimetypes
 import os
-import random
-import string
+import signal
+import sys
 from werkzeug.exceptions import HTTPException
 from functools import wraps
 
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
-import time
 from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.utils import send_file as werkzeug_send_file
 
 import pytz
 import argparse  # 添加 argparse 模块
+import click
+import hmac
+import io
 # 设置时区为东八区
 EASTERN_8 = pytz.timezone('Asia/Shanghai')
 # 修改所有datetime.utcnow()为以下形式
@@ -23,20 +50,41 @@ def get_eastern8_time():
     return datetime.now(EASTERN_8).replace(tzinfo=None)  # 去掉时区信息
 
 
+def env_flag(name):
+    return os.environ.get(name, '').lower() in ('1', 'true', 'yes', 'on')
+
 # 在创建 Flask 应用之前解析命令行参数
-def parse_args():
+def parse_args(argv=None):
     parser = argparse.ArgumentParser(description='运行文件分享服务')
-    parser.add_argument('--admin-password', type=str, help='设置管理员密码')
+    parser.add_argument('--admin-password', type=str, default=os.environ.get('ADMIN_PASSWORD'),
+                        help='设置管理员密码（环境变量 ADMIN_PASSWORD）')
     parser.add_argument('--clear-on-startup', action='store_true', help='启动时清空数据库和上传文件夹')
     parser.add_argument('--host', type=str, default=Config.DEFALUT_HOST, help='绑定主机地址')
     parser.add_argument('--port', type=int, default=Config.DEFALUT_PORT, help='绑定端口号')
-    return parser.parse_args()
+    parser.add_argument('--x-accel-redirect', action='store_true', default=env_flag('X_ACCEL_REDIRECT'),
+                        help='由 nginx 通过 X-Accel-Redirect 发送下载文件（环境变量 X_ACCEL_REDIRECT=1）')
+    parser.add_argument('--database-url', type=str, default=os.environ.get('DATABASE_URL'),
+                        help='数据库地址（SQLAlchemy URL），默认使用 app 目录下的 filecodes.db（环境变量 DATABASE_URL）')
+    parser.add_argument('--cleanup-worker', action='store_true', help='作为独立清理进程运行（不启动 Web 服务）')
+    parser.add_argument('--no-cleanup-scheduler', action='store_true', default=env_flag('NO_CLEANUP_SCHEDULER'),
+                        help='不在 Web 进程内定时清理，由独立清理进程负责（环境变量 NO_CLEANUP_SCHEDULER=1）')
+    parser.add_argument('--serve', action='store_true', help='使用生产服务器（gunicorn，多进程多线程）运行')
+    parser.add_argument('--workers', type=int, help=f'生产服务器 worker 进程数（默认 {Config.SERVER_WORKERS}）')
+    parser.add_argument('--threads', type=int, help=f'生产服务器每个 worker 的线程数（默认 {Config.SERVER_THREADS}）')
+    parser.add_argument('--keepalive', type=int, help=f'生产服务器 keep-alive 保持时间，秒（默认 {Config.SERVER_KEEPALIVE}）')
+    parser.add_argument('--metrics', action='store_true', default=env_flag('METRICS'),
+                        help='记录运行指标，GET /admin/metrics 输出 Prometheus 文本格式（环境变量 METRICS=1）')
+    parser.add_argument('--async-downloads', action='store_true', help='作为异步下载服务运行（只处理 /download/，需要 aiohttp）')
+    return parser.parse_args(argv)
 
-args = parse_args()
+# 直接运行 app.py 时解析命令行参数；被 gunicorn 等 WSGI 服务器或 flask 命令导入时不读取
+# sys.argv（其中是服务器自己的参数），只使用环境变量
+args = parse_args(None if __name__ == '__main__' else [])
 
 
 app = Flask(__name__)
 app.config.from_object(Config)
+app.request_class = StreamingUploadRequest  # 上传文件在解析请求体时一次性完成哈希、计数和落盘
 app.secret_key = app.config['SECRET_KEY']  # 设置session密钥
 
 # 需要在Flask中显式配置信任代理头部
@@ -48,21 +96,120 @@ if args.admin_password:
     app.config['ADMIN_PASSWORD'] = args.admin_password
 if args.clear_on_startup:
     app.config['CLEAR_ON_STARTUP'] = True
+if args.x_accel_redirect:
+    app.config['DOWNLOAD_OFFLOAD'] = True
+if args.no_cleanup_scheduler or args.cleanup_worker:
+    app.config['CLEANUP_SCHEDULER_ENABLED'] = False
+if args.metrics:
+    app.config['METRICS_ENABLED'] = True
+
+# 初始化文件存储（本地分层目录或对象存储）
+storage = create_storage(app.config)
 
 # 初始化数据库
-init_db(app)
+init_db(app, database_url=args.database_url)
+with app.app_context():
+    ensure_blob_refs()  # 旧数据库补建文件引用计数
+    ensure_stats(app.config['STATS_RECONCILE_HOURS'])  # 初始化后台统计计数器
+
+# 运行指标（未启用时不注册请求钩子和数据库事件）；先于速率限制器注册，被限制的请求也计入
+metrics = Metrics(
+    enabled=app.config['METRICS_ENABLED'],
+    shared_dir=app.config['METRICS_SHARED_DIR'],
+    sync_interval=app.config['METRICS_SYNC_INTERVAL']
+)
+with app.app_context():
+    metrics.init_app(app, db.engine)
 
 # 初始化速率限制器
 limiter = Limiter(
     app=app,
     key_func=get_remote_address,  # 使用客户端IP作为限制依据
-    default_limits= [app.config['RATE_LIMIT_DEFAULT']] # 全局默认限制
+    default_limits= [app.config['RATE_LIMIT_DEFAULT']], # 全局默认限制
+    on_breach=metrics.on_limiter_breach  # 拒绝时计入指标
+)
+
+# 提取码尝试记录（有界，可选多 worker 共享）
+brute_force_tracker = create_brute_force_tracker(
+    app.config['BRUTE_FORCE_STORAGE'],
+    max_attempts=app.config['PASSWORD_MAX_ATTEMPTS'],
+    window=app.config['PASSWORD_BLOCK_TIME'],
+    block_time=app.config['PASSWORD_BLOCK_TIME'],
+    max_ips=app.config['BRUTE_FORCE_MAX_IPS']
+)
+
+# 管理员登录防护（冷却期和封锁状态缓存在进程内，不在请求中 sleep）
+admin_login_throttle = AdminLoginThrottle(
+    max_attempts=app.config['ADMIN_LOGIN_ATTEMPTS'],
+    block_time=app.config['ADMIN_LOGIN_BLOCK_TIME'],
+    delay=app.config['ADMIN_LOGIN_DELAY'],
+    state_ttl=app.config['ADMIN_LOGIN_STATE_TTL'],
+    max_ips=app.config['ADMIN_LOGIN_MAX_IPS']
+)
+
+# 下载频率滑动窗口
+download_window = create_rate_window(
+    app.config['DOWNLOAD_FREQUENCY_STORAGE_URI'],
+    app.config['DOWNLOAD_FREQUENCY_LIMIT'],
+    app.config['DOWNLOAD_FREQUENCY_WINDOW']
+)
+
+# 下载记录批量写入
+download_log = DownloadLogWriter(
+    app,
+    max_queue=app.config['DOWNLOAD_LOG_QUEUE_SIZE'],
+    batch_size=app.config['DOWNLOAD_LOG_BATCH_SIZE'],
+    flush_interval=app.config['DOWNLOAD_LOG_FLUSH_INTERVAL'],
+    enabled=app.config['DOWNLOAD_LOG_ASYNC']
+)
+
+# 可压缩文件的后台压缩
+compression_settings = CompressionSettings(app.config)
+compressor = Compressor(app, storage, compression_settings, max_queue=app.config['COMPRESSION_QUEUE_SIZE'])
+
+# 图片缩略图（后台线程池生成，本地磁盘 LRU 缓存）
+thumbnailer = Thumbnailer(
+    app,
+    storage,
+    ThumbnailSettings(app.config),
+    ThumbnailCache(app.config['THUMBNAIL_CACHE_DIR'] or os.path.join(app.config['UPLOAD_FOLDER'], '.thumbnails'),
+                   app.config['THUMBNAIL_CACHE_MAX_BYTES']),
+    workers=app.config['THUMBNAIL_WORKERS'],
+    max_queue=app.config['THUMBNAIL_QUEUE_SIZE']
+)
+
+# 提取码查询缓存
+code_cache = CodeCache(
+    maxsize=app.config['CODE_CACHE_SIZE'],
+    ttl=app.config['CODE_CACHE_TTL'],
+    negative_ttl=app.config['CODE_CACHE_NEGATIVE_TTL']
 )
 
-# 密码尝试记录
-password_attempts = {}
+# 定时清理
+def invalidate_codes(codes):
+    for code in codes:
+        code_cache.invalidate(code)
 
-# 确保上传目录存在
+def reconcile_after_cleanup(result):
+    # 清理后按真实数据校对后台统计
+    download_log.flush()
+    result['stat_corrections'] = len(reconcile_stats(app.config['STATS_RECONCILE_HOURS']))
+
+cleanup_scheduler = CleanupScheduler(
+    app,
+    storage,
+    interval=app.config['CLEANUP_INTERVAL'],
+    on_removed=invalidate_codes,
+    after_run=reconcile_after_cleanup
+)
+
+@app.before_request
+def start_cleanup_scheduler():
+    # 后台线程按进程启动（多进程服务器 fork 之后）
+    if app.config['CLEANUP_SCHEDULER_ENABLED']:
+        cleanup_scheduler.ensure_started()
+
+# 确保上传目录存在（对象存储时也用于存放上传中的临时文件）
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
 @app.errorhandler(RequestEntityTooLarge)
@@ -106,49 +253,22 @@ def admin_required(f):
 
 def check_brute_force(ip, code):
     """检查提取码爆破尝试"""
-    now = time.time()
-    
-    # 初始化IP记录
-    if ip not in password_attempts:
-        password_attempts[ip] = {'attempts': [], 'blocked_until': 0}
+    # 记录本次尝试（5分钟内超过次数上限则封锁IP 5分钟，后端见 brute_force）
+    verdict = brute_force_tracker.hit(ip)
+    if not verdict.allowed:
+        metrics.brute_force_blocked('code')
     
-    # 检查是否被封锁
-    if password_attempts[ip]['blocked_until'] > now:
-        remaining_time = int(password_attempts[ip]['blocked_until'] - now)
-        return False, f"尝试过于频繁，请等待 {remaining_time} 秒后再试"
-    
-    # 记录本次尝试
-    password_attempts[ip]['attempts'].append(now)
-    
-    # 清理过期的尝试记录（只保留最近5分钟内的）
-    password_attempts[ip]['attempts'] = [
-        t for t in password_attempts[ip]['attempts'] 
-        if t > now - app.config['PASSWORD_BLOCK_TIME']
-    ]
-    
-    # 检查尝试次数
-    if len(password_attempts[ip]['attempts']) > app.config['PASSWORD_MAX_ATTEMPTS']:
-        # 封锁IP 5分钟
-        password_attempts[ip]['blocked_until'] = now +app.config['PASSWORD_BLOCK_TIME']
+    if verdict.just_blocked:
         return False, f"尝试次数过多，IP已被暂时封锁{app.config['PASSWORD_BLOCK_TIME']/60} 分钟"
+    if not verdict.allowed:
+        return False, f"尝试过于频繁，请等待 {verdict.remaining} 秒后再试"
     
     return True, ""
 
 def check_download_frequency(ip, file_id):
     """检查下载频率"""
-    now = get_eastern8_time()
-    
-    # 检查同一IP在短时间内对同一文件的下载次数
-    recent_downloads = DownloadRecord.query.filter(
-        DownloadRecord.downloader_ip == ip,
-        DownloadRecord.file_id == file_id,
-        DownloadRecord.download_time > now - timedelta(minutes=app.config['DOWNLOAD_FREQUENCY_WINDOW'])
-    ).count()
-    
-    if recent_downloads >= app.config['DOWNLOAD_FREQUENCY_LIMIT']:
-        return False
-    
-    return True
+    # 检查同一IP在短时间内对同一文件的下载次数（滑动窗口，后端见 rate_window）
+    return download_window.allow(ip, file_id)
 
 @app.route('/', methods=['GET', 'POST'])
 @limiter.limit(app.config['RATE_LIMIT_INDEX'])  # 限制每分钟10次请求
@@ -167,7 +287,7 @@ def index():
             flash(message, 'error')
             return redirect(url_for('index'))
         
-        file_record = FileRecord.query.filter_by(code=code).first()
+        file_record = code_cache.lookup(code)
         
         if not file_record:
             flash('无效的提取码', 'error')
@@ -182,73 +302,278 @@ def index():
             else:
                 flash('提取码已失效', 'error')
             return redirect(url_for('index'))
+
+        # 图片先显示缩略图，确认后再下载（预览不占用下载次数）
+        if thumbnailer.applies_to(file_record.original_filename, file_record.file_size):
+            allow_preview(code)
+            return render_template('preview.html', file=file_record, code=code)
             
         return redirect(url_for('download_file', code=code))
     
     return render_template('index.html')
 
-@app.route('/download/<code>')
-@limiter.limit(app.config['RATE_LIMIT_DOWNLOAD'])  # 限制每分钟3次下载
-def download_file(code):
-    ip = get_remote_address()
-    file_record = FileRecord.query.filter_by(code=code).first()
-    
-    if not file_record or not file_record.is_valid():
+def allow_preview(code):
+    """记住会话中通过首页校验的提取码：缩略图只对这些提取码开放，不能用来猜测提取码"""
+    codes = [item for item in session.get('preview_codes', []) if item != code]
+    session['preview_codes'] = (codes + [code])[-app.config['PREVIEW_SESSION_CODES']:]
+
+@app.route('/preview/<code>')
+@limiter.limit(app.config['RATE_LIMIT_PREVIEW'])
+def preview(code):
+    # 图片缩略图：不计入下载次数，也不记录下载
+    if code not in session.get('preview_codes', []):
         abort(404)
+    file_record = code_cache.lookup(code)
+    if not file_record or not file_record.is_valid() or not thumbnailer.applies_to(
+            file_record.original_filename, file_record.file_size):
+        abort(404)
+    return send_thumbnail(file_record.md5_filename)
+
+def send_thumbnail(md5):
+    """发送缩略图：内容由文件哈希决定，浏览器按 ETag 和 Cache-Control 长期缓存"""
+    path = thumbnailer.thumbnail(md5, app.config['THUMBNAIL_WAIT'])
+    if path is PENDING:
+        response = app.response_class('缩略图生成中，请稍后重试', status=503, mimetype='text/plain')
+        response.headers['Retry-After'] = '2'
+        return response
+    if path is None:
+        abort(404)
+    response = send_file(path, mimetype=thumbnailer.mimetype, etag=os.path.basename(path),
+                         max_age=app.config['THUMBNAIL_MAX_AGE'])
+    # 预览只对当前会话开放，不允许共享缓存保存
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.immutable = True
+    return response
+
+def is_download_continuation():
+    """flask_limiter 的 deduct_when 回调：续传请求不消耗下载速率配额"""
+    return g.get('download_continuation', False)
+
+def can_resume(file_record, byte_range, if_range_etag):
+    """判断请求是否可能是续传：Range 从文件中间开始，且 If-Range（如有）与文件或其压缩版本的 ETag 一致
+
+    从头开始的 Range（如 bytes=0-）与完整下载相同，总是视为新的下载。
+    """
+    span = byte_range.range_for_length(file_record.file_size) if byte_range is not None else None
+    if span is None or span[0] == 0:
+        return False
+    if if_range_etag is None:
+        return True
+    md5 = file_record.md5_filename
+    return if_range_etag == md5 or if_range_etag.startswith(md5 + '-')
+
+def select_variant(file_record, byte_range, if_range_etag, accept_encodings):
+    """可压缩的文件按 Accept-Encoding 选择压缩版本（None 表示发送原文件）
+
+    还没有压缩版本的文件加入后台压缩队列，本次发送原文件。多文件分享的 ZIP 不压缩。
+    """
+    if accept_encodings is None or file_record.is_bundle or not compression_settings.applies_to(
+            file_record.original_filename, file_record.file_size):
+        return None
+    variants, pending = load_variants(file_record.md5_filename, compression_settings)
+    if pending:
+        compressor.submit(file_record.md5_filename)
+    variant = negotiate(variants, accept_encodings, byte_range, if_range_etag)
+    if variant is not None and not storage.exists(variant.name):
+        return None
+    return variant
+
+def authorize_download(code, ip, byte_range, if_range_etag, user_agent, accept_encodings=None):
+    """下载前的校验和计数（download_file 与异步下载服务共用，需在应用上下文中调用）
+
+    byte_range 为解析后的 Range 头（werkzeug Range 或 None），if_range_etag 为 If-Range 中的
+    ETag（没有或无需比较时为 None），accept_encodings 为解析后的 Accept-Encoding（None 表示
+    不发送压缩版本）。新的下载会占用一次下载次数、开启下载会话并记录下载。
+    """
+    now = get_eastern8_time()
+    file_record = code_cache.lookup(code)  # 缓存的只读快照，下载计数以数据库为准
     
-    # 检查下载频率
-    if not check_download_frequency(ip, file_record.id):
-        flash('下载过于频繁，请稍后再试', 'error')
-        return redirect(url_for('index'))
-    
-    filepath = os.path.join(app.config['UPLOAD_FOLDER'], file_record.md5_filename)
+    if not file_record:
+        return DownloadVerdict(None, False, 404)
 
-    # print(filepath)
-    # 此处的path和上传的时候的path一致
-    # print(os.path.exists(filepath))
-    # 好叭，就不是在这里犯的病
+    # 断点续传：下载会话内的 Range 请求属于已计数的那次下载
+    resumable = can_resume(file_record, byte_range, if_range_etag)
+    download_session = find_active_session(
+        file_record, ip, now, requested_bytes(byte_range, file_record.file_size)) if resumable else None
 
-    if not os.path.exists(filepath):
-        abort(404)
+    if download_session is None:
+        if not file_record.is_valid():
+            return DownloadVerdict(None, False, 404)
+        
+        # 检查下载频率
+        if not check_download_frequency(ip, file_record.id):
+            metrics.rate_limit_rejected('download_frequency')
+            return DownloadVerdict(None, False, 429)
+    elif not file_record.is_valid(check_quota=False):
+        return DownloadVerdict(None, False, 404)
+    
+    archive = None
+    if file_record.is_bundle:
+        # 多文件分享：按文件列表即时生成 ZIP
+        variant = None
+        archive = load_archive(storage, file_record)
+        if archive is None:
+            return DownloadVerdict(None, False, 404)
+    else:
+        variant = select_variant(file_record, byte_range, if_range_etag, accept_encodings)
+        if variant is None and not storage.exists(file_record.md5_filename):
+            return DownloadVerdict(None, False, 404)
+
+    served = requested_bytes(byte_range, variant.size if variant else file_record.file_size)
+    if download_session is not None:
+        # 续传：只累计传输字节数，不重复计数
+        touch_session(download_session, now, served)
+        db.session.commit()
+        return DownloadVerdict(file_record, True, None, variant, archive)
     
-    # 创建下载记录
-    download_record = DownloadRecord(
+    # 配额检查与下载计数合并为一条条件 UPDATE（缓存可能滞后，以数据库为准）
+    if not claim_download(file_record.id, now):
+        db.session.rollback()
+        code_cache.invalidate(code)
+        return DownloadVerdict(None, False, 404)
+    record_claim()  # 总下载量与下载计数在同一事务中增加
+    start_session(file_record, ip, now, served)
+    db.session.commit()
+    code_cache.invalidate(code)
+    download_window.record(ip, file_record.id)
+
+    # 下载记录交给后台线程批量写入；以压缩版本完整发送时记录节省的流量
+    download_log.record(
         file_id=file_record.id,
         downloader_ip=ip,
-        user_agent=request.headers.get('User-Agent')
+        download_time=now,
+        user_agent=user_agent,
+        bytes_saved=file_record.file_size - variant.size if variant and byte_range is None else 0
     )
-    db.session.add(download_record)
-     
-    # 更新下载计数
-    file_record.download_count += 1
-    db.session.commit()
-     
+    return DownloadVerdict(file_record, False, None, variant, archive)
+
+@app.route('/download/<code>')
+@limiter.limit(app.config['RATE_LIMIT_DOWNLOAD'],  # 限制每分钟3次下载
+               deduct_when=lambda response: not is_download_continuation())
+def download_file(code):
+    # 卸载模式下 ETag 由 nginx 生成，If-Range 交给 nginx 判断
+    if_range_etag = None if app.config['DOWNLOAD_OFFLOAD'] else request.if_range.etag
+    verdict = authorize_download(code, get_remote_address(), request.range, if_range_etag,
+                                 request.headers.get('User-Agent'), request.accept_encodings)
+
+    if verdict.error == 429:
+        flash('下载过于频繁，请稍后再试', 'error')
+        return redirect(url_for('index'))
+    if verdict.error:
+        abort(verdict.error)
+
+    # 续传请求不消耗下载速率配额
+    g.download_continuation = verdict.continuation
+    response = build_download_response(verdict.file_record, verdict.variant, verdict.archive)
+    if verdict.variant is not None:
+        response.headers['Content-Encoding'] = verdict.variant.encoding
+    if compression_settings.applies_to(verdict.file_record.original_filename, verdict.file_record.file_size):
+        response.vary.add('Accept-Encoding')
+    return response
+
+
+def build_download_response(file_record, variant=None, archive=None):
+    """构造下载响应：启用卸载时交给 nginx 发送文件体，否则由 Flask 直接发送
+
+    variant 为要发送的压缩版本（Content-Encoding 由调用方设置），None 时发送原文件；
+    archive 为多文件分享的 ZIP，总是由应用流式生成（不经过 nginx 或预签名 URL）。
+    """
+    if archive is not None:
+        return build_stream_response(archive.open, archive.size, file_record.md5_filename,
+                                     file_record.original_filename, app.config['BUNDLE_STREAM_CHUNK_SIZE'])
+    if storage.remote:
+        return build_remote_download_response(file_record, variant)
+
+    relative_path = storage.locate(variant.name if variant else file_record.md5_filename)
+    if app.config['DOWNLOAD_OFFLOAD']:
+        # 只生成响应头（文件名、类型、长度），不打开文件；nginx 收到 X-Accel-Redirect 后用 sendfile 发送
+        response = werkzeug_send_file(
+            os.path.join(storage.root, relative_path),
+            environ=request.environ,
+            as_attachment=True,
+            download_name=file_record.original_filename,
+            conditional=False,
+            use_x_sendfile=True,
+            response_class=app.response_class
+        )
+        del response.headers['X-Sendfile']
+        response.headers['X-Accel-Redirect'] = app.config['X_ACCEL_REDIRECT_PREFIX'] + relative_path
+        return response
+
     """
     send_from_directory 要求 directory 参数是​​相对于应用根目录的路径​​（不是绝对路径）。
     如果 UPLOAD_FOLDER = 'app/files' 是相对路径，Flask 会尝试从应用根目录（即 app.py 所在目录）
     下的 app/files 查找文件。
     """
-    response = send_from_directory(
-        app.config['UPLOAD_FOLDER'],
-        file_record.md5_filename,
+    # 以MD5作为强ETag，Werkzeug据此处理 Range / If-Range 并返回 206
+    return send_from_directory(
+        storage.root,
+        relative_path,
         as_attachment=True,
-        download_name=file_record.original_filename
+        download_name=file_record.original_filename,
+        etag=variant.etag if variant else file_record.md5_filename
     )
-  
-    
+
+
+def build_remote_download_response(file_record, variant=None):
+    """对象存储：重定向到预签名 URL，或由应用按块转发（支持 Range / If-Range）"""
+    name = variant.name if variant else file_record.md5_filename
+    etag = variant.etag if variant else file_record.md5_filename
+    disposition = content_disposition(file_record.original_filename)
+    if app.config['STORAGE_S3_PRESIGNED_DOWNLOADS']:
+        return redirect(storage.presigned_url(name, disposition, variant.encoding if variant else None))
+
+    if variant is not None:
+        size = variant.size
+    else:
+        size = file_record.file_size if file_record.file_size is not None else storage.size(name)
+    return build_stream_response(lambda start: storage.open(name, start), size, etag,
+                                 file_record.original_filename, app.config['STORAGE_S3_STREAM_CHUNK_SIZE'],
+                                 disposition)
+
+
+def build_stream_response(open_body, size, etag, filename, chunk_size, disposition=None):
+    """按块转发 open_body(start) 返回的读取流（支持 Range / If-Range），用于对象存储和多文件分享"""
+    span = resolve_range(request.range, request.if_range.etag, etag, size)
+    if span is None:
+        response = app.response_class(status=416)
+        response.headers['Content-Range'] = f'bytes */{size}'
+        return response
+    start, stop, partial = span
+    body = open_body(start)
+
+    def generate():
+        remaining = stop - start
+        try:
+            while remaining > 0:
+                data = body.read(min(chunk_size, remaining))
+                if not data:
+                    break
+                remaining -= len(data)
+                yield data
+        finally:
+            body.close()
+
+    response = app.response_class(
+        generate(),
+        status=206 if partial else 200,
+        mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream',
+        direct_passthrough=True
+    )
+    response.headers['Content-Disposition'] = disposition or content_disposition(filename)
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.set_etag(etag)
+    response.content_length = stop - start
+    if partial:
+        response.headers['Content-Range'] = f'bytes {start}-{stop - 1}/{size}'
     return response
 
 
-def generate_code(length=Config.CODE_LENGTH):
-    """生成指定位数的字母数字混合提取码（大小写敏感）"""
-    # 确保包含大小写字母和数字
-    while True:
-        chars = string.ascii_letters + string.digits
-        code = ''.join(random.SystemRandom().choice(chars) for _ in range(length))
-        # 确保包含至少一个数字和一个字母
-        if (any(c.isdigit() for c in code) and 
-            any(c.isalpha() for c in code)):
-            return code
+def generate_unique_code(max_attempts=10):
+    """生成数据库中尚未使用的提取码，多次冲突后返回 None"""
+    codes = generate_codes(1, app.config['CODE_LENGTH'], max_attempts)
+    return codes[0] if codes else None
 
 def admin_required(f):
     """管理员权限装饰器"""
@@ -266,27 +591,22 @@ def admin_login():
     if request.method == 'POST':
         ip = get_remote_address()
         
-        # 检查登录尝试
-        is_allowed, message = check_admin_login_attempt(ip)
-        if not is_allowed:
-            time.sleep(app.config['ADMIN_LOGIN_DELAY'] * 2)  # 更长的延迟
-            return render_template('admin_login.html',
+        # 检查登录尝试（封锁期或失败后的冷却期内直接返回 429，不占用 worker）
+        verdict = admin_login_throttle.check(ip)
+        if not verdict.allowed:
+            metrics.brute_force_blocked('admin_login')
+            response = app.make_response((render_template('admin_login.html',
                            session_timeout=app.config['ADMIN_SESSION_TIMEOUT'],
-                         warning_time=app.config['ADMIN_SESSION_WARNING_TIME'], error=message)
+                         warning_time=app.config['ADMIN_SESSION_WARNING_TIME'], error=verdict.message), 429))
+            response.headers['Retry-After'] = str(verdict.retry_after)
+            return response
         
         password = request.form.get('admin_password', '')
         
-        # 验证密码前添加延迟
-        # time.sleep(app.config['ADMIN_LOGIN_DELAY'])
-        
         # 验证密码
         if password == app.config['ADMIN_PASSWORD']:
             # 记录成功尝试
-            attempt = AdminLoginAttempt(
-                ip=ip,
-                successful=True
-            )
-            db.session.add(attempt)
+            admin_login_throttle.record_success(ip)
             
             # 设置session
             session['admin_logged_in'] = True
@@ -297,15 +617,8 @@ def admin_login():
             flash('管理员登录成功', 'success')
             return redirect(url_for('admin_home'))
         else:
-            # 记录失败尝试
-            attempt = AdminLoginAttempt(
-                ip=ip,
-                successful=False
-            )
-            db.session.add(attempt)
-            db.session.commit()
-            
-            time.sleep(app.config['ADMIN_LOGIN_DELAY'])  # 失败后延迟
+            # 记录失败尝试，冷却期内的再次登录会被拒绝
+            admin_login_throttle.record_failure(ip)
             return render_template('admin_login.html', 
                            session_timeout=app.config['ADMIN_SESSION_TIMEOUT'],
                          warning_time=app.config['ADMIN_SESSION_WARNING_TIME'],error="管理员密码错误，请重试")
@@ -344,33 +657,22 @@ def add_file():
             return redirect(url_for('add_file'))
 
         try:
-            max_attempts = 10
-            for _ in range(max_attempts):
-                code = generate_code()
-                if not FileRecord.query.filter_by(code=code).first():
-                    break
-            else:
+            code = generate_unique_code()
+            if code is None:
                 flash('无法生成唯一提取码，请重试', 'error')
                 return redirect(url_for('add_file'))
             
             original_filename = request.files['file'].filename
             safe_name = safe_filename(original_filename)
-            md5_filename = generate_md5_filename(file.stream)
-            
-            # 获取文件信息
-            file.seek(0, os.SEEK_END)
-            file_size = file.tell()
-            file.seek(0)
-            
             file_type = os.path.splitext(original_filename)[1].lower().lstrip('.')
             
             expire_days = int(request.form.get('expire_days', app.config['DEFAULT_EXPIRE_DAYS']))
             expires_at = get_eastern8_time() + timedelta(days=expire_days)
             
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], md5_filename)
-            file.save(filepath)
+            # 请求体解析时已写入上传目录的临时文件，这里只需重命名为MD5文件名
+            md5_filename, file_size = store_upload(file, storage)
+            acquire_blob(md5_filename, file_size)  # 与文件记录在同一事务中增加引用
 
-            
             new_record = FileRecord(
                 code=code,
                 md5_filename=md5_filename,
@@ -384,7 +686,11 @@ def add_file():
             )
             
             db.session.add(new_record)
+            record_upload(new_record)
             db.session.commit()
+            ensure_stored(file, storage, md5_filename)  # 去重时跳过写入的文件可能刚被并发删除
+            code_cache.invalidate(code)  # 清除可能存在的负缓存
+            submit_background_jobs(md5_filename, original_filename, file_size)
             
             flash(f'文件添加成功！提取码: {code}', 'success')
             return redirect(url_for('add_file'))
@@ -396,23 +702,203 @@ def add_file():
             return redirect(url_for('add_file'))
     
     return render_template('admin_add.html',
+                           chunk_size=app.config['CHUNKED_UPLOAD_CHUNK_SIZE'],
+                           parallel=app.config['CHUNKED_UPLOAD_PARALLEL'],
+                           bulk_max_files=app.config['BULK_UPLOAD_MAX_FILES'],
+                           max_content_length=app.config['MAX_CONTENT_LENGTH'],
                            session_timeout=app.config['ADMIN_SESSION_TIMEOUT'],
                          warning_time=app.config['ADMIN_SESSION_WARNING_TIME'])
 
+# 分片上传：初始化
+@app.route('/admin/upload/init', methods=['POST'])
+@limiter.exempt  # 分片接口只对管理员开放，一个大文件需要上百次请求，不受全局限速
+@admin_required
+def chunked_upload_init():
+    original_filename = request.form.get('filename', '')
+    total_size = request.form.get('size', -1, type=int)
+
+    if not original_filename or not is_allowed_file(original_filename):
+        return jsonify(error='不允许上传此类型的文件，如需上传，请联系管理员维护。'), 400
+    if total_size < 0 or total_size > app.config['CHUNKED_UPLOAD_MAX_SIZE']:
+        return jsonify(error='文件大小超出限制'), 400
+
+    upload = create_upload(
+        app.config['UPLOAD_FOLDER'],
+        app.config['CHUNKED_UPLOAD_CHUNK_SIZE'],
+        original_filename=original_filename,
+        total_size=total_size,
+        expire_days=request.form.get('expire_days', app.config['DEFAULT_EXPIRE_DAYS'], type=int),
+        max_downloads=request.form.get('max_downloads', 1, type=int),
+        description=request.form.get('description', ''),
+        uploader_ip=request.remote_addr
+    )
+    db.session.commit()
+    return jsonify(upload_id=upload.id, chunk_size=upload.chunk_size, chunk_count=upload.chunk_count)
+
+# 分片上传：上传分片（请求体为分片原始字节，可并行）
+@app.route('/admin/upload/<upload_id>', methods=['PUT'])
+@limiter.exempt
+@admin_required
+def chunked_upload_put(upload_id):
+    upload = db.get_or_404(ChunkedUpload, upload_id)
+    offset = request.args.get('offset', -1, type=int)
+
+    try:
+        index = write_chunk(upload, app.config['UPLOAD_FOLDER'], offset, request.content_length,
+                            request.stream, app.config['UPLOAD_BUFFER_SIZE'])
+        db.session.commit()
+    except ChunkError as e:
+        db.session.rollback()
+        return jsonify(error=str(e)), 400
+
+    return jsonify(chunk_index=index)
+
+# 分片上传：完成并生成提取码
+@app.route('/admin/upload/<upload_id>/finalize', methods=['POST'])
+@limiter.exempt
+@admin_required
+def chunked_upload_finalize(upload_id):
+    upload = db.get_or_404(ChunkedUpload, upload_id)
+    if received_chunks(upload) != upload.chunk_count:
+        return jsonify(error='分片尚未全部上传'), 409
+
+    code = generate_unique_code()
+    if code is None:
+        return jsonify(error='无法生成唯一提取码，请重试'), 500
+
+    try:
+        md5_filename = finish_upload(upload, app.config['UPLOAD_FOLDER'], app.config['UPLOAD_BUFFER_SIZE'], storage)
+        acquire_blob(md5_filename, upload.total_size)
+
+        new_record = FileRecord(
+            code=code,
+            md5_filename=md5_filename,
+            original_filename=upload.original_filename,
+            file_size=upload.total_size,
+            file_type=os.path.splitext(upload.original_filename)[1].lower().lstrip('.'),
+            uploader_ip=upload.uploader_ip,
+            expires_at=get_eastern8_time() + timedelta(days=upload.expire_days),
+            max_downloads=upload.max_downloads,
+            description=upload.description
+        )
+        db.session.add(new_record)
+        record_upload(new_record)
+        db.session.delete(upload)
+        db.session.commit()
+        settle_upload(upload_id, app.config['UPLOAD_FOLDER'], storage, md5_filename)
+        code_cache.invalidate(code)  # 清除可能存在的负缓存
+        submit_background_jobs(md5_filename, new_record.original_filename, new_record.file_size)
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"分片上传完成失败: {str(e)}", exc_info=True)
+        return jsonify(error=f'文件上传失败: {str(e)}'), 500
+
+    flash(f'文件添加成功！提取码: {code}', 'success')
+    return jsonify(code=code)
+
+# 分片上传：取消
+@app.route('/admin/upload/<upload_id>', methods=['DELETE'])
+@limiter.exempt
+@admin_required
+def chunked_upload_abort(upload_id):
+    upload = db.get_or_404(ChunkedUpload, upload_id)
+    discard_upload(upload, app.config['UPLOAD_FOLDER'])
+    db.session.commit()
+    return jsonify(aborted=upload_id)
+
+# 批量上传：每个文件一个提取码（或勾选打包时全部文件一个提取码），返回提取码与文件名对照表（CSV）
+@app.route('/admin/bulk-upload', methods=['POST'])
+@admin_required
+def bulk_upload():
+    files = [file for file in request.files.getlist('files') if file.filename]
+    if not files:
+        flash('没有选择文件', 'error')
+        return redirect(url_for('add_file'))
+    if len(files) > app.config['BULK_UPLOAD_MAX_FILES']:
+        flash(f"一次最多上传 {app.config['BULK_UPLOAD_MAX_FILES']} 个文件，更多文件请使用 flask bulk-upload 命令", 'error')
+        return redirect(url_for('add_file'))
+
+    accepted = [file for file in files if is_allowed_file(file.filename)]
+    skipped = [(file.filename, '不允许上传此类型的文件') for file in files if not is_allowed_file(file.filename)]
+    if not accepted:
+        flash('不允许上传此类型的文件，如需上传，请联系管理员维护。', 'error')
+        return redirect(url_for('add_file'))
+
+    try:
+        expire_days = int(request.form.get('expire_days', app.config['DEFAULT_EXPIRE_DAYS']))
+        options = dict(expires_at=get_eastern8_time() + timedelta(days=expire_days),
+                       max_downloads=int(request.form.get('max_downloads', 1)),
+                       description=request.form.get('description', ''),
+                       uploader_ip=request.remote_addr)
+        stored = store_uploaded_files(accepted, storage, app.config['BULK_UPLOAD_THREADS'])
+        if request.form.get('bundle'):
+            name = safe_filename(request.form.get('bundle_name', '').strip() or bundle_name(stored))
+            record = publish_bundle(stored, name, storage, app.config['CODE_LENGTH'], **options)
+            records = None if record is None else [record]
+        else:
+            records = publish_files(stored, app.config['CODE_LENGTH'], **options)
+        if records is not None:
+            ensure_uploaded_files(accepted, stored, storage)
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"批量上传错误: {str(e)}", exc_info=True)
+        flash(f'文件上传失败: {str(e)}', 'error')
+        return redirect(url_for('add_file'))
+    if records is None:
+        flash('无法生成唯一提取码，请重试', 'error')
+        return redirect(url_for('add_file'))
+    after_publish(records)
+
+    out = io.StringIO()
+    write_csv(out, records, skipped)
+    published = f"打包发布 {len(stored)} 个文件" if request.form.get('bundle') else f"发布 {len(records)} 个文件"
+    flash(f'批量上传完成：{published}，跳过 {len(skipped)} 个', 'success')
+    filename = f"shares-{get_eastern8_time().strftime('%Y%m%d-%H%M%S')}.csv"
+    # 带 BOM，Excel 直接打开时按 UTF-8 识别中文文件名
+    return '\ufeff' + out.getvalue(), 200, {
+        'Content-Type': 'text/csv; charset=utf-8',
+        'Content-Disposition': f'attachment; filename="{filename}"',
+    }
+
+def after_publish(records):
+    # 批量发布提交后：清除可能存在的负缓存，提交后台压缩和缩略图任务
+    for record in records:
+        code_cache.invalidate(record.code)
+        if not record.is_bundle:
+            submit_background_jobs(record.md5_filename, record.original_filename, record.file_size)
+
+def submit_background_jobs(md5, filename, size):
+    # 上传提交后：可压缩文件加入后台压缩队列，图片预先生成缩略图
+    if compression_settings.applies_to(filename, size):
+        compressor.submit(md5)
+    if thumbnailer.applies_to(filename, size):
+        thumbnailer.submit(md5)
+
 # 查看所有文件情况
 @app.route('/admin/files')
 @admin_required
 def admin_files():
-    page = request.args.get('page', 1, type=int)
     per_page = app.config['DEFALUT_ITEM_EVERY_PAGE']  # 每页显示20条记录
     
-    # 获取所有文件记录并按上传时间降序排列
-    files = FileRecord.query.order_by(FileRecord.created_at.desc()).paginate(page=page, per_page=per_page)
+    # 获取文件记录并按上传时间降序排列（键集分页）
+    files = paginate_files(FileRecord.query, per_page,
+                           after=request.args.get('after'), before=request.args.get('before'))
+    variants = stored_variants({file.md5_filename for file in files.items})  # 压缩版本（一条查询）
+    previews = {file.id for file in files.items if thumbnailer.applies_to(file.original_filename, file.file_size)}
     
-    return render_template('admin_files.html', files=files,
+    return render_template('admin_files.html', files=files, variants=variants, previews=previews,
                            session_timeout=app.config['ADMIN_SESSION_TIMEOUT'],
                          warning_time=app.config['ADMIN_SESSION_WARNING_TIME'])
 
+@app.route('/admin/file/<int:file_id>/thumbnail')
+@limiter.exempt  # 文件列表每页同时加载多张缩略图
+@admin_required
+def admin_thumbnail(file_id):
+    file_record = db.session.get(FileRecord, file_id)
+    if file_record is None or not thumbnailer.applies_to(file_record.original_filename, file_record.file_size):
+        abort(404)
+    return send_thumbnail(file_record.md5_filename)
+
 
 @app.errorhandler(400)
 @app.errorhandler(401)
@@ -444,41 +930,128 @@ def handle_exception(error):
 
 @app.cli.command('cleanup')
 def cleanup():
-    # 清理过期文件记录
-    expired_records = FileRecord.query.filter(
-        FileRecord.expires_at < get_eastern8_time() 
-    ).all()
-    
-    for record in expired_records:
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], record.md5_filename)
-        if os.path.exists(filepath):
-            os.remove(filepath)
-        db.session.delete(record)
-    
-    # 清理30天前的下载记录
-    thirty_days_ago = get_eastern8_time() - timedelta(days=30)
-    old_downloads = DownloadRecord.query.filter(
-        DownloadRecord.download_time < thirty_days_ago
-    ).delete()
-    
-    db.session.commit()
-    print(f"清理了 {len(expired_records)} 个过期文件记录和 {old_downloads} 条旧下载记录")
+    # 立即执行一次清理（与定时清理相同：过期/已用完的分享、旧记录、未完成的分片上传，并且总是检查孤立文件）
+    result = cleanup_scheduler.run_once(orphans=True)
+    if result is None:
+        print("其他进程正在清理，本次跳过")
+        return
+    print("清理完成：" + format_result(result))
+    if result['stat_corrections']:
+        print(f"校正了 {result['stat_corrections']} 项统计数据")
+
+@app.cli.command('migrate-storage')
+def migrate_storage():
+    # 把上传目录中平铺存放的文件移入当前存储后端（分层目录或对象存储），可以重复运行
+    moved, size = migrate_flat_files(
+        app.config['UPLOAD_FOLDER'], storage,
+        on_moved=lambda name: print(f"已迁移 {name}"))
+    print(f"迁移完成：{moved} 个文件，{size} 字节")
+
+@app.cli.command('compress-files')
+def compress_files():
+    # 为尚未压缩的可压缩文件生成压缩版本（后台压缩队列的批量补充，可重复运行）
+    rows = db.session.query(FileRecord.md5_filename, FileRecord.original_filename, FileRecord.file_size).filter(
+        FileRecord.is_bundle == False).all()
+    candidates = {md5: size for md5, filename, size in rows if compression_settings.applies_to(filename, size)}
+    total = saved = 0
+    for md5, size in candidates.items():
+        for encoding, compressed, stored in compress_blob(storage, md5, compression_settings):
+            total += 1
+            if stored:
+                saved += size - compressed
+            print(f"{md5} {encoding}: {size} -> {compressed} 字节（{compressed / size:.0%}）{'' if stored else '，压缩效果不足，未保存'}")
+    print(f"处理完成：{len(candidates)} 个可压缩文件，生成 {total} 个压缩结果，已保存版本共节省 {saved} 字节")
+
+@app.cli.command('bulk-upload')
+@click.argument('paths', nargs=-1, required=True, type=click.Path(exists=True))
+@click.option('--expire-days', type=int, default=Config.DEFAULT_EXPIRE_DAYS, show_default=True, help='有效期（天）')
+@click.option('--max-downloads', type=int, default=1, show_default=True, help='最大下载次数（0表示无限制）')
+@click.option('--description', default='', help='文件描述')
+@click.option('--output', '-o', type=click.File('w', encoding='utf-8'), default='-', help='提取码对照表（CSV），默认输出到标准输出')
+@click.option('--recursive/--no-recursive', default=True, help='是否包含子目录中的文件')
+@click.option('--bundle', 'bundle', default=None, metavar='NAME',
+              help='全部文件发布为一个多文件分享（一个提取码，下载为 NAME.zip，保留目录结构）')
+def bulk_upload_command(paths, expire_days, max_downloads, description, output, recursive, bundle):
+    # 批量发布本地文件或整个目录：并行复制到存储，一个事务创建全部分享，输出提取码对照表
+    candidates = collect_paths(paths, recursive)
+    accepted = [(path, name) for path, name in candidates if is_allowed_file(path)]
+    skipped = [(path, '不允许上传此类型的文件') for path, name in candidates if not is_allowed_file(path)]
+    if not accepted:
+        raise SystemExit('没有可以上传的文件')
+
+    stored = store_local_files(accepted, storage, app.config['UPLOAD_BUFFER_SIZE'], app.config['BULK_UPLOAD_THREADS'])
+    options = dict(expires_at=get_eastern8_time() + timedelta(days=expire_days),
+                   max_downloads=max_downloads, description=description, uploader_ip=None)
+    if bundle is not None:
+        record = publish_bundle(stored, safe_filename(bundle), storage, app.config['CODE_LENGTH'], **options)
+        records = None if record is None else [record]
+    else:
+        records = publish_files(stored, app.config['CODE_LENGTH'], **options)
+    if records is None:
+        raise SystemExit('无法生成唯一提取码，请重试')
+    ensure_local_files(accepted, stored, storage, app.config['UPLOAD_BUFFER_SIZE'])
+    write_csv(output, records, skipped)
+    # 命令结束时后台线程随进程退出，压缩版本在第一次下载时生成，或运行 flask compress-files
+    published = f"打包发布 {len(stored)} 个文件" if bundle is not None else f"已发布 {len(records)} 个文件"
+    click.echo(f"{published}，跳过 {len(skipped)} 个", err=True)
+
+@app.cli.command('check-query-plans')
+def check_query_plans_command():
+    # 检查热点查询是否命中索引（SQLite），有未命中的查询时以非零状态退出
+    if db.engine.dialect.name != 'sqlite':
+        print("执行计划检查仅支持 SQLite")
+        return
+    failed = 0
+    for name, ok, plan in check_query_plans():
+        failed += not ok
+        print(f"[{'OK' if ok else 'FAIL'}] {name}: {'; '.join(plan)}")
+    if failed:
+        raise SystemExit(f"{failed} 个查询未命中索引")
+
+@app.cli.command('rebuild-search-index')
+def rebuild_search():
+    # 重建后台搜索的全文索引
+    count = rebuild_search_index()
+    if count is None:
+        print("当前数据库不支持 FTS5，搜索将使用 LIKE 查询")
+    else:
+        print(f"已重建 {count} 个文件的搜索索引")
+
+@app.cli.command('rebuild-blobs')
+def rebuild_blobs():
+    # 根据文件记录重建文件引用计数
+    count = rebuild_blob_refs()
+    reconcile_stats(app.config['STATS_RECONCILE_HOURS'])  # 存储占用统计随引用计数一起校正
+    print(f"已重建 {count} 个文件的引用计数")
+
+@app.cli.command('reconcile-stats')
+def reconcile_stats_command():
+    # 按真实数据校对后台统计计数器和最近的小时汇总
+    download_log.flush()
+    corrections = reconcile_stats(app.config['STATS_RECONCILE_HOURS'])
+    for name, (old, new) in corrections.items():
+        print(f"{name}: {old} -> {new}")
+    print(f"校正了 {len(corrections)} 项统计数据")
 
 @app.route('/admin')
 @admin_required
 def admin_home():
-    # 统计信息
-    total_files = FileRecord.query.count()
-    active_files = FileRecord.query.filter(FileRecord.is_active == True).count()
-    total_downloads = db.session.query(db.func.sum(FileRecord.download_count)).scalar() or 0
+    # 统计信息（增量维护的计数器和按小时汇总，不扫描数据表）
+    counters, series = dashboard_stats(app.config['STATS_SERIES_HOURS'])
+    cache_stats = code_cache.stats()
     
     # 最近上传的文件
     recent_files = FileRecord.query.order_by(FileRecord.created_at.desc()).limit(5).all()
     
     return render_template('admin_home.html', 
-                         total_files=total_files,
-                         active_files=active_files,
-                         total_downloads=total_downloads,
+                         total_files=counters['total_files'],
+                         active_files=counters['active_files'],
+                         total_downloads=counters['total_downloads'],
+                         stored_bytes=counters['stored_bytes'],
+                         saved_bytes=counters['saved_bytes'],
+                         series=series,
+                         last_cleanup=cleanup_scheduler.last_run,
+                         cache_stats=cache_stats,
                          recent_files=recent_files,                         
                            session_timeout=app.config['ADMIN_SESSION_TIMEOUT'],
                          warning_time=app.config['ADMIN_SESSION_WARNING_TIME'])
@@ -486,22 +1059,25 @@ def admin_home():
 @app.route('/admin/search')
 @admin_required
 def admin_search():
-    query = request.args.get('q', '')
-    page = request.args.get('page', 1, type=int)
-    per_page = 20
+    query = request.args.get('q', '').strip()
+    per_page = app.config['DEFALUT_ITEM_EVERY_PAGE']
+    after, before = request.args.get('after'), request.args.get('before')
     
     if query:
-        # 搜索文件名、提取码或描述
-        search = f"%{query}%"
-        files = FileRecord.query.filter(
-            (FileRecord.original_filename.like(search)) |
-            (FileRecord.code.like(search)) |
-            (FileRecord.description.like(search))
-        ).order_by(FileRecord.created_at.desc()).paginate(page=page, per_page=per_page)
+        # 搜索文件名、提取码或描述（全文索引，按相关度排序）
+        files = search_files(query, per_page, after=after, before=before)
     else:
-        files = FileRecord.query.order_by(FileRecord.created_at.desc()).paginate(page=page, per_page=per_page)
+        files = paginate_files(FileRecord.query, per_page, after=after, before=before)
     
-    return render_template('admin_records.html', files=files, query=query,                         
+    return render_records(files, query, 'admin_search')
+
+def render_records(files, query, endpoint):
+    """渲染文件记录页：每个文件最近的下载记录批量加载"""
+    download_limit = app.config['ADMIN_DOWNLOADS_PER_FILE']
+    downloads = recent_downloads([file.id for file in files.items], download_limit)
+
+    return render_template('admin_records.html', files=files, query=query, endpoint=endpoint,
+                           downloads=downloads, download_limit=download_limit,
                            session_timeout=app.config['ADMIN_SESSION_TIMEOUT'],
                          warning_time=app.config['ADMIN_SESSION_WARNING_TIME'])
 
@@ -511,14 +1087,16 @@ def delete_file(file_id):
     file_record = FileRecord.query.get_or_404(file_id)
     
     try:
-        # 删除物理文件
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], file_record.md5_filename)
-        if os.path.exists(filepath):
-            os.remove(filepath)
-        
-        # 删除数据库记录
+        # 删除数据库记录并释放文件引用
+        released = release_share(file_record)
+        record_removal(file_record)
         db.session.delete(file_record)
         db.session.commit()
+        code_cache.invalidate(file_record.code)
+
+        # 最后一个引用消失后才删除物理文件
+        for md5 in released:
+            remove_unreferenced_file(storage, md5)
         
         flash('文件删除成功', 'success')
     except Exception as e:
@@ -533,7 +1111,9 @@ def delete_file(file_id):
 def toggle_file(file_id):
     file_record = FileRecord.query.get_or_404(file_id)
     file_record.is_active = not file_record.is_active
+    record_toggle(file_record)
     db.session.commit()
+    code_cache.invalidate(file_record.code)
     
     action = "激活" if file_record.is_active else "禁用"
     flash(f'文件已{action}', 'success')
@@ -542,13 +1122,56 @@ def toggle_file(file_id):
 @app.route('/admin/records')
 @admin_required
 def view_records():
-    # 获取文件记录和关联的下载记录
-    files = FileRecord.query.order_by(FileRecord.created_at.desc()).all()
-    
-    return render_template('admin_records.html', files=files,                         
+    # 获取文件记录和关联的下载记录（分页）
+    files = paginate_files(FileRecord.query, app.config['DEFALUT_ITEM_EVERY_PAGE'],
+                           after=request.args.get('after'), before=request.args.get('before'))
+    return render_records(files, '', 'view_records')
+
+@app.route('/admin/file/<int:file_id>/downloads')
+@admin_required
+def file_downloads(file_id):
+    # 单个文件的全部下载记录（键集分页）
+    file_record = db.get_or_404(FileRecord, file_id)
+    downloads = paginate_downloads(file_id, app.config['DEFALUT_ITEM_EVERY_PAGE'],
+                                   after=request.args.get('after'), before=request.args.get('before'))
+
+    return render_template('admin_downloads.html', file=file_record, downloads=downloads,
                            session_timeout=app.config['ADMIN_SESSION_TIMEOUT'],
                          warning_time=app.config['ADMIN_SESSION_WARNING_TIME'])
 
+@app.route('/admin/metrics')
+@limiter.exempt
+def admin_metrics():
+    # Prometheus 抓取：管理员会话或 Authorization: Bearer <METRICS_TOKEN>
+    token = app.config['METRICS_TOKEN']
+    authorization = request.headers.get('Authorization', '')
+    authorized = bool(token) and hmac.compare_digest(authorization.encode(), f'Bearer {token}'.encode())
+    if not authorized and not session.get('admin_logged_in'):
+        abort(401 if token else 403)
+    if not metrics.enabled:
+        abort(404)
+    return metrics.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+def create_app():
+    """WSGI 入口：返回已初始化的应用，供 gunicorn "app:create_app()" 等外部服务器使用
+
+    模块导入时即按环境变量完成初始化，这里不再重复。外部服务器的多个 worker 进程各自导入
+    应用，需要通过环境变量 SECRET_KEY 设置相同的会话密钥；python app.py --serve 在主进程中
+    初始化后 fork，不需要额外设置。
+    """
+    return app
+
+def reset_after_fork():
+    # 丢弃从主进程继承的数据库连接（不关闭，连接仍属于主进程），worker 使用自己的连接池
+    with app.app_context():
+        db.engine.dispose(close=False)
+
+def close_worker():
+    # worker 退出前写入剩余的下载记录和最后的指标，丢弃尚未生成的缩略图
+    download_log.close()
+    metrics.sync()
+    thumbnailer.close()
+
 def is_allowed_file(filename, allowed_extensions=None):
     """检查文件扩展名是否在允许列表中"""
     if allowed_extensions is None:
@@ -584,4 +1207,31 @@ if __name__ == '__main__':
             os.makedirs(upload_folder, exist_ok=True)
             print(f"已重新创建上传文件夹: {upload_folder}")
 
-    app.run(host=args.host, port=args.port, debug=False)
\ No newline at end of file
+    if args.serve:
+        # gunicorn 自行处理 SIGTERM（等待处理中的请求）和 SIGHUP（平滑重启 worker）
+        settings = ServerSettings(app.config, args.host, args.port,
+                                  workers=args.workers, threads=args.threads, keepalive=args.keepalive)
+        print(f"生产服务器启动：{settings.bind}，{settings.workers} 个进程 x {settings.threads} 个线程")
+        metrics.reset_shared_dir()
+        serve(app, settings, post_fork=reset_after_fork, worker_exit=close_worker)
+        sys.exit(0)
+
+    if args.async_downloads:
+        # aiohttp 自行处理 SIGTERM：停止接受新连接后退出，atexit 写入剩余的下载记录
+        download_server = AsyncDownloadServer(
+            app, authorize_download, limiter, storage,
+            chunk_size=app.config['ASYNC_DOWNLOAD_CHUNK_SIZE'],
+            db_threads=app.config['ASYNC_DOWNLOAD_DB_THREADS'],
+            io_threads=app.config['ASYNC_DOWNLOAD_IO_THREADS']
+        )
+        print(f"异步下载服务启动：{args.host}:{args.port}")
+        download_server.run(args.host, args.port)
+        sys.exit(0)
+
+    # docker stop 发送 SIGTERM，转为正常退出，以便 atexit 写入队列中剩余的下载记录
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    if args.cleanup_worker:
+        print(f"清理进程已启动，每 {app.config['CLEANUP_INTERVAL']} 秒清理一次")
+        cleanup_scheduler.run_forever()
+    else:
+        app.run(host=args.host, port=args.port, debug=False)
\ No newline at end of file
@@ -0,0 +1,164 @@
+"""异步下载服务（aiohttp）
+
+同步服务器中每个进行中的下载都占用一个 worker 线程直到传输结束，慢速客户端（移动网络）会
+长时间占满 worker。python app.py --async-downloads 在单独的进程中只处理 /download/<code>：
+
+- 校验和计数与 download_file 相同（authorize_download），在有界线程池中执行，不阻塞事件循环
+- 文件通过存储后端按块在线程池中读取（本地目录或对象存储），写入时等待套接字缓冲区排空
+  （背压），慢速客户端只占用一个协程和一块缓冲区，成千上万个并发下载不需要同样多的线程
+- 支持 Range / If-Range（ETag 为文件MD5），续传规则与 Flask 路由一致；可压缩文件同样按
+  Accept-Encoding 发送压缩版本，多文件分享同样即时生成 ZIP（bundle.BundleArchive）
+- 下载速率限制（RATE_LIMIT_DOWNLOAD）使用 flask_limiter 的同一存储，续传请求不计入
+
+需要 aiohttp（pip install aiohttp）。文件体由 nginx 通过 X-Accel-Redirect 发送时下载本来就不占用
+worker，不需要这个服务。
+"""
+import asyncio
+import mimetypes
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from urllib.parse import quote
+
+from limits import parse_many
+from werkzeug.http import dump_options_header, parse_accept_header, parse_if_range_header, parse_range_header
+
+from download_session import DownloadVerdict, resolve_range
+
+try:
+    from aiohttp import web
+except ImportError:
+    web = None
+
+MESSAGES = {
+    404: '文件不存在或提取码已失效',
+    416: '请求的范围无效',
+    429: '下载过于频繁，请稍后再试',
+}
+
+
+class AsyncDownloadServer:
+    def __init__(self, app, authorize, limiter, storage, chunk_size, db_threads, io_threads):
+        self.app = app
+        self.authorize = authorize  # authorize_download(code, ip, byte_range, if_range_etag, user_agent, accept_encodings)
+        self.limiter = limiter
+        self.limits = parse_many(app.config['RATE_LIMIT_DOWNLOAD'])
+        self.storage = storage
+        self.chunk_size = chunk_size
+        self._db_pool = ThreadPoolExecutor(db_threads, thread_name_prefix='download-db')
+        self._io_pool = ThreadPoolExecutor(io_threads, thread_name_prefix='download-io')
+        self.active = 0  # 正在传输的下载数
+
+    def make_app(self):
+        if web is None:
+            raise SystemExit("异步下载服务需要 aiohttp：pip install aiohttp")
+        application = web.Application()
+        application.router.add_get('/download/{code}', self.handle, allow_head=False)
+        application.on_shutdown.append(self._shutdown)
+        return application
+
+    def run(self, host, port):
+        web.run_app(self.make_app(), host=host, port=port, print=None)
+
+    async def handle(self, request):
+        loop = asyncio.get_running_loop()
+        byte_range = parse_range_header(request.headers.get('Range'))
+        if_range_etag = parse_if_range_header(request.headers.get('If-Range')).etag
+        accept_encodings = parse_accept_header(request.headers.get('Accept-Encoding'))
+        verdict = await loop.run_in_executor(
+            self._db_pool, self._authorize, request.match_info['code'], client_ip(request),
+            byte_range, if_range_etag, request.headers.get('User-Agent'), accept_encodings)
+        if verdict.error:
+            return web.Response(status=verdict.error, text=MESSAGES[verdict.error])
+
+        file_record, variant, archive = verdict.file_record, verdict.variant, verdict.archive
+        name = variant.name if variant else file_record.md5_filename
+        etag = variant.etag if variant else file_record.md5_filename
+        if archive is not None:
+            size, open_body = archive.size, archive.open
+        else:
+            open_body = partial(self.storage.open, name)
+            try:
+                size = await loop.run_in_executor(self._io_pool, self.storage.size, name)
+            except FileNotFoundError:
+                return web.Response(status=404, text=MESSAGES[404])
+
+        response = web.StreamResponse(headers={
+            'Content-Type': mimetypes.guess_type(file_record.original_filename)[0] or 'application/octet-stream',
+            'Content-Disposition': content_disposition(file_record.original_filename),
+            'ETag': f'"{etag}"',
+            'Accept-Ranges': 'bytes',
+        })
+        if variant is not None:
+            response.headers['Content-Encoding'] = variant.encoding
+            response.headers['Vary'] = 'Accept-Encoding'
+        span = resolve_range(byte_range, if_range_etag, etag, size)
+        if span is None:
+            response.set_status(416)
+            response.headers['Content-Range'] = f'bytes */{size}'
+            response.content_length = 0
+            await response.prepare(request)
+            return response
+        start, stop, is_partial = span
+        if is_partial:
+            response.set_status(206)
+            response.headers['Content-Range'] = f'bytes {start}-{stop - 1}/{size}'
+        response.content_length = stop - start
+
+        try:
+            handle = await loop.run_in_executor(self._io_pool, open_body, start)
+        except FileNotFoundError:
+            return web.Response(status=404, text=MESSAGES[404])
+        try:
+            await response.prepare(request)
+            self.active += 1
+            try:
+                await self._send(loop, handle, response, stop - start)
+            finally:
+                self.active -= 1
+            await response.write_eof()
+            return response
+        finally:
+            handle.close()
+
+    async def _send(self, loop, handle, response, remaining):
+        while remaining > 0:
+            data = await loop.run_in_executor(self._io_pool, handle.read, min(self.chunk_size, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            await response.write(data)  # 发送缓冲区满时在这里等待客户端读取
+
+    def _authorize(self, code, ip, byte_range, if_range_etag, user_agent, accept_encodings):
+        with self.app.app_context():
+            if self.limiter.enabled and not all(
+                    self.limiter.limiter.test(item, 'async_download', ip) for item in self.limits):
+                return DownloadVerdict(None, False, 429)
+            verdict = self.authorize(code, ip, byte_range, if_range_etag, user_agent, accept_encodings)
+            if self.limiter.enabled and verdict.error is None and not verdict.continuation:
+                for item in self.limits:
+                    self.limiter.limiter.hit(item, 'async_download', ip)
+            return verdict
+
+    async def _shutdown(self, application):
+        self._db_pool.shutdown(wait=False)
+        self._io_pool.shutdown(wait=False)
+
+
+def client_ip(request):
+    """客户端IP：与 ProxyFix(x_for=1) 相同，取 X-Forwarded-For 的最后一个地址"""
+    forwarded = request.headers.get('X-Forwarded-For')
+    if forwarded:
+        return forwarded.split(',')[-1].strip()
+    return request.remote
+
+
+def content_disposition(filename):
+    """与 Flask send_file 相同的 Content-Disposition（非 ASCII 文件名使用 filename*）"""
+    try:
+        filename.encode('ascii')
+        return dump_options_header('attachment', {'filename': filename})
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', filename).encode('ascii', 'ignore').decode('ascii')
+        quoted = quote(filename, safe="!#$&+^`|~")
+        return dump_options_header('attachment', {'filename': simple, 'filename*': f"UTF-8''{quoted}"})
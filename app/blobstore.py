@@ -0,0 +1,103 @@
+"""引用计数的文件实体存储
+
+存储后端中的物理文件以 MD5 命名，内容相同的上传共用同一个文件。Blob 表记录每个文件被
+多少个 FileRecord（多文件分享为其中的每个 ShareItem）引用：新增记录时引用数加一，删除或过期清理时减一，只有最后一个引用
+消失时才删除物理文件（连同它的压缩版本）。
+
+上传时同内容文件已存在则不再写入，但在引用提交之前，最后一个引用可能被并发删除释放、物理文件
+随之删除。因此跳过写入的上传保留临时文件到引用提交之后，再确认一次文件是否存在。
+"""
+from sqlalchemy import func
+
+from models import db, Blob, BlobVariant, FileRecord, ShareItem
+from compression import variant_names
+from stats import bump
+
+
+def acquire_blob(md5, size, refs=1):
+    """为新的 FileRecord 增加文件引用（需调用方提交事务），返回是否为首次出现的文件
+
+    refs 为同一事务中引用该文件的新记录数（批量上传中内容相同的文件）。
+    """
+    updated = Blob.query.filter_by(md5=md5).update(
+        {Blob.ref_count: Blob.ref_count + refs}, synchronize_session=False)
+    if updated:
+        bump(saved_bytes=size * refs)
+        return False
+    db.session.add(Blob(md5=md5, size=size, ref_count=refs))
+    bump(stored_bytes=size, saved_bytes=size * (refs - 1))
+    return True
+
+
+def release_blob(md5):
+    """减少文件引用（需调用方提交事务），返回引用是否已全部释放"""
+    Blob.query.filter_by(md5=md5).update(
+        {Blob.ref_count: Blob.ref_count - 1}, synchronize_session=False)
+    blob = db.session.get(Blob, md5, populate_existing=True)
+    if blob is None or blob.ref_count <= 0:
+        if blob is not None:
+            bump(stored_bytes=-(blob.size or 0))
+            db.session.delete(blob)
+        BlobVariant.query.filter_by(md5=md5).delete(synchronize_session=False)
+        return True
+    bump(saved_bytes=-(blob.size or 0))
+    return False
+
+
+def release_share(file_record):
+    """删除分享前释放它引用的全部文件（需调用方提交事务），返回引用已全部释放的文件MD5列表"""
+    if file_record.is_bundle:
+        md5s = [item.md5 for item in file_record.items]
+    else:
+        md5s = [file_record.md5_filename]
+    return [md5 for md5 in md5s if release_blob(md5)]
+
+
+def remove_unreferenced_file(storage, md5):
+    """事务提交后调用：确认文件没有被重新引用后从存储中删除物理文件及其压缩版本，返回释放的字节数
+
+    确认和删除在同一个写事务中进行：并发上传的 acquire_blob 要么在确认之前提交（文件保留），
+    要么等删除完成后才能提交；后一种情况由上传方在提交后确认文件仍然存在，不存在时重新写入
+    （ingest.ensure_stored）。
+    """
+    # 不改变数据的 UPDATE：SQLite 在第一条写语句时获取写锁，直到事务结束
+    Blob.query.filter_by(md5=md5).update({Blob.ref_count: Blob.ref_count}, synchronize_session=False)
+    try:
+        if db.session.get(Blob, md5, populate_existing=True) is not None:
+            return 0
+        return sum(storage.delete(name) for name in [md5] + variant_names(md5))
+    finally:
+        db.session.commit()
+
+
+def rebuild_blob_refs():
+    """根据 FileRecord 和 ShareItem 重新计算全部引用计数（用于已有数据库的首次迁移和数据修复）"""
+    rows = db.session.query(
+        FileRecord.md5_filename,
+        func.count(FileRecord.id),
+        func.max(FileRecord.file_size)
+    ).filter(FileRecord.is_bundle == False).group_by(FileRecord.md5_filename).all()
+    rows += db.session.query(
+        ShareItem.md5,
+        func.count(ShareItem.id),
+        func.max(ShareItem.size)
+    ).group_by(ShareItem.md5).all()
+    refs = {}
+    for md5, ref_count, size in rows:
+        count, _ = refs.get(md5, (0, None))
+        refs[md5] = (count + ref_count, size)
+    crcs = dict(db.session.query(Blob.md5, Blob.crc32).filter(Blob.crc32 != None).all())  # 重建后保留已计算的 CRC32
+
+    Blob.query.delete()
+    for md5, (ref_count, size) in refs.items():
+        db.session.add(Blob(md5=md5, size=size, ref_count=ref_count, crc32=crcs.get(md5)))
+    db.session.commit()
+    return len(refs)
+
+
+def ensure_blob_refs():
+    """Blob 表为空但已有文件记录时（旧版本数据库）补建引用计数"""
+    if Blob.query.first() is None and FileRecord.query.first() is not None:
+        rebuild_blob_refs()
+
+
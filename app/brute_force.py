@@ -0,0 +1,189 @@
+"""提取码爆破防护的尝试记录
+
+规则与原来的 check_brute_force 相同：同一IP在 window 秒内的尝试次数超过 max_attempts 次时
+封锁 block_time 秒，封锁期间的请求直接拒绝、不计入尝试次数。
+
+- ``memory``（默认）：进程内记录。每个IP只保存最近 max_attempts + 1 次尝试时间的定长环形
+  缓冲区，按最近访问顺序（LRU）淘汰，超过 max_ips 个IP时淘汰最久未访问的，空闲到既不在窗口
+  内也不在封锁期的记录会被顺带清除，因此内存占用有固定上限
+- ``database``：记录保存在数据库 brute_force_state 表中，多个 worker 共享同一份计数；
+  已知处于封锁期的IP在本进程内缓存，封锁期间不再查询数据库。过期的行由定时清理删除
+"""
+import threading
+import time
+from array import array
+from collections import OrderedDict, namedtuple
+
+from sqlalchemy.exc import IntegrityError
+
+from models import db, BruteForceState
+
+# allowed: 是否放行；remaining: 仍需等待的秒数；just_blocked: 是否由本次尝试触发封锁
+Verdict = namedtuple('Verdict', ['allowed', 'remaining', 'just_blocked'])
+
+ALLOWED = Verdict(True, 0, False)
+
+
+class _IpState:
+    __slots__ = ('ring', 'pos', 'blocked_until', 'last_seen')
+
+    def __init__(self, size):
+        self.ring = array('d', bytes(8 * size))  # 最近 size 次尝试时间，0 表示空位
+        self.pos = 0  # 下一次写入的位置，也就是最早一次尝试所在的位置
+        self.blocked_until = 0.0
+        self.last_seen = 0.0
+
+
+class MemoryBruteForceTracker:
+    """进程内的有界尝试记录（线程安全）"""
+
+    def __init__(self, max_attempts, window, block_time, max_ips):
+        self.size = max_attempts + 1
+        self.window = window
+        self.block_time = block_time
+        self.max_ips = max_ips
+        self._states = OrderedDict()  # ip -> _IpState，按最近访问排序
+        self._lock = threading.Lock()
+        self.evicted = 0
+
+    def hit(self, ip, now=None):
+        """记录一次尝试并返回 Verdict"""
+        now = time.time() if now is None else now
+        with self._lock:
+            state = self._states.get(ip)
+            if state is None:
+                state = self._states[ip] = _IpState(self.size)
+                state.last_seen = now
+                self._evict(now)
+            else:
+                self._states.move_to_end(ip)
+                state.last_seen = now
+
+            if state.blocked_until > now:
+                return Verdict(False, int(state.blocked_until - now), False)
+
+            state.ring[state.pos] = now
+            state.pos = (state.pos + 1) % self.size
+            # 环形缓冲区中最早的一次也在窗口内，说明窗口内已有 max_attempts + 1 次尝试
+            if state.ring[state.pos] > now - self.window:
+                state.blocked_until = now + self.block_time
+                return Verdict(False, self.block_time, True)
+            return ALLOWED
+
+    def __len__(self):
+        return len(self._states)
+
+    def _evict(self, now):
+        # 先清除队首已经失效的记录，再按容量淘汰最久未访问的
+        while self._states:
+            ip, state = next(iter(self._states.items()))
+            if state.last_seen > now - self.window or state.blocked_until > now:
+                break
+            del self._states[ip]
+        while len(self._states) > self.max_ips:
+            self._states.popitem(last=False)
+            self.evicted += 1
+
+
+class DatabaseBruteForceTracker:
+    """数据库中的共享尝试记录，本进程缓存已知的封锁状态"""
+
+    def __init__(self, max_attempts, window, block_time, max_ips, retries=3):
+        self.size = max_attempts + 1
+        self.window = window
+        self.block_time = block_time
+        self.retries = retries
+        self._blocked = MemoryBlockCache(max_ips)
+
+    def hit(self, ip, now=None):
+        now = time.time() if now is None else now
+        blocked_until = self._blocked.get(ip, now)
+        if blocked_until:
+            return Verdict(False, int(blocked_until - now), False)
+
+        # 乐观并发：按版本号更新，被其他 worker 抢先更新时重新读取
+        for _ in range(self.retries):
+            try:
+                verdict = self._hit_once(ip, now)
+            except IntegrityError:
+                db.session.rollback()
+                continue
+            if verdict is not None:
+                return verdict
+        return ALLOWED
+
+    def _hit_once(self, ip, now):
+        state = db.session.get(BruteForceState, ip, populate_existing=True)
+        if state is not None and state.blocked_until > now:
+            db.session.rollback()
+            self._blocked.set(ip, state.blocked_until)
+            return Verdict(False, int(state.blocked_until - now), False)
+
+        attempts = [t for t in _unpack(state.attempts if state else '') if t > now - self.window]
+        attempts = (attempts + [now])[-self.size:]
+        just_blocked = len(attempts) >= self.size
+        blocked_until = now + self.block_time if just_blocked else 0.0
+        values = {
+            'attempts': _pack(attempts),
+            'blocked_until': blocked_until,
+            'expires_at': max(now + self.window, blocked_until),
+        }
+
+        if state is None:
+            db.session.add(BruteForceState(ip=ip, version=1, **values))
+        else:
+            updated = BruteForceState.query.filter_by(ip=ip, version=state.version).update(
+                dict(values, version=state.version + 1), synchronize_session=False)
+            if not updated:
+                db.session.rollback()
+                return None
+        db.session.commit()
+
+        if just_blocked:
+            self._blocked.set(ip, blocked_until)
+            return Verdict(False, self.block_time, True)
+        return ALLOWED
+
+    def __len__(self):
+        return BruteForceState.query.count()
+
+
+class MemoryBlockCache:
+    """有界的 ip -> 封锁截止时间 缓存"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, ip, now):
+        with self._lock:
+            blocked_until = self._entries.get(ip)
+            if blocked_until is None:
+                return None
+            if blocked_until <= now:
+                del self._entries[ip]
+                return None
+            return blocked_until
+
+    def set(self, ip, blocked_until):
+        with self._lock:
+            self._entries[ip] = blocked_until
+            self._entries.move_to_end(ip)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+def _pack(attempts):
+    return ','.join(f'{t:.3f}' for t in attempts)
+
+
+def _unpack(text):
+    return [float(t) for t in text.split(',') if t]
+
+
+def create_brute_force_tracker(storage, max_attempts, window, block_time, max_ips):
+    """根据配置创建尝试记录后端"""
+    if storage == 'database':
+        return DatabaseBruteForceTracker(max_attempts, window, block_time, max_ips)
+    return MemoryBruteForceTracker(max_attempts, window, block_time, max_ips)
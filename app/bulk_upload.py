@@ -0,0 +1,203 @@
+"""批量上传：一次发布多个文件（POST /admin/bulk-upload 和 flask bulk-upload）
+
+- 文件的哈希和写入存储在线程池中并行进行。网页上传的各文件在解析请求体时已边写边哈希到临时
+  文件，线程池只负责去重检查和移入存储（对象存储时即上传）；命令行从本地目录读取，线程池同时
+  复制和哈希多个文件
+- 提取码一次批量生成（share_codes.generate_codes，每轮一条 IN 查询）
+- 全部文件记录、文件引用计数和统计在同一个事务中写入；提交失败时整批回滚（已写入存储的文件
+  没有记录引用，由定时清理的孤立文件检查删除），提取码被并发占用时重新生成后重试
+- 结果为提取码与文件名的对照表（CSV）；选择打包时全部文件发布为一个多文件分享（一个提取码，
+  下载时即时生成 ZIP，见 bundle.py），目录结构保留在 ZIP 中
+"""
+import csv
+import os
+import shutil
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy.exc import IntegrityError
+
+from models import db, eastern8_now, FileRecord, ShareItem
+from ingest import HashingFileStream, ensure_stored, store_upload
+from blobstore import acquire_blob
+from stats import record_uploads
+from share_codes import generate_codes
+from bundle import BundleArchive, BundleEntry, archive_name, blob_crc32s, bundle_etag, save_crc32s, unique_names
+
+# 已写入存储、等待发布的文件（filename 可以带有以 / 分隔的相对路径）
+StoredFile = namedtuple('StoredFile', ['filename', 'md5', 'size'])
+
+CSV_HEADER = ['code', 'filename', 'size', 'expires_at', 'error']
+
+
+def display_name(filename):
+    """浏览器上传整个目录时文件名带有相对路径，只保留文件名"""
+    return filename.replace('\\', '/').rsplit('/', 1)[-1]
+
+
+def collect_paths(paths, recursive=True):
+    """展开命令行参数中的目录，返回 [(文件路径, 相对路径)]（目录内按路径排序，跳过隐藏文件和目录）
+
+    相对路径从参数中的目录名开始（release/docs/a.pdf），打包时作为 ZIP 中的路径。
+    """
+    result = []
+    for path in paths:
+        if not os.path.isdir(path):
+            result.append((path, os.path.basename(path)))
+            continue
+        base = os.path.dirname(os.path.abspath(path))
+        for root, dirs, files in os.walk(path):
+            dirs[:] = sorted(d for d in dirs if not d.startswith('.')) if recursive else []
+            for name in sorted(files):
+                if not name.startswith('.'):
+                    full_path = os.path.join(root, name)
+                    result.append((full_path, os.path.relpath(os.path.abspath(full_path), base).replace(os.sep, '/')))
+    return result
+
+
+def store_uploaded_files(file_storages, storage, threads):
+    """把请求中的上传文件并行移入存储，返回 [StoredFile]（与输入顺序相同）"""
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(lambda file_storage: store_upload(file_storage, storage), file_storages))
+    return [StoredFile(file_storage.filename, md5, size)
+            for file_storage, (md5, size) in zip(file_storages, results)]
+
+
+def ensure_uploaded_files(file_storages, files, storage):
+    """发布提交后确认请求中上传的文件仍在存储中（见 ingest.ensure_stored）"""
+    for file_storage, file in zip(file_storages, files):
+        ensure_stored(file_storage, storage, file.md5)
+
+
+def store_local_files(files, storage, buffer_size, threads):
+    """把本地文件 [(文件路径, 相对路径)] 并行复制到存储（边复制边哈希，同内容已存在时不再写入），返回 [StoredFile]"""
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        return list(pool.map(lambda file: _copy_local_file(file, storage, buffer_size), files))
+
+
+def ensure_local_files(files, stored, storage, buffer_size):
+    """发布提交后确认文件仍在存储中：去重时跳过写入的文件已被并发删除时从本地文件重新复制"""
+    for file, stored_file in zip(files, stored):
+        if not storage.exists(stored_file.md5):
+            copied = _copy_local_file(file, storage, buffer_size)
+            if copied.md5 != stored_file.md5:
+                raise IOError(f'{file[0]} 在上传过程中被修改')
+
+
+def _copy_local_file(file, storage, buffer_size):
+    path, name = file
+    stream = HashingFileStream(storage.temp_dir, buffer_size)
+    try:
+        with open(path, 'rb') as source:
+            shutil.copyfileobj(source, stream, buffer_size)
+        md5 = stream.hexdigest()
+        if not storage.exists(md5):
+            stream.commit(storage, md5)
+        return StoredFile(name, md5, stream.size)
+    finally:
+        stream.close()  # 未提交（内容已存在或出错）时删除临时文件
+
+
+def acquire_files(files):
+    """增加文件引用（需调用方提交事务），同一批中内容相同的文件合并为一次引用计数更新"""
+    sizes = {file.md5: file.size for file in files}
+    for md5, count in Counter(file.md5 for file in files).items():
+        acquire_blob(md5, sizes[md5], count)
+
+
+def publish_files(files, code_length, expires_at, max_downloads, description, uploader_ip, max_attempts=3):
+    """为已写入存储的文件各创建一个分享（一个事务），返回 [FileRecord]；无法生成足够的提取码时返回 None"""
+    for attempt in range(max_attempts):
+        codes = generate_codes(len(files), code_length)
+        if codes is None:
+            return None
+        now = eastern8_now()
+        records = [FileRecord(
+            code=code,
+            md5_filename=file.md5,
+            original_filename=display_name(file.filename),
+            file_size=file.size,
+            file_type=os.path.splitext(file.filename)[1].lower().lstrip('.'),
+            uploader_ip=uploader_ip,
+            created_at=now,
+            expires_at=expires_at,
+            max_downloads=max_downloads,
+            description=description
+        ) for code, file in zip(codes, files)]
+
+        acquire_files(files)
+        db.session.add_all(records)
+        record_uploads(records)
+        try:
+            db.session.commit()
+            return records
+        except IntegrityError:
+            # 提取码被并发的上传占用，或同一新文件被并发插入，重新生成后重试
+            db.session.rollback()
+            if attempt == max_attempts - 1:
+                raise
+
+
+def publish_bundle(files, name, storage, code_length, expires_at, max_downloads, description, uploader_ip,
+                   max_attempts=3):
+    """把已写入存储的文件发布为一个多文件分享（下载时打包为 name.zip），返回 FileRecord；无法生成提取码时返回 None
+
+    文件的 CRC32 在事务之外读取计算（已记录的直接使用），提交时一并保存。
+    """
+    names = unique_names([archive_name(file.filename) for file in files])
+    crcs = blob_crc32s(storage, [file.md5 for file in files])
+    for attempt in range(max_attempts):
+        codes = generate_codes(1, code_length)
+        if codes is None:
+            return None
+        now = eastern8_now()
+        entries = [BundleEntry(entry_name, file.md5, file.size, crcs[file.md5])
+                   for entry_name, file in zip(names, files)]
+        filename = f'{name}.zip'
+        record = FileRecord(
+            code=codes[0],
+            md5_filename=bundle_etag(entries, now),
+            original_filename=filename,
+            file_size=BundleArchive(storage, entries, now).size,
+            file_type='zip',
+            uploader_ip=uploader_ip,
+            created_at=now,
+            expires_at=expires_at,
+            max_downloads=max_downloads,
+            description=description,
+            is_bundle=True,
+            items=[ShareItem(position=position, md5=entry.md5, filename=entry.name, size=entry.size)
+                   for position, entry in enumerate(entries)]
+        )
+
+        acquire_files(files)
+        save_crc32s(crcs)
+        db.session.add(record)
+        record_uploads([record])
+        try:
+            db.session.commit()
+            return record
+        except IntegrityError:
+            db.session.rollback()
+            if attempt == max_attempts - 1:
+                raise
+
+
+def bundle_name(files, default='files'):
+    """打包文件名（不含 .zip）：所有文件位于同一个顶层目录时使用该目录名"""
+    names = [archive_name(file.filename) for file in files]
+    tops = {name.split('/', 1)[0] for name in names}
+    if len(tops) == 1 and all('/' in name for name in names):
+        return tops.pop()
+    return default
+
+
+def write_csv(out, records, skipped=()):
+    """写入提取码与文件名对照表；skipped 为未发布的 (文件名, 原因)"""
+    writer = csv.writer(out)
+    writer.writerow(CSV_HEADER)
+    for record in records:
+        writer.writerow([record.code, record.original_filename, record.file_size,
+                         record.expires_at.strftime('%Y-%m-%d %H:%M:%S'), ''])
+    for filename, reason in skipped:
+        writer.writerow(['', filename, '', '', reason])
@@ -0,0 +1,219 @@
+"""多文件分享（一个提取码对应多个文件，下载时即时打包为 ZIP）
+
+分享中的文件记录在 ShareItem 中，直接引用存储中已有的文件实体（引用计数见 blobstore），不复制
+数据，也不预先生成压缩包。下载时按 STORED（不压缩）方式拼出 ZIP：
+
+- 每个文件的 CRC32 在打包时计算一次并保存在 Blob.crc32 中，文件头不需要数据描述符，整个 ZIP
+  的字节只取决于文件列表和分享的创建时间，Content-Length 可以预先算出，ETag 为强校验
+- ZIP 由文件头、文件内容和中央目录依次组成，读取时只在内存中保留文件头，文件内容按块从存储
+  后端读取，内存占用与文件大小无关；可以从任意偏移开始读取，支持 Range 和断点续传
+- 超过 4GB 的文件或偏移使用 ZIP64 扩展
+"""
+import hashlib
+import os
+import struct
+import zlib
+from bisect import bisect_right
+from collections import namedtuple
+
+from sqlalchemy import select
+
+from models import db, safe_filename, Blob, ShareItem
+
+ZIP32_LIMIT = 0xFFFFFFFF
+ZIP16_LIMIT = 0xFFFF
+UTF8_FLAG = 0x800  # 文件名为 UTF-8 编码
+READ_SIZE = 1024 * 1024  # 计算 CRC32 时每次读取的大小
+QUERY_CHUNK = 500  # 每条 IN 查询的参数个数上限
+
+# ZIP 中的一个文件
+BundleEntry = namedtuple('BundleEntry', ['name', 'md5', 'size', 'crc32'])
+
+
+def archive_name(filename):
+    """ZIP 中的路径：统一为 / 分隔，去掉绝对路径、. 和 .. 以及各部分中的非法字符"""
+    parts = [part for part in filename.replace('\\', '/').split('/') if part not in ('', '.', '..')]
+    return '/'.join(safe_filename(part) for part in parts) or 'file'
+
+
+def unique_names(names):
+    """同名文件追加序号（不区分大小写，Windows 解压时不会互相覆盖）"""
+    seen = set()
+    result = []
+    for name in names:
+        stem, ext = os.path.splitext(name)
+        candidate, number = name, 2
+        while candidate.lower() in seen:
+            candidate = f'{stem} ({number}){ext}'
+            number += 1
+        seen.add(candidate.lower())
+        result.append(candidate)
+    return result
+
+
+def bundle_etag(entries, moment):
+    """多文件分享的 ETag（保存在 md5_filename 中）：由文件列表和创建时间决定，与生成的 ZIP 字节一一对应"""
+    md5 = hashlib.md5(moment.isoformat().encode())
+    for entry in entries:
+        md5.update(f'\0{entry.name}\0{entry.md5}'.encode())
+    return md5.hexdigest()
+
+
+def dos_datetime(moment):
+    """ZIP 文件头中的 (日期, 时间)（DOS 格式，精度2秒，最早1980年）"""
+    if moment.year < 1980:
+        return (1 << 5) | 1, 0
+    date = ((moment.year - 1980) << 9) | (moment.month << 5) | moment.day
+    time = (moment.hour << 11) | (moment.minute << 5) | (moment.second // 2)
+    return date, time
+
+
+def zip_layout(entries, moment):
+    """ZIP 的组成部分列表：bytes 为文件头或中央目录，(md5, size) 为文件内容"""
+    date, time = dos_datetime(moment)
+    segments = []
+    directory = []
+    offset = 0
+    for entry in entries:
+        name = entry.name.encode('utf-8')
+        large = entry.size >= ZIP32_LIMIT
+        version = 45 if large or offset >= ZIP32_LIMIT else 20
+        size32 = ZIP32_LIMIT if large else entry.size
+
+        extra = struct.pack('<HHQQ', 1, 16, entry.size, entry.size) if large else b''
+        header = struct.pack('<IHHHHHIIIHH', 0x04034b50, version, UTF8_FLAG, 0, time, date,
+                             entry.crc32, size32, size32, len(name), len(extra))
+        segments.append(header + name + extra)
+        segments.append((entry.md5, entry.size))
+
+        # 中央目录中只有超出32位的字段放入 ZIP64 扩展（顺序为原大小、压缩后大小、偏移）
+        fields = [entry.size, entry.size] if large else []
+        if offset >= ZIP32_LIMIT:
+            fields.append(offset)
+        extra = struct.pack(f'<HH{len(fields)}Q', 1, 8 * len(fields), *fields) if fields else b''
+        directory.append(struct.pack('<IHHHHHHIIIHHHHHII', 0x02014b50, version, version, UTF8_FLAG, 0,
+                                     time, date, entry.crc32, size32, size32, len(name), len(extra),
+                                     0, 0, 0, 0, min(offset, ZIP32_LIMIT)) + name + extra)
+        offset += len(segments[-2]) + entry.size
+
+    directory = b''.join(directory)
+    count, directory_size = len(entries), len(directory)
+    tail = b''
+    if count >= ZIP16_LIMIT or offset >= ZIP32_LIMIT or directory_size >= ZIP32_LIMIT:
+        tail = struct.pack('<IQHHIIQQQQ', 0x06064b50, 44, 45, 45, 0, 0, count, count, directory_size, offset)
+        tail += struct.pack('<IIQI', 0x07064b50, 0, offset + directory_size, 1)
+    tail += struct.pack('<IHHHHIIH', 0x06054b50, 0, 0, min(count, ZIP16_LIMIT), min(count, ZIP16_LIMIT),
+                        min(directory_size, ZIP32_LIMIT), min(offset, ZIP32_LIMIT), 0)
+    segments.append(directory + tail)
+    return segments
+
+
+class BundleArchive:
+    """多文件分享的 ZIP：大小预先算出，可以从任意偏移开始读取"""
+
+    def __init__(self, storage, entries, moment):
+        self.storage = storage
+        self.segments = zip_layout(entries, moment)
+        self.offsets = []  # 每部分的起始偏移
+        self.size = 0
+        for segment in self.segments:
+            self.offsets.append(self.size)
+            self.size += _segment_size(segment)
+
+    def open(self, start=0):
+        """返回从 start 字节开始的读取器（与存储后端的 open 接口相同）"""
+        return ArchiveReader(self, start)
+
+
+class ArchiveReader:
+    """顺序读取 ZIP，read(n) 每次最多返回 n 字节（不跨越文件边界），读完后返回 b''"""
+
+    def __init__(self, archive, start):
+        self.archive = archive
+        self.position = start
+        self.index = max(0, bisect_right(archive.offsets, start) - 1)
+        self._body = None  # 当前文件内容的存储读取流
+
+    def read(self, size):
+        segments, offsets = self.archive.segments, self.archive.offsets
+        while self.index < len(segments):
+            segment = segments[self.index]
+            skip = self.position - offsets[self.index]
+            remaining = _segment_size(segment) - skip
+            if remaining <= 0:
+                self._close_body()
+                self.index += 1
+                continue
+            if isinstance(segment, bytes):
+                data = segment[skip:skip + size]
+            else:
+                if self._body is None:
+                    self._body = self.archive.storage.open(segment[0], skip)
+                data = self._body.read(min(size, remaining))
+                if not data:
+                    raise IOError(f'文件 {segment[0]} 比记录的大小短')
+            self.position += len(data)
+            return data
+        return b''
+
+    def close(self):
+        self._close_body()
+
+    def _close_body(self):
+        if self._body is not None:
+            self._body.close()
+            self._body = None
+
+
+def _segment_size(segment):
+    return len(segment) if isinstance(segment, bytes) else segment[1]
+
+
+def file_crc32(storage, md5):
+    """从存储中读取文件计算 CRC32"""
+    crc = 0
+    body = storage.open(md5)
+    try:
+        for chunk in iter(lambda: body.read(READ_SIZE), b''):
+            crc = zlib.crc32(chunk, crc)
+    finally:
+        body.close()
+    return crc
+
+
+def blob_crc32s(storage, md5s):
+    """返回 {md5: crc32}：Blob 中已记录的直接使用，其余从存储中读取计算（不写入数据库）"""
+    md5s = list(set(md5s))
+    crcs = {}
+    for start in range(0, len(md5s), QUERY_CHUNK):
+        chunk = md5s[start:start + QUERY_CHUNK]
+        crcs.update(db.session.execute(
+            select(Blob.md5, Blob.crc32).where(Blob.md5.in_(chunk), Blob.crc32 != None)).all())
+    for md5 in md5s:
+        if md5 not in crcs:
+            crcs[md5] = file_crc32(storage, md5)
+    return crcs
+
+
+def save_crc32s(crcs):
+    """把 CRC32 写入还没有记录的文件实体（需调用方提交事务，在 acquire_blob 之后调用）"""
+    for md5, crc in crcs.items():
+        Blob.query.filter(Blob.md5 == md5, Blob.crc32 == None).update(
+            {Blob.crc32: crc}, synchronize_session=False)
+
+
+def load_archive(storage, file_record):
+    """加载多文件分享的 ZIP（一条查询），有文件实体缺失时返回 None"""
+    rows = db.session.execute(
+        select(ShareItem.filename, ShareItem.md5, ShareItem.size, Blob.crc32)
+        .outerjoin(Blob, Blob.md5 == ShareItem.md5)
+        .where(ShareItem.file_id == file_record.id)
+        .order_by(ShareItem.position)
+    ).all()
+    entries = [BundleEntry(*row) for row in rows]
+    if not entries or any(entry.crc32 is None for entry in entries):
+        return None
+    # 本地存储逐个确认文件存在（对象存储不逐个请求，缺失的文件在发送时中断下载）
+    if not storage.remote and not all(storage.exists(entry.md5) for entry in entries):
+        return None
+    return BundleArchive(storage, entries, file_record.created_at)
@@ -0,0 +1,186 @@
+"""分片上传：init 创建任务 → 并行 PUT 分片 → finalize 完成
+
+分片直接写入上传目录中预分配的临时文件的对应偏移。MD5 在本进程内增量计算：按序到达的
+分片在写入时顺带计算，提前到达的分片等前面的分片到齐后再从磁盘读取一次，finalize 时只需
+补算本进程尚未见过的分片，不必重读整个文件。任务元数据和已接收分片记录在数据库中，
+因此分片可以落在不同的 worker 上。
+"""
+import hashlib
+import os
+import secrets
+import threading
+
+from models import db, ChunkedUpload, UploadChunk
+
+# 本进程内的增量哈希状态 {upload_id: IncrementalHasher}
+_hashers = {}
+_hashers_lock = threading.Lock()
+
+
+class ChunkError(Exception):
+    """分片请求不合法（偏移、长度不符等）"""
+
+
+class IncrementalHasher:
+    """按分片顺序推进的 MD5 计算状态"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.md5 = hashlib.md5()
+        self.next_index = 0  # 下一个待计算的分片序号
+        self.pending = set()  # 已写入磁盘但尚未计算的分片序号
+
+    def advance(self, upload, temp_path, buffer_size):
+        """把已落盘的连续分片计入哈希（需持有 lock）"""
+        while self.next_index in self.pending:
+            self.pending.discard(self.next_index)
+            self._hash_from_disk(upload, temp_path, self.next_index, buffer_size)
+            self.next_index += 1
+
+    def catch_up(self, upload, temp_path, buffer_size):
+        """finalize 时补算剩余分片（其他 worker 接收的分片只能从磁盘读取）"""
+        with self.lock:
+            while self.next_index < upload.chunk_count:
+                self._hash_from_disk(upload, temp_path, self.next_index, buffer_size)
+                self.next_index += 1
+            self.pending.clear()
+            return self.md5.hexdigest()
+
+    def _hash_from_disk(self, upload, temp_path, index, buffer_size):
+        start, length = chunk_span(upload, index)
+        with open(temp_path, 'rb') as f:
+            f.seek(start)
+            while length > 0:
+                data = f.read(min(buffer_size, length))
+                if not data:
+                    break
+                self.md5.update(data)
+                length -= len(data)
+
+
+def _get_hasher(upload_id):
+    with _hashers_lock:
+        return _hashers.setdefault(upload_id, IncrementalHasher())
+
+
+def _drop_hasher(upload_id):
+    with _hashers_lock:
+        _hashers.pop(upload_id, None)
+
+
+def prune_hashers(upload_folder):
+    """丢弃临时文件已不存在的哈希状态，返回丢弃的个数
+
+    过期任务由清理删除（可能在其他进程中），取消请求也可能落在其他 worker 上，本进程的哈希状态
+    只能按临时文件是否还在判断。
+    """
+    with _hashers_lock:
+        stale = [upload_id for upload_id in _hashers
+                 if not os.path.exists(temp_path_for(upload_folder, upload_id))]
+        for upload_id in stale:
+            del _hashers[upload_id]
+    return len(stale)
+
+
+def temp_path_for(upload_folder, upload_id):
+    """分片上传临时文件路径"""
+    return os.path.join(upload_folder, f'.chunked-{upload_id}')
+
+
+def chunk_span(upload, index):
+    """返回分片的 (起始偏移, 长度)"""
+    start = index * upload.chunk_size
+    return start, min(upload.chunk_size, upload.total_size - start)
+
+
+def create_upload(upload_folder, chunk_size, **fields):
+    """创建上传任务并预分配临时文件（需调用方提交事务），同时清理本进程中已失效任务的哈希状态"""
+    prune_hashers(upload_folder)
+    upload = ChunkedUpload(id=secrets.token_hex(16), chunk_size=chunk_size, **fields)
+    with open(temp_path_for(upload_folder, upload.id), 'wb') as f:
+        f.truncate(upload.total_size)
+    db.session.add(upload)
+    return upload
+
+
+def write_chunk(upload, upload_folder, offset, content_length, stream, buffer_size):
+    """把请求体写入分片对应的偏移并推进哈希（需调用方提交事务）"""
+    if offset % upload.chunk_size or offset >= max(upload.total_size, 1):
+        raise ChunkError('分片偏移不合法')
+    index = offset // upload.chunk_size
+    _, expected = chunk_span(upload, index)
+    # 写入前先校验长度，避免错误的请求覆盖已接收的数据
+    if content_length != expected:
+        raise ChunkError(f'分片长度不符：应为 {expected} 字节')
+    temp_path = temp_path_for(upload_folder, upload.id)
+    if not os.path.exists(temp_path):
+        raise ChunkError('上传任务的临时文件不存在')
+
+    hasher = _get_hasher(upload.id)
+    with hasher.lock:
+        in_order = index == hasher.next_index
+        md5 = hasher.md5.copy() if in_order else None
+
+    received = 0
+    with open(temp_path, 'r+b') as f:
+        f.seek(offset)
+        while received < expected:
+            data = stream.read(min(buffer_size, expected - received))
+            if not data:
+                break
+            received += len(data)
+            f.write(data)
+            if md5 is not None:
+                md5.update(data)
+    if received != expected:
+        raise ChunkError(f'分片长度不符：应为 {expected} 字节')
+
+    with hasher.lock:
+        if in_order and index == hasher.next_index:
+            hasher.md5 = md5
+            hasher.next_index += 1
+        elif index >= hasher.next_index:
+            hasher.pending.add(index)
+        hasher.advance(upload, temp_path, buffer_size)
+
+    if db.session.get(UploadChunk, (upload.id, index)) is None:
+        db.session.add(UploadChunk(upload_id=upload.id, chunk_index=index))
+    return index
+
+
+def received_chunks(upload):
+    """已接收的分片数"""
+    return UploadChunk.query.filter_by(upload_id=upload.id).count()
+
+
+def finish_upload(upload, upload_folder, buffer_size, storage):
+    """所有分片到齐后计算 MD5 并以内容哈希名移入存储后端，返回 md5_filename
+
+    同内容文件已存在时保留临时文件，提交文件引用后由 settle_upload 处理。
+    """
+    temp_path = temp_path_for(upload_folder, upload.id)
+    md5_filename = _get_hasher(upload.id).catch_up(upload, temp_path, buffer_size)
+    if not storage.exists(md5_filename):
+        storage.put_file(temp_path, md5_filename)
+    _drop_hasher(upload.id)
+    return md5_filename
+
+
+def settle_upload(upload_id, upload_folder, storage, md5_filename):
+    """提交文件引用后调用：去重时保留的临时文件在文件已被并发删除时重新写入，否则删除"""
+    temp_path = temp_path_for(upload_folder, upload_id)
+    if not os.path.exists(temp_path):
+        return
+    if storage.exists(md5_filename):
+        os.remove(temp_path)
+    else:
+        storage.put_file(temp_path, md5_filename)
+
+
+def discard_upload(upload, upload_folder):
+    """删除上传任务及其临时文件（需调用方提交事务）"""
+    temp_path = temp_path_for(upload_folder, upload.id)
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+    _drop_hasher(upload.id)
+    db.session.delete(upload)
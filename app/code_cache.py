@@ -0,0 +1,97 @@
+"""提取码查询缓存
+
+index 和 download_file 都要按提取码查找文件，同一次下载会先后解析两次。这里在进程内缓存
+提取码 → 文件元数据（有界 LRU + TTL），不存在的提取码也短暂缓存（负缓存），降低爆破时的
+数据库压力。元数据变更（禁用/删除/清理/下载计数）时由调用方失效对应条目；多 worker 之间
+的不一致由 TTL 兜底，下载计数以数据库为准。
+"""
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from models import FileRecord
+
+_MISSING = object()
+
+
+class FileMeta(namedtuple('FileMeta', [
+        'id', 'code', 'md5_filename', 'original_filename', 'file_size',
+        'expires_at', 'max_downloads', 'download_count', 'is_active', 'is_bundle', 'created_at'])):
+    """FileRecord 的只读快照"""
+    __slots__ = ()
+
+    is_valid = FileRecord.is_valid  # 与 FileRecord 共用有效性判断
+
+    @classmethod
+    def from_record(cls, record):
+        return cls(record.id, record.code, record.md5_filename, record.original_filename,
+                   record.file_size, record.expires_at, record.max_downloads,
+                   record.download_count, record.is_active, record.is_bundle, record.created_at)
+
+
+class CodeCache:
+    """有界 LRU + TTL 的提取码缓存（线程安全）"""
+
+    def __init__(self, maxsize, ttl, negative_ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict()  # code -> (过期时间, FileMeta 或 None)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+
+    def lookup(self, code):
+        """返回提取码对应的 FileMeta，不存在时返回 None"""
+        value = self._get(code)
+        if value is not _MISSING:
+            return value
+
+        record = FileRecord.query.filter_by(code=code).first()
+        value = FileMeta.from_record(record) if record else None
+        self._set(code, value)
+        return value
+
+    def invalidate(self, code):
+        with self._lock:
+            self._entries.pop(code, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'hits': self.hits,
+                'negative_hits': self.negative_hits,
+                'misses': self.misses,
+            }
+
+    def _get(self, code):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(code)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._entries[code]
+                self.misses += 1
+                return _MISSING
+            self._entries.move_to_end(code)
+            if entry[1] is None:
+                self.negative_hits += 1
+            else:
+                self.hits += 1
+            return entry[1]
+
+    def _set(self, code, value):
+        ttl = self.ttl if value is not None else self.negative_ttl
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[code] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(code)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
@@ -0,0 +1,195 @@
+"""可压缩文件的压缩传输
+
+文本、旧版 Office 文档等可压缩类型的文件，在存储中另外保存 gzip / zstd 压缩版本（``<md5>.gz``、
+``<md5>.zst``），下载时按 Accept-Encoding 发送客户端支持的最小版本（Content-Encoding），浏览器
+下载后自动解压，得到的仍是原文件。
+
+- 只处理 COMPRESSION_EXTENSIONS 中的类型且不小于 COMPRESSION_MIN_SIZE 的文件；zip、docx、jpg、
+  mp4 等本身已压缩的类型不处理。压缩后没有变小 COMPRESSION_MIN_SAVING 的版本不保存，只记录结果
+- 上传完成后由后台线程压缩（不延长上传请求）；旧文件在第一次下载时加入后台队列，本次仍发送
+  原文件，也可以用 flask compress-files 一次性处理
+- 压缩版本与原文件一样按内容哈希命名，同内容的分享共用；最后一个引用释放时一起删除
+- 压缩版本的 ETag 为 ``<md5>-<encoding>``，续传时 If-Range 指向哪个版本就继续发送哪个版本的字节范围
+- 每次以压缩版本完整发送时，把节省的字节数计入文件记录的 bytes_saved
+
+zstd 需要 zstandard（pip install zstandard），未安装时只生成 gzip。
+"""
+import gzip
+import os
+import queue
+import re
+import shutil
+import tempfile
+import threading
+from collections import namedtuple
+
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Blob, BlobVariant
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Content-Encoding -> 存储名后缀
+SUFFIXES = {'zstd': '.zst', 'gzip': '.gz'}
+VARIANT_NAME = re.compile(r'^([0-9a-f]{32})\.(zst|gz)$')
+
+# 可以发送的压缩版本：name 为存储名，etag 不含引号
+Variant = namedtuple('Variant', ['encoding', 'name', 'size', 'etag'])
+
+
+def variant_names(md5):
+    """文件实体所有可能的压缩版本存储名（删除文件实体时使用）"""
+    return [md5 + suffix for suffix in SUFFIXES.values()]
+
+
+def make_variant(md5, encoding, size):
+    return Variant(encoding, md5 + SUFFIXES[encoding], size, f'{md5}-{encoding}')
+
+
+class CompressionSettings:
+    """压缩参数，从应用配置读取"""
+
+    def __init__(self, config):
+        self.enabled = config['COMPRESSION_ENABLED']
+        self.extensions = {ext.lower() for ext in config['COMPRESSION_EXTENSIONS']}
+        self.min_size = config['COMPRESSION_MIN_SIZE']
+        self.min_saving = config['COMPRESSION_MIN_SAVING']
+        self.gzip_level = config['COMPRESSION_GZIP_LEVEL']
+        self.zstd_level = config['COMPRESSION_ZSTD_LEVEL']
+        self.buffer_size = config['UPLOAD_BUFFER_SIZE']
+        # 未安装 zstandard 时跳过 zstd
+        self.encodings = [encoding for encoding in config['COMPRESSION_ENCODINGS']
+                          if encoding in SUFFIXES and (encoding != 'zstd' or zstandard is not None)]
+
+    def applies_to(self, filename, size):
+        """文件是否属于需要压缩的类型和大小"""
+        if not self.enabled or not self.encodings or not size or size < self.min_size:
+            return False
+        return os.path.splitext(filename)[1].lstrip('.').lower() in self.extensions
+
+
+def load_variants(md5, settings):
+    """文件实体已保存的压缩版本，以及是否还有未处理的编码，返回 ([Variant], pending)"""
+    rows = BlobVariant.query.filter_by(md5=md5).all()
+    done = {row.encoding for row in rows}
+    variants = [make_variant(md5, row.encoding, row.size) for row in rows
+                if row.stored and row.encoding in settings.encodings]
+    return variants, any(encoding not in done for encoding in settings.encodings)
+
+
+def negotiate(variants, accept_encodings, byte_range, if_range_etag):
+    """选择本次响应发送的压缩版本，返回 Variant 或 None（发送原文件）
+
+    accept_encodings 为 werkzeug 解析的 Accept-Encoding。Range 请求只在 If-Range 指向某个压缩
+    版本时（续传一次压缩传输的下载）使用该版本，其余 Range 请求发送原文件的字节范围。
+    """
+    acceptable = [variant for variant in variants if accept_encodings.quality(variant.encoding) > 0]
+    if byte_range is not None:
+        return next((variant for variant in acceptable if variant.etag == if_range_etag), None)
+    return min(acceptable, key=lambda variant: variant.size, default=None)
+
+
+def compress_blob(storage, md5, settings):
+    """为文件实体生成尚未处理的各编码压缩版本（需在应用上下文中调用），返回 [(encoding, size, stored)]"""
+    blob = db.session.get(Blob, md5)
+    if blob is None or not blob.size:
+        return []
+    done = {encoding for (encoding,) in db.session.query(BlobVariant.encoding).filter_by(md5=md5)}
+    limit = blob.size * (1 - settings.min_saving)
+
+    results = []
+    for encoding in settings.encodings:
+        if encoding in done:
+            continue
+        temp_path, size = _compress_to_temp(storage, md5, encoding, settings)
+        stored = size <= limit
+        if stored:
+            storage.put_file(temp_path, md5 + SUFFIXES[encoding])
+        else:
+            os.remove(temp_path)
+        db.session.add(BlobVariant(md5=md5, encoding=encoding, size=size, stored=stored))
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()  # 其他进程同时压缩了同一个文件，结果相同
+            continue
+        results.append((encoding, size, stored))
+    return results
+
+
+def _compress_to_temp(storage, md5, encoding, settings):
+    """把文件压缩到本地临时文件，返回 (临时文件路径, 压缩后大小)"""
+    fd, temp_path = tempfile.mkstemp(prefix='.upload-', dir=storage.temp_dir)
+    try:
+        with os.fdopen(fd, 'wb') as out, storage.open(md5) as source:
+            if encoding == 'gzip':
+                # mtime=0：同一内容的压缩结果固定
+                with gzip.GzipFile(fileobj=out, mode='wb', compresslevel=settings.gzip_level, mtime=0) as writer:
+                    shutil.copyfileobj(source, writer, settings.buffer_size)
+            else:
+                compressor = zstandard.ZstdCompressor(level=settings.zstd_level)
+                with compressor.stream_writer(out, closefd=False) as writer:
+                    shutil.copyfileobj(source, writer, settings.buffer_size)
+            size = out.tell()
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    return temp_path, size
+
+
+class Compressor:
+    """后台压缩队列：上传完成或旧文件第一次下载时加入，由后台线程逐个压缩"""
+
+    def __init__(self, app, storage, settings, max_queue):
+        self.app = app
+        self.storage = storage
+        self.settings = settings
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._pending = set()  # 队列中和正在压缩的文件，避免重复加入
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self.compressed = 0
+        self.failed = 0
+
+    def submit(self, md5):
+        """加入后台压缩队列；队列已满时丢弃（之后的下载会再次加入）"""
+        with self._lock:
+            if md5 in self._pending:
+                return
+            try:
+                self._queue.put_nowait(md5)
+            except queue.Full:
+                return
+            self._pending.add(md5)
+        self._ensure_thread()
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def _ensure_thread(self):
+        # 多进程服务器 fork 后子进程中没有父进程的线程，需要按进程启动
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid != os.getpid() or self._thread is None or not self._thread.is_alive():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='compressor', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            md5 = self._queue.get()
+            try:
+                with self.app.app_context():
+                    compress_blob(self.storage, md5, self.settings)
+                self.compressed += 1
+            except Exception:
+                self.failed += 1
+                self.app.logger.error(f"压缩文件失败: {md5}", exc_info=True)
+            finally:
+                with self._lock:
+                    self._pending.discard(md5)
@@ -3,7 +3,7 @@ from datetime import timedelta
 import pytz
 
 class Config:
-    SECRET_KEY = os.urandom(24)  # 每次启动重新生成  # Flask应用的安全密钥，用于加密会话数据
+    SECRET_KEY = os.environ.get('SECRET_KEY') or os.urandom(24)  # 未设置环境变量时每次启动重新生成  # Flask应用的安全密钥，用于加密会话数据
     # 获取 app.py 所在目录的绝对路径（假设 config.py 和 app.py 同级）
     BASE_DIR = os.path.dirname(os.path.abspath(__file__))
     UPLOAD_FOLDER = os.path.join(BASE_DIR, 'files')  # 直接指向 ./app/files
@@ -21,15 +21,43 @@ class Config:
     ALLOWED_EXTENSIONS_FLAT = [ext for group in ALLOWED_EXTENSIONS.values() for ext in group]
 
     MAX_CONTENT_LENGTH = 200 * 1024 * 1024  # 200MB，限制上传文件的最大大小
+    UPLOAD_BUFFER_SIZE = 1024 * 1024  # 上传文件流式写入磁盘时的缓冲区大小（1MB）
+    CHUNKED_UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024  # 分片上传的分片大小（8MB，需小于 MAX_CONTENT_LENGTH）
+    CHUNKED_UPLOAD_MAX_SIZE = 4 * 1024 * 1024 * 1024  # 分片上传允许的最大文件大小（4GB）
+    CHUNKED_UPLOAD_EXPIRE_HOURS = 24  # 未完成的分片上传保留时间(小时)，超时由 cleanup 清理
+    CHUNKED_UPLOAD_PARALLEL = 4  # 浏览器端并行上传的分片数
+    BULK_UPLOAD_MAX_FILES = 500  # 批量上传一次请求最多的文件数（总大小仍受 MAX_CONTENT_LENGTH 限制，更多文件使用 flask bulk-upload）
+    BULK_UPLOAD_THREADS = 4  # 批量上传时并行哈希和写入存储的线程数
+    BUNDLE_STREAM_CHUNK_SIZE = 256 * 1024  # 多文件分享下载时生成 ZIP 每次读取的块大小
     DEFAULT_EXPIRE_DAYS = 7  # 默认7天后过期，文件记录的默认有效期
     CODE_LENGTH = 6  # 提取码的长度（字符数）
     CLEAR_ON_STARTUP = False  # 启动时是否清空数据库和上传文件夹（用于开发和测试）
     
+    # 数据库配置
+    DATABASE_URL = None  # 数据库地址（SQLAlchemy URL），None 表示使用 app 目录下的 filecodes.db
+    DATABASE_POOL_SIZE = 10  # 连接池常驻连接数
+    DATABASE_MAX_OVERFLOW = 20  # 连接池允许临时超出的连接数
+    DATABASE_POOL_TIMEOUT = 30  # 等待空闲连接的超时时间(秒)
+    # SQLite 每个连接建立时应用的 PRAGMA：WAL 让读写互不阻塞，NORMAL 在 WAL 下仍保证一致性，
+    # busy_timeout 让写冲突排队等待而不是立即报 database is locked
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,  # 毫秒
+        'mmap_size': 256 * 1024 * 1024,  # 256MB 内存映射读取
+        'cache_size': -64000,  # 负数单位为KB，即约64MB页缓存
+        'temp_store': 'MEMORY',
+    }
+
     # 速率限制配置
     RATE_LIMIT_DEFAULT = "200 per day, 50 per hour"  # 全局默认请求限制（每天200次，每小时50次）
     RATE_LIMIT_INDEX = "100 per day, 10 per minute"  # 首页/提取码尝试的请求限制（每分钟10次）
     RATE_LIMIT_DOWNLOAD = "100 per day, 5 per minute"  # 下载请求的限制（每分钟5次）
     RATE_LIMIT_ADMIN = "20 per day, 3 per minute"  # 管理员接口速率限制
+    RATE_LIMIT_PREVIEW = "200 per day, 30 per minute"  # 图片预览（缩略图）请求的限制
+    # flask_limiter 计数存储：memory:// 为进程内计数，多 worker 时每个进程单独计数（实际限制放宽为
+    # workers 倍），需要精确限制时改为 redis://host:6379 等共享存储
+    RATELIMIT_STORAGE_URI = 'memory://'
 
     # 会话配置
     PERMANENT_SESSION_LIFETIME = timedelta(minutes=5)  # 会话有效期5分钟
@@ -44,17 +72,115 @@ class Config:
     # 密码(提取码)爆破防护配置
     PASSWORD_MAX_ATTEMPTS = 5  # 5分钟内最多尝试次数
     PASSWORD_BLOCK_TIME = 300  # 封锁时间(秒)
+    BRUTE_FORCE_STORAGE = 'memory'  # 提取码尝试记录后端：memory（进程内）或 database（多 worker 共享）
+    BRUTE_FORCE_MAX_IPS = 100000  # 进程内最多保留的IP记录数（超过时淘汰最久未访问的）
     DOWNLOAD_FREQUENCY_LIMIT = 3  # 下载频率检查窗口内同一文件下载次数限制
     DOWNLOAD_FREQUENCY_WINDOW = 5  # 下载频率检查窗口(分钟)
+    DOWNLOAD_FREQUENCY_STORAGE_URI = 'memory://'  # 下载频率窗口后端：memory://（进程内）、redis://host:6379（多worker共享）或 database
+    DOWNLOAD_LOG_ASYNC = True  # 下载记录是否由后台线程批量写入（False 时在请求中同步写入）
+    DOWNLOAD_LOG_QUEUE_SIZE = 10000  # 待写入下载记录队列上限，队满时退化为同步写入
+    DOWNLOAD_LOG_BATCH_SIZE = 500  # 每批写入的最大记录数
+    DOWNLOAD_LOG_FLUSH_INTERVAL = 1.0  # 后台线程的最长写入间隔(秒)
+    DOWNLOAD_SESSION_IDLE = 30  # 断点续传会话空闲超时(分钟)，超时后的请求视为新的下载
+    DOWNLOAD_MAX_TRANSFER_TIME = 6 * 3600  # 单次下载的最长传输时间(秒)，下载次数已用完的分享在最后一次请求后至少保留这么久
+    DOWNLOAD_SESSION_MAX_TRANSFER = 2  # 单个会话累计传输量上限（文件大小的倍数，含第一次请求），超过后视为新的下载
 
     ADMIN_LOGIN_ATTEMPTS = 5  # 允许的最大尝试次数
     ADMIN_LOGIN_BLOCK_TIME = 300  # 封锁时间(秒)
-    ADMIN_LOGIN_DELAY = 2  # 失败后的延迟响应(秒)
+    ADMIN_LOGIN_DELAY = 2  # 失败后的冷却时间(秒)，期间同一IP的登录请求直接返回429
+    ADMIN_LOGIN_STATE_TTL = 10  # 进程内缓存的登录状态有效期(秒)，过期后从数据库重新加载
+    ADMIN_LOGIN_MAX_IPS = 10000  # 进程内最多缓存的IP登录状态数
     ADMIN_SESSION_TIMEOUT = 1800  # 会话超时时间(秒)(30分钟)
     ADMIN_SESSION_WARNING_TIME = 300  # 新增：提前5分钟警告（单位：秒）
 
     TIMEZONE = pytz.timezone('Asia/Shanghai')
     DEFALUT_ITEM_EVERY_PAGE = 20 # 默认分页项数
+    ADMIN_DOWNLOADS_PER_FILE = 5  # 文件记录页中每个文件显示的最近下载记录数
+
+    # 提取码查询缓存（进程内 LRU + TTL）
+    CODE_CACHE_SIZE = 10000  # 最多缓存的提取码数量，0 表示关闭缓存
+    CODE_CACHE_TTL = 30  # 有效提取码的缓存时间(秒)
+    CODE_CACHE_NEGATIVE_TTL = 10  # 无效提取码的缓存时间(秒)
+
+    # 后台统计
+    STATS_SERIES_HOURS = 24  # 首页显示最近多少小时的上传/下载统计
+    STATS_RECONCILE_HOURS = 48  # 校对统计时重新核对最近多少小时的汇总
+    STATS_HOURLY_RETENTION_DAYS = 90  # 按小时汇总的统计保留天数
+
+    # 定时清理（见 maintenance.py）
+    CLEANUP_SCHEDULER_ENABLED = True  # 是否在 Web 进程内定时清理（使用独立清理进程时可关闭）
+    CLEANUP_INTERVAL = 600  # 清理间隔(秒)
+    CLEANUP_BATCH_SIZE = 500  # 每批删除的最大行数，每批单独提交
+    CLEANUP_BATCH_PAUSE = 0.05  # 批与批之间的暂停(秒)，控制清理对正常请求的影响
+    CLEANUP_PURGE_USED_UP = True  # 是否删除下载次数已用完的分享
+    CLEANUP_DOWNLOAD_RECORD_DAYS = 30  # 下载记录和断点续传会话的保留天数
+    CLEANUP_LOGIN_ATTEMPT_DAYS = 7  # 管理员登录记录的保留天数（封锁中的记录不会删除）
+    CLEANUP_ORPHAN_GRACE = 3600  # 上传目录中无引用文件的宽限时间(秒)，避免误删正在上传的文件
+    CLEANUP_ORPHAN_INTERVAL = 86400  # 孤立文件检查的间隔(秒)：需要遍历整个存储后端，不随每次清理执行
+
+    # 文件存储配置（见 storage.py）
+    STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'local')  # local：本地目录（UPLOAD_FOLDER）；s3：S3 兼容对象存储（需要 boto3）
+    STORAGE_SHARD_DEPTH = 1  # 本地存储按哈希前缀分层的目录层数：1 为 ab/<md5>（256 个目录），千万级文件时可用 2（ab/cd/<md5>），0 表示全部平铺在上传目录中
+    STORAGE_S3_BUCKET = os.environ.get('STORAGE_S3_BUCKET')
+    STORAGE_S3_PREFIX = os.environ.get('STORAGE_S3_PREFIX', '')  # 对象键前缀，例如 'files/'
+    STORAGE_S3_ENDPOINT_URL = os.environ.get('STORAGE_S3_ENDPOINT_URL')  # MinIO 等 S3 兼容服务的地址，AWS 留空
+    STORAGE_S3_REGION = os.environ.get('STORAGE_S3_REGION')
+    STORAGE_S3_ACCESS_KEY = os.environ.get('STORAGE_S3_ACCESS_KEY')  # 留空时使用 boto3 的默认凭证（AWS_* 环境变量、实例角色等）
+    STORAGE_S3_SECRET_KEY = os.environ.get('STORAGE_S3_SECRET_KEY')
+    STORAGE_S3_PRESIGNED_DOWNLOADS = True  # 下载时重定向到预签名 URL（客户端直接从对象存储下载）；False 时由应用流式转发
+    STORAGE_S3_PRESIGN_EXPIRES = 300  # 预签名 URL 的有效期(秒)，只需覆盖开始下载前的时间
+    STORAGE_S3_STREAM_CHUNK_SIZE = 64 * 1024  # 流式转发时每次从对象存储读取的块大小
+
+    # 压缩传输配置（见 compression.py）
+    COMPRESSION_ENABLED = True  # 是否为可压缩类型的文件生成压缩版本并按 Accept-Encoding 发送
+    COMPRESSION_EXTENSIONS = ['txt', 'doc', 'xls', 'ppt', 'pdf', 'bmp', 'wav']  # 可压缩类型；zip、docx/xlsx/pptx、jpg、mp4 等本身已压缩，不在其中
+    COMPRESSION_MIN_SIZE = 32 * 1024  # 小于此大小(字节)的文件不压缩
+    COMPRESSION_MIN_SAVING = 0.1  # 压缩后至少变小 10% 才保存压缩版本
+    COMPRESSION_ENCODINGS = ['zstd', 'gzip']  # 生成的压缩编码（zstd 需要 zstandard，未安装时跳过）
+    COMPRESSION_GZIP_LEVEL = 6
+    COMPRESSION_ZSTD_LEVEL = 10
+    COMPRESSION_QUEUE_SIZE = 1000  # 后台压缩队列长度，队列满时新任务被丢弃（之后下载时再次加入）
+
+    # 图片预览缩略图（见 thumbnails.py，需要 Pillow）
+    THUMBNAIL_ENABLED = True  # 输入提取码后图片先显示缩略图，后台文件列表显示缩略图
+    THUMBNAIL_EXTENSIONS = ALLOWED_EXTENSIONS['images']  # 生成缩略图的类型
+    THUMBNAIL_SIZE = 320  # 缩略图最长边(像素)
+    THUMBNAIL_FORMAT = 'WEBP'  # WEBP 或 JPEG（Pillow 不支持 WebP 时自动使用 JPEG）
+    THUMBNAIL_QUALITY = 80
+    THUMBNAIL_MAX_SOURCE_SIZE = 50 * 1024 * 1024  # 超过此大小(字节)的图片不生成缩略图
+    THUMBNAIL_MAX_PIXELS = 50_000_000  # 超过此像素数的图片不生成缩略图（防止解压炸弹）
+    THUMBNAIL_CACHE_DIR = None  # 缩略图缓存目录，None 表示上传目录下的 .thumbnails
+    THUMBNAIL_CACHE_MAX_BYTES = 512 * 1024 * 1024  # 缓存总大小上限（512MB），超过时淘汰最久未使用的
+    THUMBNAIL_WORKERS = 2  # 每个进程生成缩略图的线程数
+    THUMBNAIL_QUEUE_SIZE = 1000  # 每个进程等待生成的缩略图数上限，超过时上传后不再预先生成（预览时再生成）
+    THUMBNAIL_WAIT = 5  # 预览请求等待缩略图生成的最长时间(秒)，超时返回 503 由浏览器重试
+    THUMBNAIL_MAX_AGE = 7 * 24 * 3600  # 浏览器缓存缩略图的时间(秒)
+    PREVIEW_SESSION_CODES = 10  # 会话中最多记住的可预览提取码数
+
+    # 运行指标（见 metrics.py，GET /admin/metrics 输出 Prometheus 文本格式）
+    METRICS_ENABLED = False  # 是否记录请求、数据库和速率限制指标（python app.py --metrics 或环境变量 METRICS=1）；关闭时不注册任何钩子
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')  # Prometheus 抓取时使用的 Bearer 令牌；留空时只允许已登录的管理员访问
+    METRICS_SHARED_DIR = os.environ.get('METRICS_SHARED_DIR')  # 多 worker 时各进程写入指标的共享目录，留空时只输出处理抓取请求的进程自己的指标
+    METRICS_SYNC_INTERVAL = 5  # 各进程写入共享目录的间隔(秒)
+
+    # 下载卸载配置：启用后 Flask 只做校验和记录，文件体由 nginx 通过 X-Accel-Redirect 发送
+    DOWNLOAD_OFFLOAD = False  # 是否启用 X-Accel-Redirect（需要 nginx 前置，直接运行 Flask 时保持关闭）
+    X_ACCEL_REDIRECT_PREFIX = '/files/'  # 对应 nginx.conf 中 internal 的 location
 
     DEFALUT_HOST = '0.0.0.0'
-    DEFALUT_PORT = 5000 # 改这个端口，同时需要修改nginx配置
\ No newline at end of file
+    DEFALUT_PORT = 5000 # 改这个端口，同时需要修改nginx配置
+
+    # 生产服务器配置（python app.py --serve，使用 gunicorn）
+    SERVER_WORKERS = os.cpu_count() or 1  # worker 进程数（默认为 CPU 核数，每个进程另有多个线程）
+    SERVER_THREADS = 8  # 每个 worker 的线程数，同时处理的请求数为 workers * threads
+    SERVER_KEEPALIVE = 5  # keep-alive 连接的空闲保持时间(秒)，需大于 nginx upstream 的 keepalive_timeout，避免 nginx 复用已被关闭的连接
+    SERVER_TIMEOUT = 300  # worker 无响应多久后被重启(秒)，需覆盖大文件上传和直接发送的下载
+    SERVER_GRACEFUL_TIMEOUT = 60  # 平滑重启/退出时等待处理中请求的时间(秒)
+    SERVER_MAX_REQUESTS = 10000  # worker 处理多少个请求后自动替换，0 表示不替换
+    SERVER_MAX_REQUESTS_JITTER = 1000  # 自动替换的随机偏移量，避免所有 worker 同时重启
+    SERVER_BACKLOG = 2048  # 等待 accept 的连接队列长度
+
+    # 异步下载服务配置（python app.py --async-downloads，需要 aiohttp）
+    ASYNC_DOWNLOAD_CHUNK_SIZE = 64 * 1024  # 每次读取和发送的块大小，也大致是每个慢速下载占用的内存
+    ASYNC_DOWNLOAD_DB_THREADS = 8  # 执行下载校验（数据库查询和计数）的线程数
+    ASYNC_DOWNLOAD_IO_THREADS = 16  # 读取文件的线程数（读取很快，与并发下载数无关）
\ No newline at end of file
@@ -0,0 +1,109 @@
+"""下载记录的批量异步写入
+
+下载记录只用于后台查看和统计，不影响下载本身的正确性，因此不必在响应路径上同步提交。
+下载时只把记录放入有界队列，由后台线程按批次（或按时间间隔）一次性插入；队列满时退化为
+同步写入（背压，不丢记录），进程退出时会把队列中剩余的记录全部写入。后台统计的每小时下载
+汇总、文件记录的压缩传输节省流量也在同一事务中按批更新（总下载量在计数时增加，见 stats.record_claim）。
+"""
+import atexit
+import os
+import queue
+import threading
+from collections import Counter
+
+from models import db, DownloadRecord, FileRecord
+from stats import record_downloads
+
+
+class DownloadLogWriter:
+    def __init__(self, app, max_queue, batch_size, flush_interval, enabled=True):
+        self.app = app
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enabled = enabled
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        atexit.register(self.close)
+
+    def record(self, **fields):
+        """记录一次下载（file_id、downloader_ip、download_time、user_agent，可选 bytes_saved）"""
+        if not self.enabled:
+            self._write([fields])
+            return
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait(fields)
+        except queue.Full:
+            self._write([fields])
+
+    def flush(self):
+        """把队列中已有的记录全部写入"""
+        while True:
+            batch = self._drain(self.batch_size)
+            if not batch:
+                return
+            self._write(batch)
+
+    def close(self):
+        """停止后台线程并写入剩余记录（进程退出时自动调用）"""
+        self._stop.set()
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            self._thread.join(timeout=self.flush_interval * 2 + 5)
+        self.flush()
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def _ensure_thread(self):
+        # 多进程服务器 fork 后子进程中没有父进程的线程，需要按进程启动
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._pid != os.getpid() or self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='download-log-writer', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            batch = [first] + self._drain(self.batch_size - 1)
+            try:
+                self._write(batch)
+            except Exception:
+                self.app.logger.error("批量写入下载记录失败", exc_info=True)
+
+    def _drain(self, limit):
+        batch = []
+        while len(batch) < limit:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        with self.app.app_context():
+            # 跳过写入前已被删除的文件，避免留下孤立的下载记录
+            file_ids = {row['file_id'] for row in batch}
+            sizes = dict(db.session.execute(
+                db.select(FileRecord.id, FileRecord.file_size).where(FileRecord.id.in_(file_ids))).all())
+            rows = [row for row in batch if row['file_id'] in sizes]
+            saved = Counter()
+            for row in rows:
+                saved[row['file_id']] += row.pop('bytes_saved', 0)
+            if rows:
+                db.session.execute(DownloadRecord.__table__.insert(), rows)
+                record_downloads(rows, sizes)  # 小时汇总随下载记录一起按批更新
+                for file_id, amount in saved.items():
+                    if amount:
+                        FileRecord.query.filter_by(id=file_id).update(
+                            {FileRecord.bytes_saved: FileRecord.bytes_saved + amount}, synchronize_session=False)
+                db.session.commit()
@@ -0,0 +1,78 @@
+"""断点续传的下载会话
+
+一次逻辑下载可能由多个 Range 请求组成（断线重连、分段下载）。同一IP对同一文件的第一次请求
+计入 download_count 和 DownloadRecord 并开启会话；会话空闲未超时且累计传输量未超过上限时，
+后续从文件中间开始的 Range 请求视为续传，只累计传输字节数，不再计数。
+"""
+from collections import namedtuple
+from datetime import timedelta
+
+from config import Config
+from models import db, DownloadSession
+
+# 下载校验结果：error 为 None 时可以发送文件，continuation 表示属于已计数下载的续传请求，
+# variant 为要发送的压缩版本（compression.Variant，None 表示发送原文件），archive 为多文件分享
+# 即时生成的 ZIP（bundle.BundleArchive）；否则 error 为 404（提取码无效、已失效或文件不存在）
+# 或 429（同一文件下载过于频繁）
+DownloadVerdict = namedtuple('DownloadVerdict', ['file_record', 'continuation', 'error', 'variant', 'archive'],
+                             defaults=(None, None))
+
+
+def requested_bytes(range_header, file_size):
+    """根据 Range 请求头计算本次请求的字节数（无 Range 或无法满足时按整个文件计算）"""
+    if range_header is not None and file_size:
+        byte_range = range_header.range_for_length(file_size)
+        if byte_range is not None:
+            start, stop = byte_range
+            return stop - start
+    return file_size or 0
+
+
+def resolve_range(byte_range, if_range_etag, etag, file_size):
+    """本次响应发送的字节范围 (start, stop, partial)，Range 无法满足时返回 None
+
+    If-Range 与 etag 不一致（文件已变化）时忽略 Range，发送整个文件。
+    """
+    if byte_range is None or if_range_etag not in (None, etag):
+        return 0, file_size, False
+    span = byte_range.range_for_length(file_size)
+    if span is None:
+        return None
+    return span[0], span[1], True
+
+
+def find_active_session(file_record, ip, now, requested):
+    """查找可续传的下载会话（requested 为本次请求的字节数），没有则返回 None"""
+    idle_since = now - timedelta(minutes=Config.DOWNLOAD_SESSION_IDLE)
+    session = DownloadSession.query.filter(
+        DownloadSession.file_id == file_record.id,
+        DownloadSession.downloader_ip == ip,
+        DownloadSession.last_seen > idle_since
+    ).order_by(DownloadSession.last_seen.desc()).first()
+
+    # 加上本次请求后累计传输量超过文件大小的若干倍时视为新的下载，避免用续传免费获取完整副本
+    max_transfer = (file_record.file_size or 0) * Config.DOWNLOAD_SESSION_MAX_TRANSFER
+    if session is None or (session.bytes_served or 0) + requested > max_transfer:
+        return None
+    return session
+
+
+def start_session(file_record, ip, now, served):
+    """开启新的下载会话（需调用方提交事务）"""
+    session = DownloadSession(
+        file_id=file_record.id,
+        downloader_ip=ip,
+        started_at=now,
+        last_seen=now,
+        bytes_served=served,
+        request_count=1
+    )
+    db.session.add(session)
+    return session
+
+
+def touch_session(session, now, served):
+    """记录一次续传请求（需调用方提交事务）"""
+    session.last_seen = now
+    session.bytes_served = (session.bytes_served or 0) + served
+    session.request_count = (session.request_count or 0) + 1
@@ -0,0 +1,98 @@
+"""上传文件的单次流式写入
+
+Werkzeug 解析 multipart 请求体时会为每个文件部分调用 stream_factory 获取写入目标。
+这里把目标换成上传目录中的临时文件，写入的同时计算 MD5 和字节数，解析结束后
+以内容哈希名移入存储后端（本地存储为原子重命名），请求体只被读取一次，也不再产生额外的临时文件。
+"""
+import hashlib
+import os
+import tempfile
+
+from flask import Request, current_app
+
+from models import generate_md5_filename
+
+
+class HashingFileStream:
+    """边写入边计算 MD5 和大小的临时文件"""
+
+    def __init__(self, upload_folder, buffer_size):
+        fd, self.temp_path = tempfile.mkstemp(prefix='.upload-', dir=upload_folder)
+        self._file = os.fdopen(fd, 'w+b', buffering=buffer_size)
+        self._md5 = hashlib.md5()
+        self.size = 0
+        self.committed = False
+
+    def write(self, data):
+        self._md5.update(data)
+        self.size += len(data)
+        return self._file.write(data)
+
+    def hexdigest(self):
+        return self._md5.hexdigest()
+
+    def commit(self, storage, name):
+        """写入完成后把临时文件移入存储"""
+        self._file.close()
+        storage.put_file(self.temp_path, name)
+        self.committed = True
+
+    def close(self):
+        """请求结束时由 Werkzeug 调用；未提交的临时文件直接删除"""
+        if not self._file.closed:
+            self._file.close()
+        if not self.committed and os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+    def __getattr__(self, name):
+        # read/seek/tell 等其余文件接口直接转发给底层文件
+        return getattr(self._file, name)
+
+
+class StreamingUploadRequest(Request):
+    """上传文件直接流式写入上传目录的请求类"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return HashingFileStream(current_app.config['UPLOAD_FOLDER'],
+                                 current_app.config['UPLOAD_BUFFER_SIZE'])
+
+
+def store_upload(file_storage, storage):
+    """把上传文件以内容哈希名保存到存储后端，返回 (md5_filename, file_size)
+
+    同内容文件已存在时不再写入（去重），引用计数由 blobstore 维护。临时文件保留到请求结束，
+    提交文件引用后需调用 ensure_stored。
+    """
+    stream = file_storage.stream
+    if isinstance(stream, HashingFileStream):
+        md5_filename = stream.hexdigest()
+        if not storage.exists(md5_filename):
+            stream.commit(storage, md5_filename)
+        return md5_filename, stream.size
+
+    # 非流式请求（例如未使用 StreamingUploadRequest）时回退到多次读取的方式
+    md5_filename = generate_md5_filename(stream)
+    stream.seek(0, os.SEEK_END)
+    file_size = stream.tell()
+    stream.seek(0)
+    if not storage.exists(md5_filename):
+        fd, temp_path = tempfile.mkstemp(prefix='.upload-', dir=storage.temp_dir)
+        os.close(fd)
+        file_storage.save(temp_path)
+        storage.put_file(temp_path, md5_filename)
+    return md5_filename, file_size
+
+
+def ensure_stored(file_storage, storage, md5_filename):
+    """提交文件引用后调用：去重时跳过写入的文件如果已被并发的删除清理掉，用本次上传的内容重新写入"""
+    if storage.exists(md5_filename):
+        return
+    stream = file_storage.stream
+    if isinstance(stream, HashingFileStream):
+        stream.commit(storage, md5_filename)
+        return
+    stream.seek(0)
+    fd, temp_path = tempfile.mkstemp(prefix='.upload-', dir=storage.temp_dir)
+    os.close(fd)
+    file_storage.save(temp_path)
+    storage.put_file(temp_path, md5_filename)
@@ -0,0 +1,356 @@
+"""定时清理任务
+
+清理按批进行：每批最多 batch_size 行，单独提交，批与批之间暂停 pause 秒，避免长时间占用
+数据库写锁影响正常下载。每次运行清理：
+
+- 过期的分享，以及下载次数已用完的分享（最后一次下载请求后的续传超时和最长传输时间内暂不删除）
+- 超过保留期的下载记录、断点续传会话和管理员登录记录，已失效的提取码尝试记录
+- 超时未完成的分片上传
+- 存储后端中没有任何记录引用的文件、上传目录根部旧版本平铺存放的无引用文件和残留的临时文件
+  （只处理修改时间早于 orphan_grace 的文件，避免误删正在上传、尚未提交的文件）。这一项需要遍历
+  整个存储后端，只在距上次检查超过 orphan_interval 秒时执行，遍历结果同样按批处理
+
+CleanupScheduler 在 Web 进程内的后台线程中定时运行清理，也可以通过 python app.py --cleanup-worker
+作为独立进程运行；多个进程同时运行时通过上传目录中的文件锁保证同一时刻只有一个在清理。
+"""
+import os
+import re
+import threading
+import time
+from collections import Counter, deque
+from datetime import timedelta
+from functools import partial
+from itertools import islice
+
+from sqlalchemy import select
+
+from models import (db, eastern8_now, AdminLoginAttempt, Blob, BruteForceState, ChunkedUpload,
+                    DownloadRecord, DownloadSession, FileRecord, ShareItem)
+from blobstore import release_share, remove_unreferenced_file
+from chunked_upload import discard_upload, prune_hashers
+from stats import prune_hourly, record_removal
+from storage import MD5_NAME
+from compression import VARIANT_NAME
+
+try:
+    import fcntl
+except ImportError:  # Windows 下没有 fcntl，只能依赖部署时只运行一个清理进程
+    fcntl = None
+
+CHUNKED_NAME = re.compile(r'^\.chunked-(.+)$')
+LOCK_NAME = '.cleanup.lock'
+ORPHAN_SWEEP_NAME = '.orphan-sweep'  # 修改时间为上次孤立文件检查的时间（多个进程共用）
+
+# 每次运行的统计项（行数和释放的字节数）
+RESULT_KEYS = (
+    'expired_files', 'used_up_files', 'download_records', 'download_sessions',
+    'login_attempts', 'brute_force_states', 'chunked_uploads', 'stat_buckets', 'orphan_files', 'bytes_freed',
+)
+
+
+class CleanupSettings:
+    """清理参数，从应用配置读取"""
+
+    def __init__(self, config):
+        self.upload_folder = config['UPLOAD_FOLDER']
+        self.batch_size = config['CLEANUP_BATCH_SIZE']
+        self.pause = config['CLEANUP_BATCH_PAUSE']
+        self.purge_used_up = config['CLEANUP_PURGE_USED_UP']
+        # 会话只在请求开始时更新，已用完的分享在续传超时之外再保留一次下载的最长传输时间，
+        # 避免单个很长的下载（包括 X-Accel-Redirect 和预签名 URL 的下载）传输中途文件被删除
+        self.used_up_grace = (timedelta(minutes=config['DOWNLOAD_SESSION_IDLE']) +
+                              timedelta(seconds=config['DOWNLOAD_MAX_TRANSFER_TIME']))
+        self.download_record_days = config['CLEANUP_DOWNLOAD_RECORD_DAYS']
+        self.login_attempt_days = config['CLEANUP_LOGIN_ATTEMPT_DAYS']
+        self.chunked_upload_hours = config['CHUNKED_UPLOAD_EXPIRE_HOURS']
+        self.stats_retention_days = config['STATS_HOURLY_RETENTION_DAYS']
+        self.orphan_grace = config['CLEANUP_ORPHAN_GRACE']
+        self.orphan_interval = config['CLEANUP_ORPHAN_INTERVAL']
+
+
+def run_cleanup(settings, storage, on_removed=None, orphans=None):
+    """执行一次完整清理，返回各项清理数量（Counter，另含 duration 秒数）
+
+    on_removed(codes) 在每批分享删除提交后调用，用于清除本进程的提取码缓存。orphans 为 None 时
+    距上次孤立文件检查超过 orphan_interval 秒才检查，True / False 强制检查或跳过。
+    """
+    started = time.perf_counter()
+    result = Counter(dict.fromkeys(RESULT_KEYS, 0))
+    now = eastern8_now()
+
+    expired = select(FileRecord.id).where(FileRecord.expires_at < now)
+    _purge_shares(expired, 'expired_files', settings, storage, result, on_removed)
+
+    if settings.purge_used_up:
+        active_session = select(DownloadSession.id).where(
+            DownloadSession.file_id == FileRecord.id,
+            DownloadSession.last_seen > now - settings.used_up_grace
+        ).exists()
+        used_up = select(FileRecord.id).where(
+            FileRecord.max_downloads > 0,
+            FileRecord.download_count >= FileRecord.max_downloads,
+            ~active_session
+        )
+        _purge_shares(used_up, 'used_up_files', settings, storage, result, on_removed)
+
+    result['download_records'] += _delete_in_batches(
+        DownloadRecord, DownloadRecord.download_time < now - timedelta(days=settings.download_record_days), settings)
+    result['download_sessions'] += _delete_in_batches(
+        DownloadSession, DownloadSession.last_seen < now - timedelta(days=settings.download_record_days), settings)
+    result['login_attempts'] += _delete_in_batches(
+        AdminLoginAttempt,
+        (AdminLoginAttempt.attempt_time < now - timedelta(days=settings.login_attempt_days)) &
+        ((AdminLoginAttempt.blocked_until == None) | (AdminLoginAttempt.blocked_until < now)),
+        settings)
+    result['brute_force_states'] += _delete_in_batches(
+        BruteForceState, BruteForceState.expires_at < time.time(), settings, key=BruteForceState.ip)
+
+    stale_uploads = ChunkedUpload.created_at < now - timedelta(hours=settings.chunked_upload_hours)
+    while True:
+        uploads = ChunkedUpload.query.filter(stale_uploads).limit(settings.batch_size).all()
+        if not uploads:
+            break
+        for upload in uploads:
+            discard_upload(upload, settings.upload_folder)
+        db.session.commit()
+        result['chunked_uploads'] += len(uploads)
+        _pause(settings)
+    prune_hashers(settings.upload_folder)
+
+    result['stat_buckets'] += prune_hourly(settings.stats_retention_days)
+    db.session.commit()
+
+    if orphans or (orphans is None and _orphan_sweep_due(settings)):
+        files, freed = remove_orphan_files(settings, storage)
+        result['orphan_files'] += files
+        result['bytes_freed'] += freed
+        _mark_orphan_sweep(settings)
+    result['duration'] = time.perf_counter() - started
+    return result
+
+
+def _purge_shares(id_query, key, settings, storage, result, on_removed):
+    """按批删除 id_query 选出的分享，释放文件引用，提交后删除已无引用的物理文件"""
+    while True:
+        ids = db.session.scalars(id_query.limit(settings.batch_size)).all()
+        if not ids:
+            return
+        records = FileRecord.query.filter(FileRecord.id.in_(ids)).all()
+        codes = [record.code for record in records]
+        released = []
+        for record in records:
+            released += release_share(record)
+            record_removal(record)
+        # 关联的下载记录、会话和多文件分享中的文件直接按文件批量删除，不逐条加载
+        DownloadRecord.query.filter(DownloadRecord.file_id.in_(ids)).delete(synchronize_session=False)
+        DownloadSession.query.filter(DownloadSession.file_id.in_(ids)).delete(synchronize_session=False)
+        ShareItem.query.filter(ShareItem.file_id.in_(ids)).delete(synchronize_session=False)
+        FileRecord.query.filter(FileRecord.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+        db.session.expunge_all()
+
+        if on_removed:
+            on_removed(codes)
+        result[key] += len(codes)
+        result['bytes_freed'] += sum(
+            remove_unreferenced_file(storage, md5) for md5 in released)
+        _pause(settings)
+
+
+def _delete_in_batches(model, condition, settings, key=None):
+    """按主键分批删除满足条件的行，返回删除的总行数"""
+    key = model.id if key is None else key
+    total = 0
+    while True:
+        ids = db.session.scalars(select(key).where(condition).limit(settings.batch_size)).all()
+        if not ids:
+            return total
+        model.query.filter(key.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+        total += len(ids)
+        _pause(settings)
+
+
+def _pause(settings):
+    if settings.pause:
+        time.sleep(settings.pause)
+
+
+def _orphan_sweep_due(settings):
+    try:
+        last = os.path.getmtime(os.path.join(settings.upload_folder, ORPHAN_SWEEP_NAME))
+    except FileNotFoundError:
+        return True
+    return time.time() - last >= settings.orphan_interval
+
+
+def _mark_orphan_sweep(settings):
+    path = os.path.join(settings.upload_folder, ORPHAN_SWEEP_NAME)
+    with open(path, 'a'):
+        pass
+    os.utime(path)
+
+
+def remove_orphan_files(settings, storage):
+    """删除没有记录引用的文件，返回 (文件数, 字节数)
+
+    检查存储后端中的文件，以及上传目录根部的临时文件和旧版本平铺存放的文件。边遍历边按
+    batch_size 个文件一批查询引用并删除，内存占用与文件总数无关。
+    """
+    candidates = _orphan_candidates(settings, storage, time.time() - settings.orphan_grace)
+    removed = freed = 0
+    while True:
+        batch = list(islice(candidates, settings.batch_size))
+        if not batch:
+            return removed, freed
+        md5_names = [name for name, _ in batch if MD5_NAME.match(name)]
+        md5_names += [VARIANT_NAME.match(name).group(1) for name, _ in batch if VARIANT_NAME.match(name)]
+        upload_ids = [CHUNKED_NAME.match(name).group(1) for name, _ in batch if CHUNKED_NAME.match(name)]
+        referenced = set(db.session.scalars(select(Blob.md5).where(Blob.md5.in_(md5_names))))
+        referenced |= set(db.session.scalars(
+            select(FileRecord.md5_filename).where(FileRecord.md5_filename.in_(md5_names))))
+        live_uploads = set(db.session.scalars(select(ChunkedUpload.id).where(ChunkedUpload.id.in_(upload_ids))))
+
+        for name, remove in batch:
+            if MD5_NAME.match(name):
+                orphan = name not in referenced
+            elif VARIANT_NAME.match(name):
+                orphan = VARIANT_NAME.match(name).group(1) not in referenced  # 原文件已删除的压缩版本
+            elif CHUNKED_NAME.match(name):
+                orphan = CHUNKED_NAME.match(name).group(1) not in live_uploads
+            else:
+                orphan = name.startswith('.upload-')  # 中断的流式上传留下的临时文件
+            if not orphan:
+                continue
+            size = remove()
+            if size is None:
+                continue
+            removed += 1
+            freed += size
+        _pause(settings)
+
+
+def _orphan_candidates(settings, storage, cutoff):
+    """生成修改时间早于 cutoff 的 (文件名, 删除函数)，删除函数返回释放的字节数"""
+    for name, size, mtime in storage.scan():
+        if mtime < cutoff:
+            yield name, partial(storage.delete, name)
+    try:
+        entries = os.scandir(settings.upload_folder)
+    except FileNotFoundError:
+        return
+    with entries:
+        for entry in entries:
+            try:
+                if entry.is_file() and entry.stat().st_mtime < cutoff:
+                    yield entry.name, partial(_remove_local, entry.path)
+            except FileNotFoundError:
+                continue
+
+
+def _remove_local(path):
+    """删除本地文件，返回字节数（文件已不存在时返回 None）"""
+    try:
+        size = os.path.getsize(path)
+        os.remove(path)
+    except FileNotFoundError:
+        return None
+    return size
+
+
+class CleanupScheduler:
+    """定时清理：Web 进程内由后台线程运行，独立 worker 进程中由 run_forever 运行"""
+
+    def __init__(self, app, storage, interval, on_removed=None, after_run=None, history_size=20):
+        self.app = app
+        self.storage = storage
+        self.interval = interval
+        self.on_removed = on_removed
+        self.after_run = after_run  # 每次清理后在同一应用上下文中调用，参数为清理结果
+        self.history = deque(maxlen=history_size)  # [(完成时间, 结果)]，最新的在最后
+        self.totals = Counter()
+        self.runs = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    @property
+    def last_run(self):
+        return self.history[-1] if self.history else None
+
+    def ensure_started(self):
+        """启动后台线程（每个进程一个，fork 后的子进程中重新启动）"""
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._pid != os.getpid() or self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._loop, name='cleanup-scheduler', daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def run_forever(self):
+        """独立 worker：立即清理一次，之后每隔 interval 秒清理一次"""
+        self._stop.clear()
+        while True:
+            self._run_logged()
+            if self._stop.wait(self.interval):
+                return
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self._run_logged()
+
+    def _run_logged(self):
+        try:
+            self.run_once()
+        except Exception:
+            self.app.logger.error("定时清理失败", exc_info=True)
+
+    def run_once(self, orphans=None):
+        """执行一次清理，其他进程正在清理时跳过并返回 None（orphans 见 run_cleanup）"""
+        with self.app.app_context():
+            settings = CleanupSettings(self.app.config)
+            lock = _acquire_lock(settings.upload_folder)
+            if lock is False:
+                return None
+            try:
+                result = run_cleanup(settings, self.storage, self.on_removed, orphans)
+                if self.after_run:
+                    self.after_run(result)
+            finally:
+                db.session.remove()
+                if lock is not None:
+                    lock.close()
+
+        self.runs += 1
+        self.totals.update({key: result[key] for key in RESULT_KEYS})
+        self.history.append((eastern8_now(), result))
+        self.app.logger.info("定时清理完成：" + format_result(result))
+        return result
+
+
+def _acquire_lock(folder):
+    """获取清理文件锁：成功返回锁文件对象，已被占用返回 False，平台不支持返回 None"""
+    if fcntl is None:
+        return None
+    os.makedirs(folder, exist_ok=True)
+    handle = open(os.path.join(folder, LOCK_NAME), 'a')
+    try:
+        fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        handle.close()
+        return False
+    return handle
+
+
+def format_result(result):
+    return (f"过期分享 {result['expired_files']}，已用完分享 {result['used_up_files']}，"
+            f"下载记录 {result['download_records']}，续传会话 {result['download_sessions']}，"
+            f"登录记录 {result['login_attempts']}，提取码尝试记录 {result['brute_force_states']}，分片上传 {result['chunked_uploads']}，"
+            f"小时统计 {result['stat_buckets']}，孤立文件 {result['orphan_files']}，"
+            f"释放 {result['bytes_freed']} 字节，耗时 {result['duration']:.2f} 秒")
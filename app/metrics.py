@@ -0,0 +1,287 @@
+"""运行指标（Prometheus 文本格式，GET /admin/metrics）
+
+启用后（python app.py --metrics 或环境变量 METRICS=1）记录：
+
+- 每个路由（Flask endpoint）的请求数（按方法和状态码）、延迟直方图、处理中的请求数、
+  请求体和响应体字节数（响应按 Content-Length 统计，X-Accel-Redirect 由 nginx 发送的文件体同样计入）
+- SQLAlchemy 查询：每条查询的耗时直方图（请求内 / 后台线程），每个请求的查询次数和数据库总耗时直方图
+- flask_limiter 的速率限制拒绝（按路由）、同一文件下载过于频繁的拒绝，以及提取码爆破和管理员登录的封锁
+
+未启用时不注册任何请求钩子和数据库事件，业务代码中的计数调用只做一次布尔判断。
+
+指标保存在进程内。gunicorn 多 worker 时每次抓取只会落到其中一个 worker，设置 METRICS_SHARED_DIR
+后各进程每 METRICS_SYNC_INTERVAL 秒把自己的指标写入该目录，抓取时合并所有进程（计数器和直方图
+求和，已退出进程的计数保留、处理中请求数丢弃），--serve 启动时清空该目录。
+"""
+import bisect
+import json
+import os
+import tempfile
+import threading
+import time
+
+from flask import request
+from sqlalchemy import event
+
+PREFIX = 'fileshare_'
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# 名称 -> (类型, 说明, 直方图分桶)
+METRICS = {
+    'http_requests_total': ('counter', '请求数', None),
+    'http_request_duration_seconds': ('histogram', '请求处理时间(秒)', LATENCY_BUCKETS),
+    'http_requests_in_flight': ('gauge', '正在处理的请求数', None),
+    'http_request_bytes_total': ('counter', '请求体字节数', None),
+    'http_response_bytes_total': ('counter', '响应体字节数（按 Content-Length）', None),
+    'db_query_duration_seconds': ('histogram', '单条 SQL 查询的耗时(秒)', QUERY_BUCKETS),
+    'db_queries_per_request': ('histogram', '每个请求执行的 SQL 查询数', QUERY_COUNT_BUCKETS),
+    'db_time_per_request_seconds': ('histogram', '每个请求的 SQL 查询总耗时(秒)', LATENCY_BUCKETS),
+    'rate_limit_rejections_total': ('counter', '速率限制拒绝的请求数', None),
+    'brute_force_blocks_total': ('counter', '爆破防护拒绝的尝试数', None),
+}
+
+
+class _RequestState:
+    __slots__ = ('start', 'endpoint', 'status', 'queries', 'query_time')
+
+    def __init__(self, endpoint):
+        self.start = time.perf_counter()
+        self.endpoint = endpoint
+        self.status = 500  # 未经过 after_request（未处理的异常）时按 500 计
+        self.queries = 0
+        self.query_time = 0.0
+
+
+class Metrics:
+    """进程内的指标注册表（线程安全）；labels 为 ((名称, 值), ...) 元组"""
+
+    def __init__(self, enabled=False, shared_dir=None, sync_interval=5):
+        self.enabled = enabled
+        self.shared_dir = shared_dir
+        self.sync_interval = sync_interval
+        self._values = {}  # (名称, labels) -> 计数器/仪表的值
+        self._histograms = {}  # (名称, labels) -> [各分桶计数..., sum, count]
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._thread = None
+        self._pid = None
+
+    # ---- 记录 ----
+
+    def inc(self, name, labels=(), amount=1):
+        if not self.enabled:
+            return
+        key = (name, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def observe(self, name, value, labels=()):
+        if not self.enabled:
+            return
+        buckets = METRICS[name][2]
+        key = (name, labels)
+        with self._lock:
+            data = self._histograms.get(key)
+            if data is None:
+                data = self._histograms[key] = [0] * (len(buckets) + 2)
+            data[bisect.bisect_left(buckets, value)] += 1  # 最后一个分桶之外的落在 +Inf 位置
+            data[-2] += value
+            data[-1] += 1
+
+    def rate_limit_rejected(self, limit):
+        self.inc('rate_limit_rejections_total', (('limit', limit),))
+
+    def brute_force_blocked(self, kind):
+        self.inc('brute_force_blocks_total', (('kind', kind),))
+
+    # ---- Flask / SQLAlchemy 集成 ----
+
+    def init_app(self, app, engine):
+        """注册请求钩子和数据库事件（未启用时什么都不做）"""
+        if not self.enabled:
+            return
+        # 放在最前面：flask_limiter 在自己的 before_request 中拒绝请求时也能计入
+        app.before_request_funcs.setdefault(None, []).insert(0, self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def on_limiter_breach(self, request_limit):
+        """flask_limiter 的 on_breach 回调"""
+        self.rate_limit_rejected(request.endpoint or 'unmatched')
+
+    def _before_request(self):
+        state = self._local.state = _RequestState(request.endpoint or 'unmatched')
+        labels = (('endpoint', state.endpoint),)
+        self.inc('http_requests_in_flight', labels)
+        if request.content_length:
+            self.inc('http_request_bytes_total', labels, request.content_length)
+        if self.shared_dir:
+            self._ensure_sync_thread()
+
+    def _after_request(self, response):
+        state = getattr(self._local, 'state', None)
+        if state is not None:
+            state.status = response.status_code
+            if response.content_length:
+                self.inc('http_response_bytes_total', (('endpoint', state.endpoint),), response.content_length)
+        return response
+
+    def _teardown_request(self, exc):
+        state = getattr(self._local, 'state', None)
+        if state is None:
+            return
+        self._local.state = None
+        labels = (('endpoint', state.endpoint),)
+        self.observe('http_request_duration_seconds', time.perf_counter() - state.start, labels)
+        self.inc('http_requests_total', (('endpoint', state.endpoint), ('method', request.method),
+                                         ('status', str(state.status))))
+        self.inc('http_requests_in_flight', labels, -1)
+        self.observe('db_queries_per_request', state.queries, labels)
+        self.observe('db_time_per_request_seconds', state.query_time, labels)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('metrics_query_start', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get('metrics_query_start')
+        if not starts:
+            return
+        elapsed = time.perf_counter() - starts.pop()
+        state = getattr(self._local, 'state', None)
+        if state is not None:
+            state.queries += 1
+            state.query_time += elapsed
+        self.observe('db_query_duration_seconds', elapsed,
+                     (('context', 'request' if state is not None else 'background'),))
+
+    # ---- 多进程汇总 ----
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'values': [[name, list(labels), value] for (name, labels), value in self._values.items()],
+                'histograms': [[name, list(labels), list(data)] for (name, labels), data in self._histograms.items()],
+            }
+
+    def sync(self):
+        """把本进程的指标写入共享目录（原子替换）"""
+        if not self.enabled or not self.shared_dir:
+            return
+        os.makedirs(self.shared_dir, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(prefix='.metrics-', dir=self.shared_dir)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(temp_path, os.path.join(self.shared_dir, f'metrics-{os.getpid()}.json'))
+
+    def reset_shared_dir(self):
+        """清空共享目录中上次运行留下的指标（服务器启动时调用）"""
+        if not self.shared_dir or not os.path.isdir(self.shared_dir):
+            return
+        for name in os.listdir(self.shared_dir):
+            if name.startswith('metrics-') and name.endswith('.json'):
+                os.remove(os.path.join(self.shared_dir, name))
+
+    def _ensure_sync_thread(self):
+        # 多进程服务器 fork 后子进程中没有父进程的线程，需要按进程启动
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid != os.getpid() or self._thread is None or not self._thread.is_alive():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._sync_loop, name='metrics-sync', daemon=True)
+                self._thread.start()
+
+    def _sync_loop(self):
+        while True:
+            time.sleep(self.sync_interval)
+            try:
+                self.sync()
+            except OSError:
+                pass
+
+    def _collect(self):
+        """本进程和共享目录中其他进程的指标，返回 (values, histograms)"""
+        values, histograms = {}, {}
+
+        def merge(snapshot, include_gauges):
+            for name, labels, value in snapshot['values']:
+                if METRICS[name][0] == 'gauge' and not include_gauges:
+                    continue
+                key = (name, tuple(tuple(pair) for pair in labels))
+                values[key] = values.get(key, 0) + value
+            for name, labels, data in snapshot['histograms']:
+                key = (name, tuple(tuple(pair) for pair in labels))
+                if key in histograms:
+                    histograms[key] = [a + b for a, b in zip(histograms[key], data)]
+                else:
+                    histograms[key] = list(data)
+
+        merge(self.snapshot(), True)
+        if self.shared_dir and os.path.isdir(self.shared_dir):
+            for filename in os.listdir(self.shared_dir):
+                if not (filename.startswith('metrics-') and filename.endswith('.json')):
+                    continue
+                pid = int(filename[len('metrics-'):-len('.json')])
+                if pid == os.getpid():
+                    continue
+                try:
+                    with open(os.path.join(self.shared_dir, filename)) as f:
+                        snapshot = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                merge(snapshot, _process_alive(pid))
+        return values, histograms
+
+    # ---- 输出 ----
+
+    def render(self):
+        """Prometheus 文本格式（0.0.4）"""
+        values, histograms = self._collect()
+        lines = []
+        for name, (kind, help_text, buckets) in METRICS.items():
+            full_name = PREFIX + name
+            lines.append(f'# HELP {full_name} {help_text}')
+            lines.append(f'# TYPE {full_name} {kind}')
+            if kind == 'histogram':
+                for (metric, labels), data in sorted(histograms.items()):
+                    if metric != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(list(buckets) + ['+Inf'], data[:-2]):
+                        cumulative += count
+                        lines.append(f'{full_name}_bucket{_labels(labels + (("le", _number(bound)),))} {cumulative}')
+                    lines.append(f'{full_name}_sum{_labels(labels)} {_number(data[-2])}')
+                    lines.append(f'{full_name}_count{_labels(labels)} {data[-1]}')
+            else:
+                for (metric, labels), value in sorted(values.items()):
+                    if metric == name:
+                        lines.append(f'{full_name}{_labels(labels)} {_number(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    escaped = (f'{key}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+               for key, value in labels)
+    return '{' + ','.join(escaped) + '}'
+
+
+def _number(value):
+    if isinstance(value, str):
+        return value
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
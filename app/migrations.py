@@ -0,0 +1,68 @@
+"""数据库结构迁移
+
+db.create_all() 只会创建不存在的表，已有数据库不会获得新增的索引或结构变更。这里按版本号
+依次执行迁移，已执行的版本记录在 schema_version 表中；每个迁移都写成可重复执行的形式，
+多个 worker 同时启动时也不会出错。新的迁移只能追加到 MIGRATIONS 末尾。
+"""
+from sqlalchemy import inspect
+from sqlalchemy.exc import DatabaseError
+from sqlalchemy.schema import CreateColumn
+
+from models import db, SchemaVersion, eastern8_now
+from search_index import create_search_index
+
+
+def ensure_declared_indexes(conn):
+    """创建模型中声明但数据库里还不存在的索引"""
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=conn, checkfirst=True)
+
+
+def add_missing_columns(conn):
+    """为已有的表添加模型中新增的列（新增的列必须可为空或带 server_default）"""
+    inspector = inspect(conn)
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue  # 新表由 db.create_all() 创建
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                ddl = CreateColumn(column).compile(dialect=conn.dialect)
+                conn.exec_driver_sql(f'ALTER TABLE {conn.dialect.identifier_preparer.quote(table.name)} ADD COLUMN {ddl}')
+
+
+# (版本号, 说明, 迁移函数)
+MIGRATIONS = [
+    (1, '为后台列表、统计、清理、下载频率和登录防护的查询添加索引', ensure_declared_indexes),
+    (2, '为后台按文件分页查看下载记录添加索引', ensure_declared_indexes),
+    (3, '为后台搜索创建全文索引（SQLite FTS5）及同步触发器', create_search_index),
+    (4, '为定时清理已用完的分享和旧登录记录添加索引', ensure_declared_indexes),
+    (5, '文件记录增加压缩传输节省的流量（bytes_saved）', add_missing_columns),
+    (6, '多文件分享：文件记录增加 is_bundle，文件实体增加 crc32', add_missing_columns),
+]
+
+
+def current_version():
+    return db.session.query(db.func.max(SchemaVersion.version)).scalar() or 0
+
+
+def run_migrations():
+    """执行尚未应用的迁移，返回当前版本号"""
+    version = current_version()
+    for number, description, migrate in MIGRATIONS:
+        if number <= version:
+            continue
+        try:
+            with db.engine.begin() as conn:
+                migrate(conn)
+                conn.execute(SchemaVersion.__table__.insert().values(
+                    version=number, description=description, applied_at=eastern8_now()))
+        except DatabaseError:
+            # 其他 worker 可能已经执行了同一个迁移
+            db.session.rollback()
+            if current_version() < number:
+                raise
+        version = number
+    db.session.commit()
+    return version
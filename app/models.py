@@ -1,28 +1,76 @@
-from datetime import datetime,timedelta
+from datetime import datetime
 import pytz
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, update, or_
 import os
-from werkzeug.utils import secure_filename
 import re
 import hashlib
-from config import Config
 
 # 设置时区为东八区
 EASTERN_8 = pytz.timezone('Asia/Shanghai')
 
 
+def eastern8_now():
+    """当前东八区时间（去掉时区信息），作为新增模型时间列的默认值（每次插入时求值）"""
+    return datetime.now(EASTERN_8).replace(tzinfo=None)
+
+
 # 数据库初始化和配置
 db = SQLAlchemy()  # 创建SQLAlchemy实例，用于数据库操作
 
-def init_db(app):
-    """初始化数据库配置"""
+def init_db(app, database_url=None):
+    """初始化数据库配置
+
+    数据库地址优先使用参数 database_url，其次是配置项 DATABASE_URL，都未设置时使用
+    app 目录下的 SQLite 数据库 filecodes.db。SQLite 连接建立时会应用 SQLITE_PRAGMAS 中的性能参数。
+    """
     basedir = os.path.abspath(os.path.dirname(__file__))  # 获取当前文件所在目录的绝对路径
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(basedir, 'filecodes.db')  # 使用SQLite数据库，文件名为filecodes.db
+    database_url = database_url or app.config.get('DATABASE_URL') or 'sqlite:///' + os.path.join(basedir, 'filecodes.db')
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False  # 禁用SQLAlchemy的事件系统（节省资源）
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config, database_url))
     
     db.init_app(app)  # 绑定Flask应用
     with app.app_context():
-        db.create_all()  # 创建所有定义的表
+        if db.engine.dialect.name == 'sqlite':
+            apply_sqlite_pragmas(db.engine, app.config['SQLITE_PRAGMAS'])
+        db.create_all()  # 创建所有定义的表（已存在的表不会被修改）
+        from migrations import run_migrations
+        run_migrations()  # 为已有数据库补齐索引等结构变更
+
+
+def engine_options(config, database_url):
+    """连接池参数：SQLite 文件库允许跨线程复用连接，其他数据库开启连接检测和定期回收"""
+    options = {
+        'pool_size': config['DATABASE_POOL_SIZE'],
+        'max_overflow': config['DATABASE_MAX_OVERFLOW'],
+        'pool_timeout': config['DATABASE_POOL_TIMEOUT'],
+    }
+    if database_url.startswith('sqlite'):
+        if database_url in ('sqlite://', 'sqlite:///:memory:'):
+            return {}  # 内存库使用 SQLAlchemy 默认的单连接池
+        # busy_timeout 由 PRAGMA 设置，这里的 timeout 是驱动层的等待时间，两者保持一致
+        options['connect_args'] = {
+            'check_same_thread': False,
+            'timeout': config['SQLITE_PRAGMAS'].get('busy_timeout', 5000) / 1000,
+        }
+    else:
+        options['pool_pre_ping'] = True
+        options['pool_recycle'] = 1800
+    return options
+
+
+def apply_sqlite_pragmas(engine, pragmas):
+    """每个新建的 SQLite 连接都应用一次 PRAGMA（journal_mode=WAL 会持久化到数据库文件）"""
+    if not pragmas:
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
 
 
 # 数据模型（文件记录表）
@@ -34,21 +82,39 @@ class FileRecord(db.Model):
     file_size = db.Column(db.Integer)  # 文件大小（字节）
     file_type = db.Column(db.String(32))  # 文件扩展名（如pdf、jpg）
     uploader_ip = db.Column(db.String(45))  # 上传者IP（支持IPv6，最长45字符）
-    created_at = db.Column(db.DateTime, default=datetime.now(EASTERN_8))  # 创建时间（UTC）
+    created_at = db.Column(db.DateTime, default=eastern8_now)  # 创建时间（东八区，插入时求值）
     expires_at = db.Column(db.DateTime(timezone=True))  # 添加 timezone=True
     download_count = db.Column(db.Integer, default=0)  # 下载次数统计
     max_downloads = db.Column(db.Integer, default=1)  # 最大允许下载次数（0表示无限制）
     is_active = db.Column(db.Boolean, default=True)  # 是否启用（管理员可禁用）
     description = db.Column(db.String(500))  # 文件描述（可选）
+    bytes_saved = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')  # 压缩传输节省的下载流量（字节）
+    is_bundle = db.Column(db.Boolean, nullable=False, default=False, server_default='0')  # 多文件分享（文件见 ShareItem，下载时打包为 ZIP）
+
+    __table_args__ = (
+        db.Index('ix_file_record_created_at', 'created_at'),  # 后台列表按上传时间排序
+        db.Index('ix_file_record_active_created', 'is_active', 'created_at'),  # 有效文件统计
+        db.Index('ix_file_record_expires_at', 'expires_at'),  # cleanup 查找过期文件
+        db.Index('ix_file_record_md5_filename', 'md5_filename'),  # 按文件实体汇总引用
+        # 定时清理查找下载次数已用完的分享（部分索引，只包含已用完的行）
+        db.Index('ix_file_record_used_up', 'id',
+                 sqlite_where=db.text('max_downloads > 0 AND download_count >= max_downloads'),
+                 postgresql_where=db.text('max_downloads > 0 AND download_count >= max_downloads')),
+    )
 
     # 关联关系：一对多（一个文件对应多条下载记录）
     downloads = db.relationship('DownloadRecord', backref='file', lazy=True, cascade="all, delete-orphan")
+    download_sessions = db.relationship('DownloadSession', backref='file', lazy=True, cascade="all, delete-orphan")
+    items = db.relationship('ShareItem', lazy=True, cascade="all, delete-orphan", order_by='ShareItem.position')
 
-    def is_valid(self):
-        """检查文件是否有效（未过期、未超下载次数、已启用）"""
+    def is_valid(self, check_quota=True):
+        """检查文件是否有效（未过期、未超下载次数、已启用）
+
+        check_quota=False 时不检查下载次数，用于断点续传：续传属于已计数的那次下载。
+        """
         if not self.is_active:
             return False
-        if self.max_downloads > 0 and self.download_count >= self.max_downloads:
+        if check_quota and self.max_downloads > 0 and self.download_count >= self.max_downloads:
             return False
         if self.expires_at :
             now = datetime.now(EASTERN_8)
@@ -56,14 +122,131 @@ class FileRecord(db.Model):
             return now <= expires_at
         return True
     
+def claim_download(file_id, now):
+    """用一条条件 UPDATE 原子地检查有效性与下载配额并增加下载计数（需调用方提交事务），返回是否成功
+
+    并发下载同一文件时不会出现读-改-写竞争，下载次数不会超过 max_downloads。
+    """
+    result = db.session.execute(
+        update(FileRecord).where(
+            FileRecord.id == file_id,
+            FileRecord.is_active == True,
+            or_(FileRecord.max_downloads <= 0, FileRecord.download_count < FileRecord.max_downloads),
+            or_(FileRecord.expires_at == None, FileRecord.expires_at >= now)
+        ).values(download_count=FileRecord.download_count + 1),
+        execution_options={'synchronize_session': False}
+    )
+    return result.rowcount == 1
+
+
+# 文件实体表（内容寻址：同一MD5只存一份物理文件）
+class Blob(db.Model):
+    md5 = db.Column(db.String(32), primary_key=True)  # 文件MD5，即上传目录中的存储名
+    size = db.Column(db.Integer)  # 文件大小（字节）
+    ref_count = db.Column(db.Integer, nullable=False, default=0)  # 引用该文件的 FileRecord 和 ShareItem 数量
+    created_at = db.Column(db.DateTime, default=eastern8_now)  # 首次上传时间
+    crc32 = db.Column(db.BigInteger)  # 文件的 CRC32（打包下载的 ZIP 文件头需要），首次打包时计算
+
+# 多文件分享中的文件（一个提取码对应多个文件实体，见 bundle.py）
+class ShareItem(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    file_id = db.Column(db.Integer, db.ForeignKey('file_record.id'), nullable=False)  # 所属的多文件分享
+    position = db.Column(db.Integer, nullable=False)  # 在 ZIP 中的顺序
+    md5 = db.Column(db.String(32), nullable=False)  # 文件实体MD5
+    filename = db.Column(db.String(512), nullable=False)  # ZIP 中的路径（以 / 分隔的相对路径）
+    size = db.Column(db.BigInteger, nullable=False)  # 文件大小（字节）
+
+    __table_args__ = (
+        db.Index('ix_share_item_file_position', 'file_id', 'position'),  # 按顺序加载分享中的文件
+        db.Index('ix_share_item_md5', 'md5'),  # 重建引用计数
+    )
+
+# 文件实体的压缩版本（见 compression.py），每个文件实体每种编码一行
+class BlobVariant(db.Model):
+    md5 = db.Column(db.String(32), primary_key=True)  # 原文件MD5
+    encoding = db.Column(db.String(16), primary_key=True)  # Content-Encoding（gzip、zstd）
+    size = db.Column(db.BigInteger, nullable=False)  # 压缩后的大小（字节）
+    stored = db.Column(db.Boolean, nullable=False, default=True)  # 是否已保存；压缩效果不足时为 False，只记录结果避免重复压缩
+    created_at = db.Column(db.DateTime, default=eastern8_now)
+
+# 后台统计计数器（增量维护，见 stats.py）
+class StatCounter(db.Model):
+    name = db.Column(db.String(32), primary_key=True)  # 计数器名称
+    value = db.Column(db.BigInteger, nullable=False, default=0)  # 当前值
+
+# 按小时汇总的上传/下载统计
+class StatHourly(db.Model):
+    bucket = db.Column(db.DateTime, primary_key=True)  # 整点时间（东八区）
+    uploads = db.Column(db.Integer, nullable=False, default=0)  # 上传文件数
+    downloads = db.Column(db.Integer, nullable=False, default=0)  # 下载次数
+    bytes_served = db.Column(db.BigInteger, nullable=False, default=0)  # 下载的字节数
+
 # 下载记录表
 class DownloadRecord(db.Model):
     id = db.Column(db.Integer, primary_key=True)  # 主键ID
     file_id = db.Column(db.Integer, db.ForeignKey('file_record.id'), nullable=False)  # 外键关联FileRecord
     downloader_ip = db.Column(db.String(45))  # 下载者IP
-    download_time = db.Column(db.DateTime, default=datetime.now(EASTERN_8))  # 下载时间（UTC）
+    download_time = db.Column(db.DateTime, default=eastern8_now)  # 下载时间（东八区，插入时求值）
     user_agent = db.Column(db.String(256))  # 用户浏览器标识（用于日志分析）
 
+    __table_args__ = (
+        db.Index('ix_download_record_file_ip_time', 'file_id', 'downloader_ip', 'download_time'),  # 下载频率检查
+        db.Index('ix_download_record_file_time', 'file_id', 'download_time'),  # 文件最近的下载记录（后台分页）
+        db.Index('ix_download_record_time', 'download_time'),  # cleanup 清理旧记录
+    )
+
+
+# 下载会话表（一次逻辑下载内的多个 Range 请求只计数一次）
+class DownloadSession(db.Model):
+    id = db.Column(db.Integer, primary_key=True)  # 主键ID
+    file_id = db.Column(db.Integer, db.ForeignKey('file_record.id'), nullable=False)  # 外键关联FileRecord
+    downloader_ip = db.Column(db.String(45))  # 下载者IP
+    started_at = db.Column(db.DateTime, default=eastern8_now)  # 会话开始时间（即计数的那次下载）
+    last_seen = db.Column(db.DateTime)  # 最近一次请求时间
+    bytes_served = db.Column(db.BigInteger, default=0)  # 各次请求的字节数之和（含重传）
+    request_count = db.Column(db.Integer, default=0)  # 会话内的请求次数
+
+    __table_args__ = (
+        db.Index('ix_download_session_file_ip_seen', 'file_id', 'downloader_ip', 'last_seen'),  # 查找可续传的会话
+        db.Index('ix_download_session_last_seen', 'last_seen'),  # cleanup 清理旧会话
+    )
+
+
+# 分片上传任务表（init 创建，finalize 后删除）
+class ChunkedUpload(db.Model):
+    id = db.Column(db.String(32), primary_key=True)  # 上传任务ID（随机十六进制串）
+    original_filename = db.Column(db.String(256), nullable=False)  # 原始文件名
+    total_size = db.Column(db.BigInteger, nullable=False)  # 文件总大小（字节）
+    chunk_size = db.Column(db.Integer, nullable=False)  # 分片大小（最后一片可以更小）
+    expire_days = db.Column(db.Integer)  # 完成后文件记录的有效期（天）
+    max_downloads = db.Column(db.Integer, default=1)  # 完成后文件记录的最大下载次数
+    description = db.Column(db.String(500))  # 文件描述
+    uploader_ip = db.Column(db.String(45))  # 上传者IP
+    created_at = db.Column(db.DateTime, default=eastern8_now)  # 创建时间
+
+    __table_args__ = (
+        db.Index('ix_chunked_upload_created_at', 'created_at'),  # cleanup 清理未完成的上传
+    )
+
+    chunks = db.relationship('UploadChunk', backref='upload', lazy=True, cascade="all, delete-orphan")
+
+    @property
+    def chunk_count(self):
+        """分片总数"""
+        return max(1, -(-self.total_size // self.chunk_size))
+
+# 已接收的分片（用于多 worker 并行上传时判断是否收齐）
+class UploadChunk(db.Model):
+    upload_id = db.Column(db.String(32), db.ForeignKey('chunked_upload.id'), primary_key=True)
+    chunk_index = db.Column(db.Integer, primary_key=True)  # 分片序号（从0开始）
+
+
+# 数据库结构版本（见 migrations.py）
+class SchemaVersion(db.Model):
+    version = db.Column(db.Integer, primary_key=True)  # 迁移版本号
+    description = db.Column(db.String(200))  # 迁移说明
+    applied_at = db.Column(db.DateTime, default=eastern8_now)  # 执行时间
+
 
 # 工具函数
 def generate_md5_filename(file_stream):
@@ -92,47 +275,26 @@ def safe_filename(filename):
     return f"{basename}{ext}"
 
 
+# 提取码爆破防护的共享尝试记录（BRUTE_FORCE_STORAGE = 'database' 时使用，见 brute_force.py）
+class BruteForceState(db.Model):
+    ip = db.Column(db.String(45), primary_key=True)  # 尝试者IP
+    attempts = db.Column(db.String(200), nullable=False, default='')  # 窗口内最近几次尝试的时间戳（逗号分隔）
+    blocked_until = db.Column(db.Float, nullable=False, default=0)  # 封锁截止时间戳，0 表示未封锁
+    expires_at = db.Column(db.Float, nullable=False, index=True)  # 记录失效时间戳，之后可由定时清理删除
+    version = db.Column(db.Integer, nullable=False, default=1)  # 乐观并发控制版本号
+
+
 # 创建管理员登录尝试记录模型
 class AdminLoginAttempt(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     ip = db.Column(db.String(45), nullable=False)
-    attempt_time = db.Column(db.DateTime, default=datetime.now(EASTERN_8))
+    attempt_time = db.Column(db.DateTime, default=eastern8_now)
     username = db.Column(db.String(50))
     blocked_until = db.Column(db.DateTime(timezone=True))
     successful = db.Column(db.Boolean, default=False)
 
-# 管理员登录防护函数
-def check_admin_login_attempt(ip):
-    now = datetime.now(EASTERN_8)
-    block_time = timedelta(seconds=Config.ADMIN_LOGIN_BLOCK_TIME)
-    
-    # 检查是否已被封锁
-    blocked = AdminLoginAttempt.query.filter(
-        AdminLoginAttempt.ip == ip,
-        AdminLoginAttempt.blocked_until > now
-    ).first()
-    
-    if blocked:
-        remaining_time = (blocked.blocked_until - now).seconds
-        return False, f"管理员登录尝试过于频繁，请等待 {remaining_time} 秒后再试"
-    
-    # 检查最近失败尝试次数
-    recent_failures = AdminLoginAttempt.query.filter(
-        AdminLoginAttempt.ip == ip,
-        AdminLoginAttempt.attempt_time > now - block_time,
-        AdminLoginAttempt.successful == False
-    ).count()
-    
-    if recent_failures >= Config.ADMIN_LOGIN_ATTEMPTS:
-        # 封锁IP
-        blocked_until = now + block_time
-        new_block = AdminLoginAttempt(
-            ip=ip,
-            blocked_until=blocked_until,
-            successful=False
-        )
-        db.session.add(new_block)
-        db.session.commit()
-        return False, f"管理员登录尝试次数过多，IP已被暂时封锁{block_time.total_seconds()/60}分钟"
-    
-    return True, ""
\ No newline at end of file
+    __table_args__ = (
+        db.Index('ix_admin_login_ip_blocked', 'ip', 'blocked_until'),  # 是否处于封锁期
+        db.Index('ix_admin_login_ip_success_time', 'ip', 'successful', 'attempt_time'),  # 最近失败次数
+        db.Index('ix_admin_login_attempt_time', 'attempt_time'),  # 定时清理旧登录记录
+    )
@@ -0,0 +1,108 @@
+"""热点查询的执行计划检查（SQLite）
+
+对后台列表、统计、清理、下载频率和登录防护用到的查询执行 EXPLAIN QUERY PLAN，
+出现全表扫描（SCAN 且未使用索引）或临时排序（TEMP B-TREE）即视为未命中索引。
+admin_home 的 SUM(download_count) 需要读取所有行，不在检查范围内。
+"""
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select, tuple_
+
+from models import db, eastern8_now, FileRecord, DownloadRecord, DownloadSession, AdminLoginAttempt, ChunkedUpload
+
+
+def hot_queries():
+    """返回 [(名称, select 语句)]，条件与应用中的查询保持一致"""
+    now = eastern8_now()
+    ip = '127.0.0.1'
+    return [
+        ('admin_files 键集分页',
+         select(FileRecord).where(tuple_(FileRecord.created_at, FileRecord.id) < (now, 100))
+         .order_by(FileRecord.created_at.desc(), FileRecord.id.desc()).limit(21)),
+        ('admin_search 提取码精确匹配',
+         select(FileRecord).where(FileRecord.code == 'ABC123').limit(1)),
+        ('admin_home 文件总数',
+         select(func.count()).select_from(FileRecord)),
+        ('admin_home 有效文件数',
+         select(func.count()).select_from(FileRecord).where(FileRecord.is_active == True)),
+        ('admin_home 最近上传',
+         select(FileRecord).order_by(FileRecord.created_at.desc()).limit(5)),
+        ('cleanup 过期文件',
+         select(FileRecord.id).where(FileRecord.expires_at < now).limit(500)),
+        ('cleanup 下载次数已用完的分享',
+         select(FileRecord.id).where(
+             FileRecord.max_downloads > 0,
+             FileRecord.download_count >= FileRecord.max_downloads,
+             ~select(DownloadSession.id).where(
+                 DownloadSession.file_id == FileRecord.id,
+                 DownloadSession.last_seen > now - timedelta(minutes=30)).exists()
+         ).limit(500)),
+        ('cleanup 旧登录记录',
+         select(AdminLoginAttempt.id).where(
+             AdminLoginAttempt.attempt_time < now - timedelta(days=7),
+             (AdminLoginAttempt.blocked_until == None) | (AdminLoginAttempt.blocked_until < now)
+         ).limit(500)),
+        ('cleanup 旧下载记录',
+         select(DownloadRecord.id).where(DownloadRecord.download_time < now - timedelta(days=30))),
+        ('cleanup 旧下载会话',
+         select(DownloadSession.id).where(DownloadSession.last_seen < now - timedelta(days=30))),
+        ('cleanup 未完成的分片上传',
+         select(ChunkedUpload.id).where(ChunkedUpload.created_at < now - timedelta(hours=24))),
+        ('check_download_frequency（database 后端）',
+         select(func.count()).select_from(DownloadRecord).where(
+             DownloadRecord.downloader_ip == ip,
+             DownloadRecord.file_id == 1,
+             DownloadRecord.download_time > now - timedelta(minutes=5))),
+        ('文件的最近下载记录',
+         select(DownloadRecord.id).where(DownloadRecord.file_id == 1)
+         .order_by(DownloadRecord.download_time.desc(), DownloadRecord.id.desc()).limit(6)),
+        ('文件的下载记录键集分页',
+         select(DownloadRecord).where(
+             DownloadRecord.file_id == 1,
+             tuple_(DownloadRecord.download_time, DownloadRecord.id) < (now, 100))
+         .order_by(DownloadRecord.download_time.desc(), DownloadRecord.id.desc()).limit(21)),
+        ('find_active_session',
+         select(DownloadSession).where(
+             DownloadSession.file_id == 1,
+             DownloadSession.downloader_ip == ip,
+             DownloadSession.last_seen > now - timedelta(minutes=30)
+         ).order_by(DownloadSession.last_seen.desc()).limit(1)),
+        ('admin_login_throttle 加载封锁状态',
+         select(AdminLoginAttempt).where(
+             AdminLoginAttempt.ip == ip,
+             AdminLoginAttempt.blocked_until > now).limit(1)),
+        ('admin_login_throttle 加载最近失败',
+         select(func.count()).select_from(AdminLoginAttempt).where(
+             AdminLoginAttempt.ip == ip,
+             AdminLoginAttempt.attempt_time > now - timedelta(minutes=5),
+             AdminLoginAttempt.successful == False)),
+    ]
+
+
+def uses_index(plan):
+    """执行计划中没有全表扫描和临时排序"""
+    for detail in plan:
+        if detail.startswith('SCAN') and 'USING' not in detail:
+            return False
+        if 'TEMP B-TREE' in detail:
+            return False
+    return True
+
+
+def explain(stmt):
+    """返回语句的 EXPLAIN QUERY PLAN 明细"""
+    compiled = stmt.compile(dialect=db.engine.dialect)
+    params = tuple(_plain(compiled.params[key]) for key in compiled.positiontup)
+    rows = db.session.connection().exec_driver_sql('EXPLAIN QUERY PLAN ' + str(compiled), params).all()
+    return [row[-1] for row in rows]
+
+
+def _plain(value):
+    # 参数值不影响执行计划，时间转成字符串即可
+    return value.isoformat(' ') if isinstance(value, datetime) else value
+
+
+def check_query_plans():
+    """返回 [(名称, 是否命中索引, 执行计划明细)]"""
+    return [(name, uses_index(plan), plan)
+            for name, plan in ((name, explain(stmt)) for name, stmt in hot_queries())]
@@ -0,0 +1,58 @@
+"""下载频率检查的滑动窗口后端
+
+check_download_frequency 原来每次下载都对 download_record 做一次 COUNT(*)，随着下载记录增长
+越来越慢。这里把“同一IP在窗口内对同一文件的下载次数”交给可替换的后端：
+
+- ``memory://``（默认）：进程内滑动窗口，多 worker 时各自计数
+- ``redis://``、``memcached://`` 等 limits 支持的存储：多 worker 共享同一个窗口
+- ``database``：沿用原来的下载记录计数（多 worker 一致，但需要查询数据库）
+"""
+from datetime import timedelta
+
+from limits import RateLimitItemPerMinute
+from limits.storage import storage_from_string
+from limits.strategies import MovingWindowRateLimiter
+
+from models import DownloadRecord, eastern8_now
+
+
+class LimitsRateWindow:
+    """基于 limits 的滑动窗口，存储由 URI 决定"""
+
+    def __init__(self, storage_uri, limit, window_minutes):
+        self.item = RateLimitItemPerMinute(limit, window_minutes)
+        self.limiter = MovingWindowRateLimiter(storage_from_string(storage_uri))
+
+    def allow(self, ip, file_id):
+        """窗口内的下载次数是否仍低于上限"""
+        return self.limiter.test(self.item, 'download', ip, str(file_id))
+
+    def record(self, ip, file_id):
+        """记录一次已计数的下载"""
+        self.limiter.hit(self.item, 'download', ip, str(file_id))
+
+
+class DatabaseRateWindow:
+    """按下载记录计数（原有实现），下载记录由调用方写入"""
+
+    def __init__(self, limit, window_minutes):
+        self.limit = limit
+        self.window = timedelta(minutes=window_minutes)
+
+    def allow(self, ip, file_id):
+        recent_downloads = DownloadRecord.query.filter(
+            DownloadRecord.downloader_ip == ip,
+            DownloadRecord.file_id == file_id,
+            DownloadRecord.download_time > eastern8_now() - self.window
+        ).count()
+        return recent_downloads < self.limit
+
+    def record(self, ip, file_id):
+        pass
+
+
+def create_rate_window(storage_uri, limit, window_minutes):
+    """根据配置创建下载频率窗口"""
+    if storage_uri == 'database':
+        return DatabaseRateWindow(limit, window_minutes)
+    return LimitsRateWindow(storage_uri, limit, window_minutes)
@@ -0,0 +1,163 @@
+"""后台文件搜索（SQLite FTS5 全文索引）
+
+- file_search 是以 file_record 为外部内容表的 FTS5 虚拟表，使用 trigram 分词，支持与
+  LIKE '%q%' 相同的子串匹配（包括中文文件名），但只读取命中的行
+- 由 file_record 上的触发器保持同步；更新触发器只监听文件名、提取码和描述三列，
+  下载计数等高频更新不会改写索引
+- 结果按 bm25 相关度排序（文件名权重最高），提取码完全匹配时通过唯一索引查到并排在最前
+- 少于 3 个字符的查询（trigram 无法匹配）、非 SQLite 数据库或索引不存在时退回 LIKE 查询
+"""
+from sqlalchemy import text
+from sqlalchemy.exc import DatabaseError
+
+from models import db, FileRecord
+from admin_queries import KeysetPage, paginate_files
+
+SEARCH_TABLE = 'file_search'
+MIN_QUERY_LENGTH = 3  # trigram 分词的最小匹配长度
+RANK_WEIGHTS = 'bm25(10.0, 5.0, 1.0)'  # 文件名、提取码、描述
+
+SCHEMA = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(
+        original_filename, code, description,
+        content='file_record', content_rowid='id', tokenize='trigram')""",
+    f"""CREATE TRIGGER IF NOT EXISTS file_search_insert AFTER INSERT ON file_record BEGIN
+        INSERT INTO {SEARCH_TABLE}(rowid, original_filename, code, description)
+        VALUES (new.id, new.original_filename, new.code, new.description);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS file_search_delete AFTER DELETE ON file_record BEGIN
+        INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, original_filename, code, description)
+        VALUES ('delete', old.id, old.original_filename, old.code, old.description);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS file_search_update
+        AFTER UPDATE OF original_filename, code, description ON file_record BEGIN
+        INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, original_filename, code, description)
+        VALUES ('delete', old.id, old.original_filename, old.code, old.description);
+        INSERT INTO {SEARCH_TABLE}(rowid, original_filename, code, description)
+        VALUES (new.id, new.original_filename, new.code, new.description);
+    END""",
+]
+
+
+def fts5_supported(conn):
+    """当前连接是否为支持 FTS5 的 SQLite"""
+    if conn.dialect.name != 'sqlite':
+        return False
+    try:
+        return conn.exec_driver_sql("SELECT 1 FROM pragma_module_list WHERE name = 'fts5'").first() is not None
+    except DatabaseError:
+        return False
+
+
+def create_search_index(conn):
+    """创建全文索引和同步触发器，并用现有文件记录填充索引（迁移中调用，可重复执行）"""
+    if not fts5_supported(conn):
+        return False
+    for statement in SCHEMA:
+        conn.exec_driver_sql(statement)
+    conn.exec_driver_sql(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('rebuild')")
+    return True
+
+
+def rebuild_search_index():
+    """重建全文索引，返回索引的文件数；数据库不支持 FTS5 时返回 None"""
+    with db.engine.begin() as conn:
+        if not create_search_index(conn):
+            return None
+    return FileRecord.query.count()
+
+
+_index_ready = {}
+
+
+def search_index_ready():
+    """全文索引是否可用（按数据库地址缓存检查结果）"""
+    url = str(db.engine.url)
+    if url not in _index_ready:
+        with db.engine.connect() as conn:
+            _index_ready[url] = fts5_supported(conn) and conn.exec_driver_sql(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (SEARCH_TABLE,)
+            ).first() is not None
+    return _index_ready[url]
+
+
+def match_expression(query):
+    """把用户输入转换为 FTS5 短语查询（整体作为子串匹配，双引号转义）"""
+    return '"' + query.replace('"', '""') + '"'
+
+
+def encode_rank_cursor(score, file_id):
+    return f"{score!r}_{file_id}"
+
+
+def decode_rank_cursor(cursor):
+    try:
+        score, file_id = cursor.rsplit('_', 1)
+        return float(score), int(file_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def like_filter(query):
+    search = f"%{query}%"
+    return (
+        (FileRecord.original_filename.like(search)) |
+        (FileRecord.code.like(search)) |
+        (FileRecord.description.like(search))
+    )
+
+
+def search_files(query, per_page, after=None, before=None):
+    """搜索文件名、提取码或描述，返回 KeysetPage
+
+    全文索引可用时按相关度分页（游标为 "<得分>_<id>"），否则按上传时间分页。
+    """
+    if len(query) < MIN_QUERY_LENGTH or not search_index_ready():
+        return paginate_files(FileRecord.query.filter(like_filter(query)), per_page, after, before)
+
+    # 提取码完全匹配走唯一索引，固定排在第一页最前面，全文结果中排除它
+    exact = FileRecord.query.filter(FileRecord.code == query).first()
+    exclude_id = exact.id if exact else 0
+
+    sql = f"""
+        SELECT id, score FROM (
+            SELECT rowid AS id, rank AS score FROM {SEARCH_TABLE}
+            WHERE {SEARCH_TABLE} MATCH :match AND rank MATCH :weights
+        )
+        WHERE id != :exclude_id {{condition}}
+        ORDER BY {{order}} LIMIT :limit
+    """
+    params = {'match': match_expression(query), 'weights': RANK_WEIGHTS, 'exclude_id': exclude_id}
+    before_key = decode_rank_cursor(before) if before else None
+    after_key = decode_rank_cursor(after) if after else None
+
+    if before_key:
+        # 向前翻页：反向取紧挨着游标的一页，再翻转回相关度顺序
+        params.update(score=before_key[0], file_id=before_key[1], limit=per_page + 1)
+        rows = db.session.execute(text(sql.format(
+            condition='AND (score < :score OR (score = :score AND id > :file_id))',
+            order='score DESC, id ASC')), params).all()
+        has_prev = len(rows) > per_page
+        rows = rows[:per_page][::-1]
+        has_next = True
+    else:
+        limit = per_page if after_key or not exact else per_page - 1
+        condition = ''
+        if after_key:
+            params.update(score=after_key[0], file_id=after_key[1])
+            condition = 'AND (score > :score OR (score = :score AND id < :file_id))'
+        params['limit'] = limit + 1
+        rows = db.session.execute(text(sql.format(condition=condition, order='score ASC, id DESC')), params).all()
+        has_next = len(rows) > limit
+        rows = rows[:limit]
+        has_prev = after_key is not None
+
+    records = {record.id: record for record in FileRecord.query.filter(FileRecord.id.in_([row.id for row in rows]))}
+    items = [records[row.id] for row in rows if row.id in records]
+    scores = {row.id: row.score for row in rows}
+    if exact and not has_prev:
+        items.insert(0, exact)
+        # 完全匹配项排在最前，用比所有全文结果都小的得分作为它的游标
+        scores[exact.id] = min(scores.values(), default=0.0) - 1.0
+
+    return KeysetPage(items, has_next, has_prev, lambda record: encode_rank_cursor(scores[record.id], record.id))
@@ -0,0 +1,81 @@
+"""生产环境服务器
+
+python app.py --serve 使用 gunicorn 运行应用：主进程导入并初始化应用（preload），然后 fork 出
+workers 个 worker 进程，每个进程用 threads 个线程处理请求（gthread），空闲的 keep-alive 连接
+保持 keepalive 秒。
+
+- 平滑重启：向主进程发送 SIGHUP 会启动新的 worker 并在旧 worker 处理完手上的请求后退出
+  （最多等待 graceful_timeout 秒），期间不中断服务；SIGTERM 同样先等待请求处理完再退出
+- worker 处理 max_requests 个请求后自动替换（加 jitter 随机量，避免同时重启）
+- fork 后丢弃从主进程继承的数据库连接，每个 worker 使用自己的连接池；下载记录队列、定时清理
+  线程在各 worker 中按需启动，worker 退出时写入剩余的下载记录
+
+gunicorn 不支持 Windows，未安装时给出提示并退出。
+"""
+try:
+    from gunicorn.app.base import BaseApplication
+except ImportError:
+    BaseApplication = None
+
+
+class ServerSettings:
+    """服务器参数，从应用配置读取，命令行参数可以覆盖"""
+
+    def __init__(self, config, host, port, workers=None, threads=None, keepalive=None):
+        self.bind = f'{host}:{port}'
+        self.workers = workers or config['SERVER_WORKERS']
+        self.threads = threads or config['SERVER_THREADS']
+        self.keepalive = config['SERVER_KEEPALIVE'] if keepalive is None else keepalive
+        self.timeout = config['SERVER_TIMEOUT']
+        self.graceful_timeout = config['SERVER_GRACEFUL_TIMEOUT']
+        self.max_requests = config['SERVER_MAX_REQUESTS']
+        self.max_requests_jitter = config['SERVER_MAX_REQUESTS_JITTER']
+        self.backlog = config['SERVER_BACKLOG']
+
+    def gunicorn_options(self):
+        return {
+            'bind': self.bind,
+            'workers': self.workers,
+            'threads': self.threads,
+            'worker_class': 'gthread',
+            'keepalive': self.keepalive,
+            'timeout': self.timeout,
+            'graceful_timeout': self.graceful_timeout,
+            'max_requests': self.max_requests,
+            'max_requests_jitter': self.max_requests_jitter,
+            'backlog': self.backlog,
+            'preload_app': True,
+            'accesslog': None,
+            'errorlog': '-',
+        }
+
+
+def serve(app, settings, post_fork=None, worker_exit=None):
+    """以 gunicorn 运行 app，阻塞到服务器退出
+
+    post_fork() 在每个 worker 进程 fork 后调用，worker_exit() 在 worker 退出前调用。
+    """
+    if BaseApplication is None:
+        raise SystemExit("生产服务器需要 gunicorn：pip install gunicorn（Windows 请使用 python app.py 运行开发服务器）")
+
+    options = settings.gunicorn_options()
+    if post_fork:
+        options['post_fork'] = lambda server, worker: post_fork()
+    if worker_exit:
+        options['worker_exit'] = lambda server, worker: worker_exit()
+    _GunicornApplication(app, options).run()
+
+
+if BaseApplication is not None:
+    class _GunicornApplication(BaseApplication):
+        def __init__(self, app, options):
+            self.application = app
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return self.application
@@ -0,0 +1,49 @@
+"""提取码生成
+
+提取码为 CODE_LENGTH 位大小写字母和数字的组合（至少各含一个字母和数字），由系统随机源生成。
+批量生成时先在内存中去重，再用一条 IN 查询排除数据库中已使用的提取码，冲突的部分重新生成，
+每轮只有一次查询；最终以 file_record.code 的唯一约束为准（并发插入同一提取码时提交失败）。
+"""
+import random
+import string
+
+from models import db, FileRecord
+
+CHARS = string.ascii_letters + string.digits
+QUERY_CHUNK = 500  # 每条 IN 查询的参数个数上限（SQLite 旧版本限制 999 个）
+
+_random = random.SystemRandom()
+
+
+def generate_code(length):
+    """生成指定位数的字母数字混合提取码（大小写敏感）"""
+    while True:
+        code = ''.join(_random.choices(CHARS, k=length))
+        # 确保包含至少一个数字和一个字母
+        if any(c.isdigit() for c in code) and any(c.isalpha() for c in code):
+            return code
+
+
+def generate_codes(count, length, max_rounds=10):
+    """生成 count 个互不相同且数据库中尚未使用的提取码，多轮仍有冲突时返回 None"""
+    codes = set()
+    for _ in range(max_rounds):
+        candidates = set()
+        while len(candidates) < count - len(codes):
+            code = generate_code(length)
+            if code not in codes:
+                candidates.add(code)
+        codes |= candidates - used_codes(candidates)
+        if len(codes) == count:
+            return list(codes)
+    return None
+
+
+def used_codes(codes):
+    """codes 中已被文件记录使用的提取码"""
+    codes = list(codes)
+    used = set()
+    for start in range(0, len(codes), QUERY_CHUNK):
+        chunk = codes[start:start + QUERY_CHUNK]
+        used.update(db.session.scalars(db.select(FileRecord.code).where(FileRecord.code.in_(chunk))))
+    return used
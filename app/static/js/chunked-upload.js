@@ -0,0 +1,72 @@
+// 大文件分片上传：超过一个分片大小的文件改用 init → 并行 PUT 分片 → finalize 的方式上传
+document.addEventListener('DOMContentLoaded', function() {
+    const form = document.getElementById('upload-form');
+    if (!form) return;
+
+    const chunkSize = parseInt(form.dataset.chunkSize, 10);
+    const parallel = parseInt(form.dataset.parallel, 10) || 1;
+    const initUrl = form.dataset.initUrl;
+    const progress = document.getElementById('upload-progress');
+
+    async function request(method, url, body) {
+        const response = await fetch(url, { method: method, body: body, credentials: 'same-origin' });
+        const data = await response.json().catch(() => ({}));
+        if (!response.ok) {
+            throw new Error(data.error || `请求失败（${response.status}）`);
+        }
+        return data;
+    }
+
+    async function uploadChunk(uploadUrl, file, index) {
+        const start = index * chunkSize;
+        const blob = file.slice(start, Math.min(start + chunkSize, file.size));
+        // 网络中断时重试，已上传的分片不受影响
+        for (let attempt = 1; ; attempt++) {
+            try {
+                return await request('PUT', `${uploadUrl}?offset=${start}`, blob);
+            } catch (err) {
+                if (attempt >= 3) throw err;
+            }
+        }
+    }
+
+    form.addEventListener('submit', async function(e) {
+        const file = form.querySelector('#file').files[0];
+        if (!file || file.size <= chunkSize) return;  // 小文件仍然使用普通表单提交
+
+        e.preventDefault();
+        const button = form.querySelector('button[type="submit"]');
+        button.disabled = true;
+
+        try {
+            const initData = new FormData();
+            initData.append('filename', file.name);
+            initData.append('size', file.size);
+            ['expire_days', 'max_downloads', 'description'].forEach(name => {
+                const field = form.elements[name];
+                if (field) initData.append(name, field.value);
+            });
+            const upload = await request('POST', initUrl, initData);
+            const uploadUrl = initUrl.replace(/\/init$/, '/' + upload.upload_id);
+
+            let next = 0;
+            let done = 0;
+            async function worker() {
+                while (next < upload.chunk_count) {
+                    const index = next++;
+                    await uploadChunk(uploadUrl, file, index);
+                    done++;
+                    progress.textContent = `上传中：${Math.floor(done * 100 / upload.chunk_count)}%`;
+                }
+            }
+            await Promise.all(Array.from({ length: Math.min(parallel, upload.chunk_count) }, worker));
+
+            progress.textContent = '正在校验文件...';
+            await request('POST', `${uploadUrl}/finalize`);
+            window.location.href = form.action || window.location.href;
+        } catch (err) {
+            progress.textContent = `文件上传失败: ${err.message}`;
+            button.disabled = false;
+        }
+    });
+});
@@ -0,0 +1,194 @@
+"""后台首页统计（增量维护）
+
+文件总数、有效文件数、总下载量和存储占用保存在 stat_counter 表中，由上传、下载、启用/禁用、
+删除和清理在各自的事务里增量更新；每小时的上传数、下载数和下载字节数汇总在 stat_hourly 表中。
+首页只读取计数器和最近若干小时的汇总行，查询次数和数据量无关。
+
+计数只可能因为绕过应用的写入（手工改库、旧版本数据库）而偏离，reconcile_stats 会按真实数据
+校正计数器；小时汇总中已删除文件的记录无法从数据表中恢复，因此只会把偏少的汇总补齐。
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from sqlalchemy import case, func, select
+from sqlalchemy.exc import IntegrityError
+
+from models import db, eastern8_now, Blob, DownloadRecord, FileRecord, StatCounter, StatHourly
+
+COUNTERS = ('total_files', 'active_files', 'total_downloads', 'stored_bytes', 'saved_bytes')
+
+
+def hour_bucket(moment):
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def bump(**deltas):
+    """增加计数器（需调用方提交事务）"""
+    for name, delta in deltas.items():
+        if delta:
+            StatCounter.query.filter_by(name=name).update(
+                {StatCounter.value: StatCounter.value + delta}, synchronize_session=False)
+
+
+def bump_hourly(moment, uploads=0, downloads=0, bytes_served=0):
+    """增加 moment 所在小时的汇总（需调用方提交事务）"""
+    bucket = hour_bucket(moment)
+    values = {
+        StatHourly.uploads: StatHourly.uploads + uploads,
+        StatHourly.downloads: StatHourly.downloads + downloads,
+        StatHourly.bytes_served: StatHourly.bytes_served + bytes_served,
+    }
+    if StatHourly.query.filter_by(bucket=bucket).update(values, synchronize_session=False):
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.add(StatHourly(bucket=bucket, uploads=uploads, downloads=downloads, bytes_served=bytes_served))
+    except IntegrityError:
+        # 其他进程刚插入了同一小时的行
+        StatHourly.query.filter_by(bucket=bucket).update(values, synchronize_session=False)
+
+
+def record_upload(file_record):
+    """新增文件记录"""
+    record_uploads([file_record])
+
+
+def record_uploads(file_records):
+    """一次新增多个文件记录（批量上传），计数器和每个小时的汇总各只更新一次"""
+    active = sum(1 for record in file_records if record.is_active is None or record.is_active)
+    bump(total_files=len(file_records), active_files=active)
+    hours = defaultdict(int)
+    for record in file_records:
+        hours[hour_bucket(record.created_at or eastern8_now())] += 1
+    for bucket, uploads in hours.items():
+        bump_hourly(bucket, uploads=uploads)
+
+
+def record_removal(file_record):
+    """删除文件记录（手动删除或过期清理），它的下载次数随之从总下载量中扣除"""
+    bump(total_files=-1, active_files=-int(bool(file_record.is_active)),
+         total_downloads=-(file_record.download_count or 0))
+
+
+def record_toggle(file_record):
+    """文件启用状态切换之后调用"""
+    bump(active_files=1 if file_record.is_active else -1)
+
+
+def record_claim():
+    """一次新的下载（与 claim_download 在同一事务中调用）
+
+    总下载量与 FileRecord.download_count 同时增加，校对时以 download_count 为准，不会与
+    其他进程中尚未写入的下载记录重复或遗漏计数。
+    """
+    bump(total_downloads=1)
+
+
+def record_downloads(rows, sizes):
+    """一批已计数的下载（下载记录写入时调用）的小时汇总，sizes 为 {file_id: 文件大小}"""
+    buckets = defaultdict(lambda: [0, 0])
+    for row in rows:
+        bucket = buckets[hour_bucket(row['download_time'])]
+        bucket[0] += 1
+        bucket[1] += sizes.get(row['file_id']) or 0
+    for bucket, (downloads, bytes_served) in buckets.items():
+        bump_hourly(bucket, downloads=downloads, bytes_served=bytes_served)
+
+
+def dashboard_stats(series_hours):
+    """返回 (计数器字典, 最近 series_hours 小时的汇总列表)，汇总按时间倒序且补齐空缺的小时"""
+    counters = dict.fromkeys(COUNTERS, 0)
+    counters.update(db.session.execute(select(StatCounter.name, StatCounter.value)).all())
+
+    latest = hour_bucket(eastern8_now())
+    since = latest - timedelta(hours=series_hours - 1)
+    rows = {row.bucket: row for row in StatHourly.query.filter(StatHourly.bucket >= since)}
+    series = []
+    for i in range(series_hours):
+        bucket = latest - timedelta(hours=i)
+        row = rows.get(bucket)
+        series.append({
+            'bucket': bucket,
+            'uploads': row.uploads if row else 0,
+            'downloads': row.downloads if row else 0,
+            'bytes_served': row.bytes_served if row else 0,
+        })
+    return counters, series
+
+
+def actual_counters():
+    """按数据表重新计算计数器（全表聚合，只在校对时使用）"""
+    total_files, active_files, total_downloads = db.session.query(
+        func.count(FileRecord.id),
+        func.coalesce(func.sum(case((FileRecord.is_active == True, 1), else_=0)), 0),
+        func.coalesce(func.sum(FileRecord.download_count), 0)
+    ).one()
+    stored_bytes, saved_bytes = db.session.query(
+        func.coalesce(func.sum(Blob.size), 0),
+        func.coalesce(func.sum((Blob.ref_count - 1) * Blob.size), 0)
+    ).one()
+    return {
+        'total_files': total_files,
+        'active_files': active_files,
+        'total_downloads': total_downloads,
+        'stored_bytes': stored_bytes,
+        'saved_bytes': saved_bytes,
+    }
+
+
+def actual_hourly(since):
+    """按文件记录和下载记录重新汇总 since 之后每小时的数据，返回 {bucket: [uploads, downloads, bytes]}"""
+    buckets = defaultdict(lambda: [0, 0, 0])
+    for created_at, in db.session.execute(
+            select(FileRecord.created_at).where(FileRecord.created_at >= since)).yield_per(10000):
+        buckets[hour_bucket(created_at)][0] += 1
+    for download_time, size in db.session.execute(
+            select(DownloadRecord.download_time, FileRecord.file_size)
+            .join(FileRecord, FileRecord.id == DownloadRecord.file_id)
+            .where(DownloadRecord.download_time >= since)).yield_per(10000):
+        bucket = buckets[hour_bucket(download_time)]
+        bucket[1] += 1
+        bucket[2] += size or 0
+    return buckets
+
+
+def reconcile_stats(hours):
+    """按真实数据校正计数器和最近 hours 小时的汇总，返回 {名称: (原值, 新值)} 形式的修正列表"""
+    corrections = {}
+    stored = dict(db.session.execute(select(StatCounter.name, StatCounter.value)).all())
+    for name, value in actual_counters().items():
+        if name not in stored:
+            db.session.add(StatCounter(name=name, value=value))
+        elif stored[name] != value:
+            StatCounter.query.filter_by(name=name).update({StatCounter.value: value}, synchronize_session=False)
+        if stored.get(name) != value:
+            corrections[name] = (stored.get(name), value)
+
+    since = hour_bucket(eastern8_now()) - timedelta(hours=hours)
+    existing = {row.bucket: row for row in StatHourly.query.filter(StatHourly.bucket >= since)}
+    for bucket, (uploads, downloads, bytes_served) in actual_hourly(since).items():
+        row = existing.get(bucket)
+        if row is None:
+            db.session.add(StatHourly(bucket=bucket, uploads=uploads, downloads=downloads, bytes_served=bytes_served))
+            corrections[bucket.strftime('%Y-%m-%d %H:00')] = (None, (uploads, downloads, bytes_served))
+        elif row.uploads < uploads or row.downloads < downloads or row.bytes_served < bytes_served:
+            before = (row.uploads, row.downloads, row.bytes_served)
+            row.uploads = max(row.uploads, uploads)
+            row.downloads = max(row.downloads, downloads)
+            row.bytes_served = max(row.bytes_served, bytes_served)
+            corrections[bucket.strftime('%Y-%m-%d %H:00')] = (before, (row.uploads, row.downloads, row.bytes_served))
+
+    db.session.commit()
+    return corrections
+
+
+def ensure_stats(hours):
+    """计数器表为空时（新建或旧版本数据库）初始化统计"""
+    if StatCounter.query.first() is None:
+        reconcile_stats(hours)
+
+
+def prune_hourly(retention_days):
+    """删除超过保留期的小时汇总（需调用方提交事务），返回删除的行数"""
+    cutoff = hour_bucket(eastern8_now()) - timedelta(days=retention_days)
+    return StatHourly.query.filter(StatHourly.bucket < cutoff).delete(synchronize_session=False)
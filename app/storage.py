@@ -0,0 +1,214 @@
+"""上传文件的存储后端
+
+文件实体以内容哈希（md5_filename）命名，存取统一通过存储后端，不再直接拼接上传目录路径：
+
+- ``local``（默认）：本地目录，按哈希前缀分层存放（``ab/<md5>``，层数由 STORAGE_SHARD_DEPTH
+  决定），避免几十万个文件堆在同一个目录中，列目录、备份和清理扫描时不必一次处理整个目录。旧版本平铺在上传目录根部的
+  文件仍可正常读取和删除，可以用 ``flask migrate-storage`` 迁移到分层目录
+- ``s3``：S3 兼容的对象存储（需要 boto3），下载时重定向到预签名 URL，或由应用流式转发
+
+上传过程中的临时文件（.upload-*、.chunked-*）始终写在本地上传目录中，完成后由 put_file
+移入存储。
+"""
+import os
+import re
+
+try:
+    import boto3
+    from botocore.exceptions import ClientError
+except ImportError:
+    boto3 = None
+
+MD5_NAME = re.compile(r'^[0-9a-f]{32}$')
+
+
+class LocalStorage:
+    """本地目录存储，按哈希前缀分层"""
+
+    remote = False
+
+    def __init__(self, root, shard_depth=1, shard_width=2):
+        self.root = root
+        self.temp_dir = root  # 上传临时文件与存储在同一文件系统，移入存储只需重命名
+        self.shard_depth = shard_depth
+        self.shard_width = shard_width
+
+    def relative_path(self, name):
+        """name 在存储目录中的分层相对路径（ab/<name>）"""
+        width = self.shard_width
+        parts = [name[i * width:(i + 1) * width] for i in range(self.shard_depth)]
+        return '/'.join(parts + [name])
+
+    def locate(self, name):
+        """name 实际所在的相对路径：优先分层路径，尚未迁移的旧文件返回平铺路径"""
+        relative = self.relative_path(name)
+        if self.shard_depth and not os.path.exists(os.path.join(self.root, relative)) \
+                and os.path.exists(os.path.join(self.root, name)):
+            return name
+        return relative
+
+    def path(self, name):
+        return os.path.join(self.root, self.locate(name))
+
+    def exists(self, name):
+        return os.path.exists(os.path.join(self.root, self.relative_path(name))) or \
+            (self.shard_depth > 0 and os.path.exists(os.path.join(self.root, name)))
+
+    def size(self, name):
+        return os.path.getsize(self.path(name))
+
+    def put_file(self, temp_path, name):
+        """把本地临时文件原子重命名到存储中（同名文件已存在时直接覆盖，内容一致）"""
+        target = os.path.join(self.root, self.relative_path(name))
+        try:
+            os.replace(temp_path, target)
+        except FileNotFoundError:
+            # 分层目录尚未创建（只在每个前缀的第一个文件时发生）
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(temp_path, target)
+
+    def open(self, name, start=0):
+        """打开文件用于读取，从 start 字节开始"""
+        handle = open(self.path(name), 'rb')
+        if start:
+            handle.seek(start)
+        return handle
+
+    def delete(self, name):
+        """删除文件，返回释放的字节数（文件不存在时为 0）"""
+        path = self.path(name)
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except FileNotFoundError:
+            return 0
+        return size
+
+    def scan(self):
+        """遍历分层目录中的文件，生成 (name, size, mtime)
+
+        上传目录根部的文件（临时文件和旧版本平铺存放的文件）不在其中，由调用方直接列目录处理。
+        """
+        if self.shard_depth:
+            yield from self._scan_level(self.root, self.shard_depth)
+
+    def _scan_level(self, directory, depth):
+        try:
+            entries = list(os.scandir(directory))
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            try:
+                if depth and entry.is_dir(follow_symlinks=False) and len(entry.name) == self.shard_width:
+                    yield from self._scan_level(entry.path, depth - 1)
+                elif not depth and entry.is_file():
+                    stat = entry.stat()
+                    yield entry.name, stat.st_size, stat.st_mtime
+            except FileNotFoundError:
+                continue
+
+
+class S3Storage:
+    """S3 兼容对象存储（AWS S3、MinIO 等）"""
+
+    remote = True
+
+    def __init__(self, bucket, temp_dir, prefix='', endpoint_url=None, region=None,
+                 access_key=None, secret_key=None, presign_expires=300):
+        if boto3 is None:
+            raise RuntimeError("S3 存储后端需要 boto3：pip install boto3")
+        self.bucket = bucket
+        self.temp_dir = temp_dir
+        self.prefix = prefix
+        self.presign_expires = presign_expires
+        self.client = boto3.client(
+            's3', endpoint_url=endpoint_url, region_name=region,
+            aws_access_key_id=access_key, aws_secret_access_key=secret_key)
+
+    def key(self, name):
+        return self.prefix + name
+
+    def exists(self, name):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.key(name))
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+        return True
+
+    def size(self, name):
+        return self.client.head_object(Bucket=self.bucket, Key=self.key(name))['ContentLength']
+
+    def put_file(self, temp_path, name):
+        """上传本地临时文件后删除（同名对象已存在时不再上传）"""
+        if not self.exists(name):
+            self.client.upload_file(temp_path, self.bucket, self.key(name))
+        os.remove(temp_path)
+
+    def open(self, name, start=0):
+        """返回从 start 字节开始的流式响应体（支持 read(n)）"""
+        options = {'Range': f'bytes={start}-'} if start else {}
+        return self.client.get_object(Bucket=self.bucket, Key=self.key(name), **options)['Body']
+
+    def delete(self, name):
+        try:
+            size = self.size(name)
+        except ClientError:
+            return 0
+        self.client.delete_object(Bucket=self.bucket, Key=self.key(name))
+        return size
+
+    def scan(self):
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for item in page.get('Contents', []):
+                yield item['Key'][len(self.prefix):], item['Size'], item['LastModified'].timestamp()
+
+    def presigned_url(self, name, content_disposition, content_encoding=None):
+        """生成带下载文件名（和压缩版本的 Content-Encoding）的预签名 GET URL"""
+        params = {
+            'Bucket': self.bucket,
+            'Key': self.key(name),
+            'ResponseContentDisposition': content_disposition,
+        }
+        if content_encoding:
+            params['ResponseContentEncoding'] = content_encoding
+        return self.client.generate_presigned_url('get_object', Params=params, ExpiresIn=self.presign_expires)
+
+
+def create_storage(config):
+    """根据配置创建存储后端"""
+    if config['STORAGE_BACKEND'] == 's3':
+        return S3Storage(
+            config['STORAGE_S3_BUCKET'],
+            config['UPLOAD_FOLDER'],
+            prefix=config['STORAGE_S3_PREFIX'],
+            endpoint_url=config['STORAGE_S3_ENDPOINT_URL'],
+            region=config['STORAGE_S3_REGION'],
+            access_key=config['STORAGE_S3_ACCESS_KEY'],
+            secret_key=config['STORAGE_S3_SECRET_KEY'],
+            presign_expires=config['STORAGE_S3_PRESIGN_EXPIRES'])
+    return LocalStorage(config['UPLOAD_FOLDER'], shard_depth=config['STORAGE_SHARD_DEPTH'])
+
+
+def migrate_flat_files(upload_folder, storage, on_moved=None):
+    """把上传目录根部平铺的文件移入存储后端（分层目录或对象存储），返回 (文件数, 字节数)
+
+    只处理哈希命名的文件；可以重复运行，中断后再次运行会继续迁移剩余文件。
+    on_moved(name) 在每个文件迁移后调用，用于输出进度。
+    """
+    if isinstance(storage, LocalStorage) and storage.shard_depth == 0:
+        return 0, 0  # 目标本身就是平铺目录
+
+    moved = total = 0
+    for entry in list(os.scandir(upload_folder)):
+        if not entry.is_file() or not MD5_NAME.match(entry.name):
+            continue
+        size = entry.stat().st_size
+        storage.put_file(entry.path, entry.name)
+        moved += 1
+        total += size
+        if on_moved:
+            on_moved(entry.name)
+    return moved, total
@@ -0,0 +1,303 @@
+"""图片预览缩略图
+
+用户输入提取码后，图片类型的文件先显示缩略图确认内容，不必下载原图；后台文件列表同样显示缩略图。
+
+- 缩略图由后台线程池生成：上传完成后加入队列，没有缓存时在预览请求中加入队列并等待片刻
+  （THUMBNAIL_WAIT 秒，超时返回 503，浏览器稍后重试）。JPEG 按缩小的尺寸解码（draft），
+  大图不会完整载入内存；像素数超过 THUMBNAIL_MAX_PIXELS 或无法识别的文件不生成
+- 缩略图保存在本地磁盘缓存目录中（对象存储时同样在本地），按内容哈希命名，同内容的分享共用；
+  总大小超过 THUMBNAIL_CACHE_MAX_BYTES 时按最近使用时间（文件 mtime，读取时更新）淘汰最旧的，
+  缓存可以随时清空，之后按需重新生成
+- 无法识别或解码的图片写入空文件作为标记，不重复尝试；读取存储或写入缓存失败（对象存储错误、
+  磁盘已满等）不留标记，之后的请求重新生成
+- 缓存目录位于上传目录下的 .thumbnails，不在存储的分层目录中，孤立文件清理不会处理它
+
+需要 Pillow（pip install Pillow），未安装时不生成缩略图。
+"""
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+try:
+    from PIL import Image, ImageOps, UnidentifiedImageError, features
+except ImportError:
+    Image = None
+
+PENDING = object()  # 缩略图正在生成，稍后重试
+
+FORMATS = {'WEBP': ('webp', 'image/webp'), 'JPEG': ('jpg', 'image/jpeg')}
+
+
+class ThumbnailSettings:
+    """缩略图参数，从应用配置读取"""
+
+    def __init__(self, config):
+        self.extensions = {ext.lower() for ext in config['THUMBNAIL_EXTENSIONS']}
+        self.size = config['THUMBNAIL_SIZE']
+        self.quality = config['THUMBNAIL_QUALITY']
+        self.max_source_size = config['THUMBNAIL_MAX_SOURCE_SIZE']
+        self.max_pixels = config['THUMBNAIL_MAX_PIXELS']
+        self.format = config['THUMBNAIL_FORMAT'].upper()
+        if self.format == 'WEBP' and Image is not None and not features.check('webp'):
+            self.format = 'JPEG'  # Pillow 编译时未包含 WebP
+        self.extension, self.mimetype = FORMATS[self.format]
+        self.enabled = config['THUMBNAIL_ENABLED'] and Image is not None and self.format in FORMATS
+
+    def applies_to(self, filename, size):
+        """文件是否为可以生成缩略图的图片"""
+        if not self.enabled or not size or size > self.max_source_size:
+            return False
+        return os.path.splitext(filename)[1].lstrip('.').lower() in self.extensions
+
+    def cache_name(self, md5):
+        """缓存文件名：尺寸和格式变化后不会使用旧的缩略图"""
+        return f'{md5}-{self.size}.{self.extension}'
+
+
+class ThumbnailCache:
+    """本地磁盘上按最近使用时间淘汰的缩略图缓存（多进程共用同一目录）"""
+
+    def __init__(self, directory, max_bytes, touch_interval=60):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.touch_interval = touch_interval  # 同一文件的 mtime 最多多久更新一次(秒)
+        self._size = None  # 本进程估计的缓存总大小，超过上限时重新统计
+        self._lock = threading.Lock()
+        self.evicted = 0
+
+    def get(self, name):
+        """缓存的文件路径，不存在时返回 None；命中时更新最近使用时间"""
+        path = os.path.join(self.directory, name)
+        try:
+            mtime = os.stat(path).st_mtime
+        except FileNotFoundError:
+            return None
+        if time.time() - mtime > self.touch_interval:
+            try:
+                os.utime(path)
+            except OSError:
+                pass  # 文件刚被淘汰
+        return path
+
+    def temp_path(self):
+        """在缓存目录中创建临时文件（同一文件系统，完成后原子重命名）"""
+        os.makedirs(self.directory, exist_ok=True)
+        fd, path = tempfile.mkstemp(prefix='.tmp-', dir=self.directory)
+        os.close(fd)
+        return path
+
+    def put(self, temp_path, name):
+        """把生成好的临时文件放入缓存，总大小超过上限时淘汰最久未使用的文件"""
+        size = os.path.getsize(temp_path)
+        os.replace(temp_path, os.path.join(self.directory, name))
+        with self._lock:
+            if self._size is None:
+                self._size = sum(entry_size for _, entry_size, _ in self._scan())
+            else:
+                self._size += size
+            over = self._size > self.max_bytes
+        if over:
+            self.evict()
+
+    def evict(self):
+        """删除最久未使用的缩略图，直到总大小不超过上限的 90%，返回删除的文件数"""
+        entries = sorted(self._scan(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        removed = 0
+        for path, size, _ in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass  # 其他进程同时淘汰
+            total -= size
+            removed += 1
+        with self._lock:
+            self._size = total
+            self.evicted += removed
+        return removed
+
+    def _scan(self):
+        """缓存中的文件 (路径, 大小, mtime)，不含生成中的临时文件"""
+        try:
+            entries = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            return []
+        result = []
+        for entry in entries:
+            if entry.name.startswith('.'):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            result.append((entry.path, stat.st_size, stat.st_mtime))
+        return result
+
+
+class UnsupportedImage(Exception):
+    """文件不是可以识别、解码的图片，或像素数过多（结果不会改变，可以缓存）"""
+
+
+def render_thumbnail(storage, md5, settings, out_path):
+    """读取图片生成缩略图写入 out_path
+
+    无法生成缩略图的图片抛出 UnsupportedImage；读取存储或写入 out_path 失败的异常原样抛出。
+    """
+    with _open_seekable(storage, md5) as source:
+        try:
+            thumbnail = _decode(source, settings)
+        except (UnidentifiedImageError, Image.DecompressionBombError, ValueError, SyntaxError, EOFError) as e:
+            raise UnsupportedImage(str(e)) from e
+        except OSError as e:
+            if e.errno is not None:
+                raise  # 读取文件失败
+            raise UnsupportedImage(str(e)) from e  # Pillow 的解码错误（数据截断、损坏）不带 errno
+    thumbnail.save(out_path, settings.format, quality=settings.quality)
+
+
+def _decode(source, settings):
+    """解码并缩小图片，返回可以直接保存的缩略图"""
+    with Image.open(source) as image:
+        width, height = image.size
+        if width * height > settings.max_pixels:
+            raise ValueError(f'图片过大：{width}x{height}')
+        image.draft('RGB', (settings.size, settings.size))  # JPEG 直接按接近目标的尺寸解码
+        thumbnail = ImageOps.exif_transpose(image)  # 按拍摄方向旋转（动图只取第一帧）
+        thumbnail.thumbnail((settings.size, settings.size), Image.Resampling.LANCZOS)
+        has_alpha = thumbnail.mode in ('RGBA', 'LA', 'PA') or 'transparency' in thumbnail.info
+        mode = 'RGBA' if has_alpha and settings.format == 'WEBP' else 'RGB'
+        if thumbnail.mode != mode:
+            thumbnail = thumbnail.convert(mode)
+        thumbnail.load()
+        return thumbnail
+
+
+def _open_seekable(storage, md5):
+    """Pillow 需要可以 seek 的文件；对象存储的响应体先读入临时文件"""
+    if not storage.remote:
+        return storage.open(md5)
+    spool = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    body = storage.open(md5)
+    try:
+        for chunk in iter(lambda: body.read(1024 * 1024), b''):
+            spool.write(chunk)
+    finally:
+        body.close()
+    spool.seek(0)
+    return spool
+
+
+class Thumbnailer:
+    """后台缩略图生成线程池（按进程创建），同一文件同时只生成一次"""
+
+    def __init__(self, app, storage, settings, cache, workers, max_queue):
+        self.app = app
+        self.storage = storage
+        self.settings = settings
+        self.cache = cache
+        self.workers = workers
+        self.max_queue = max_queue
+        self._pool = None
+        self._pid = None
+        self._futures = {}  # md5 -> 正在生成的 Future
+        self._lock = threading.Lock()
+        self.generated = 0
+        self.failed = 0  # 无法识别的图片
+        self.errors = 0  # 读取或写入失败
+
+    def applies_to(self, filename, size):
+        return self.settings.applies_to(filename, size)
+
+    @property
+    def mimetype(self):
+        return self.settings.mimetype
+
+    def submit(self, md5):
+        """加入生成队列（已缓存时不处理），返回 Future；队列已满时返回 None"""
+        if self.cache.get(self.settings.cache_name(md5)) is not None:
+            return None
+        with self._lock:
+            future = self._futures.get(md5)
+            if future is not None:
+                return future
+            if len(self._futures) >= self.max_queue:
+                return None
+            future = self._ensure_pool().submit(self._generate, md5)
+            self._futures[md5] = future
+        future.add_done_callback(lambda _: self._forget(md5))
+        return future
+
+    def thumbnail(self, md5, timeout):
+        """缩略图路径；无法生成时返回 None，等待超时返回 PENDING"""
+        name = self.settings.cache_name(md5)
+        path = self.cache.get(name)
+        if path is None:
+            future = self.submit(md5)
+            if future is None:
+                path = self.cache.get(name)  # 刚好生成完成；否则是队列已满
+                if path is None:
+                    return PENDING
+            else:
+                try:
+                    path = future.result(timeout)
+                except FutureTimeout:
+                    return PENDING
+                except Exception:
+                    return PENDING  # 读取或写入失败（已记录日志），稍后重试
+        try:
+            if path is not None and os.path.getsize(path):
+                return path
+        except FileNotFoundError:
+            return PENDING  # 刚被淘汰，下次请求重新生成
+        return None  # 生成失败的标记
+
+    def pending(self):
+        return len(self._futures)
+
+    def close(self):
+        """worker 退出时丢弃排队中的任务，不等待生成完成"""
+        if self._pool is not None and self._pid == os.getpid():
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def _ensure_pool(self):
+        # 多进程服务器 fork 后子进程中没有父进程的线程，需要按进程创建（调用方持有 _lock）
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix='thumbnail')
+            self._futures = {}
+        return self._pool
+
+    def _forget(self, md5):
+        with self._lock:
+            self._futures.pop(md5, None)
+
+    def _generate(self, md5):
+        name = self.settings.cache_name(md5)
+        temp_path = self.cache.temp_path()
+        try:
+            render_thumbnail(self.storage, md5, self.settings, temp_path)
+            self.generated += 1
+        except UnsupportedImage as e:
+            # 不是可以识别的图片：留下空文件，之后不再尝试
+            self.failed += 1
+            self.app.logger.info(f"无法生成缩略图: {md5}: {e}")
+            open(temp_path, 'wb').close()
+        except Exception:
+            # 对象存储读取失败、磁盘已满、文件已删除等：不留标记，之后的请求重新生成
+            self.errors += 1
+            self.app.logger.warning(f"生成缩略图失败: {md5}", exc_info=True)
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        try:
+            self.cache.put(temp_path, name)
+        except OSError:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return self.cache.get(name)
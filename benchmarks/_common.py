@@ -0,0 +1,159 @@
+"""基准测试公共工具：在临时目录中加载应用，避免污染正式数据库和上传目录"""
+import hashlib
+import http.client
+import os
+import socket
+import sys
+import tempfile
+import time
+from urllib.parse import urlencode
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app')
+
+
+def load_app(workdir, **overrides):
+    """以临时目录作为数据库和上传目录导入 app 模块，overrides 会覆盖 Config 中的同名配置"""
+    if APP_DIR not in sys.path:
+        sys.path.insert(0, APP_DIR)
+    from config import Config
+
+    Config.UPLOAD_FOLDER = os.path.join(workdir, 'files')
+    Config.DATABASE_URL = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+    Config.RATELIMIT_ENABLED = False  # 基准测试不受 flask_limiter 限制
+    Config.DOWNLOAD_FREQUENCY_LIMIT = 10 ** 9
+    for key, value in overrides.items():
+        setattr(Config, key, value)
+
+    import app as app_module
+    return app_module
+
+
+def create_share(app_module, data, code, **fields):
+    """直接写入存储后端和数据库，创建一个可下载的分享（不走上传接口）"""
+    app = app_module.app
+    md5_filename = write_blob(app_module.storage, data)
+
+    with app.app_context():
+        record = app_module.FileRecord(
+            code=code,
+            md5_filename=md5_filename,
+            original_filename=fields.pop('original_filename', f'{code}.bin'),
+            file_size=len(data),
+            file_type=fields.pop('file_type', 'bin'),
+            max_downloads=fields.pop('max_downloads', 0),
+            **fields
+        )
+        app_module.db.session.add(record)
+        app_module.acquire_blob(md5_filename, len(data))
+        app_module.db.session.commit()
+        return record.id
+
+
+def write_blob(storage, data):
+    """与上传相同：先写入临时文件，再以 MD5 为名放入存储后端，返回 MD5"""
+    md5 = hashlib.md5(data).hexdigest()
+    fd, temp_path = tempfile.mkstemp(prefix='.upload-', dir=storage.temp_dir)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    storage.put_file(temp_path, md5)
+    return md5
+
+
+def percentile(values, pct):
+    """简单的百分位数计算（values 无需预先排序）"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class Timer:
+    """with 语句计时器，结果单位为秒"""
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
+
+
+def free_port():
+    """返回一个当前空闲的本地端口"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, timeout=60):
+    """等待子进程中的服务器开始监听"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'服务器未在 {timeout} 秒内启动')
+
+
+class Client:
+    """单个 keep-alive 连接，断开后自动重连"""
+
+    def __init__(self, port):
+        self.port = port
+        self.conn = None
+
+    def request(self, method, path, body=None, headers=None):
+        for attempt in range(2):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=30)
+            try:
+                self.conn.request(method, path, body=body, headers=headers or {})
+                response = self.conn.getresponse()
+                data = response.read()
+                if response.getheader('Connection', '').lower() == 'close':
+                    self.close()
+                return response, data
+            except (http.client.HTTPException, OSError):
+                self.close()
+                if attempt:
+                    raise
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+def login(client, password):
+    """管理员登录，返回会话 Cookie"""
+    body = urlencode({'admin_password': password})
+    response, _ = client.request('POST', '/admin/login', body,
+                                 {'Content-Type': 'application/x-www-form-urlencoded'})
+    cookie = response.getheader('Set-Cookie', '').split(';')[0]
+    if response.status != 302 or not cookie:
+        raise RuntimeError(f'管理员登录失败：{response.status}')
+    return cookie
+
+
+def process_tree_usage(pid):
+    """进程及其所有子进程的 (线程数, RSS 字节数)，读取 /proc（仅 Linux）"""
+    threads = rss = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f'/proc/{current}/status') as f:
+                for line in f:
+                    if line.startswith('Threads:'):
+                        threads += int(line.split()[1])
+                    elif line.startswith('VmRSS:'):
+                        rss += int(line.split()[1]) * 1024
+            for task in os.listdir(f'/proc/{current}/task'):
+                with open(f'/proc/{current}/task/{task}/children') as f:
+                    pending.extend(int(child) for child in f.read().split())
+        except FileNotFoundError:
+            continue
+    return threads, rss
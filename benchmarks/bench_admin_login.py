@@ -0,0 +1,170 @@
+"""并发错误登录对下载延迟的影响：请求中 time.sleep 的旧实现 vs 冷却期/429 的新实现
+
+用法：python benchmarks/bench_admin_login.py --workers 8 --attackers 50 --seconds 10
+
+服务器在单独的进程中运行，使用固定大小的线程池（--workers，模拟 gunicorn 等固定 worker 数的
+部署）。下载客户端持续请求下载接口并统计延迟；同时 --attackers 个攻击线程（各自使用不同IP）
+每隔 --attack-interval 秒提交一次错误的管理员密码。旧实现按原 admin_login 的逻辑在请求中查询
+两次数据库并 sleep ADMIN_LOGIN_DELAY 秒（封锁后 sleep 两倍），挂在 /legacy-login 上对比。
+"""
+import argparse
+import http.client
+import logging
+import multiprocessing
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from urllib.parse import urlencode
+
+from _common import create_share, load_app, percentile
+
+CODES = [f'L{i:05d}' for i in range(20)]
+
+
+def add_legacy_login(app_module):
+    """按原实现注册 /legacy-login：两次查询 + 写失败记录 + time.sleep"""
+    from models import AdminLoginAttempt
+
+    app, db = app_module.app, app_module.db
+    config = app.config
+
+    def legacy_login():
+        ip = app_module.get_remote_address()
+        now = app_module.get_eastern8_time()
+        block_time = timedelta(seconds=config['ADMIN_LOGIN_BLOCK_TIME'])
+        blocked = AdminLoginAttempt.query.filter(
+            AdminLoginAttempt.ip == ip, AdminLoginAttempt.blocked_until > now).first()
+        recent_failures = AdminLoginAttempt.query.filter(
+            AdminLoginAttempt.ip == ip,
+            AdminLoginAttempt.attempt_time > now - block_time,
+            AdminLoginAttempt.successful == False).count()
+        if blocked or recent_failures >= config['ADMIN_LOGIN_ATTEMPTS']:
+            if not blocked:
+                db.session.add(AdminLoginAttempt(ip=ip, blocked_until=now + block_time, successful=False))
+                db.session.commit()
+            time.sleep(config['ADMIN_LOGIN_DELAY'] * 2)
+            return 'blocked'
+        db.session.add(AdminLoginAttempt(ip=ip, successful=False))
+        db.session.commit()
+        time.sleep(config['ADMIN_LOGIN_DELAY'])
+        return 'wrong password'
+
+    app.add_url_rule('/legacy-login', 'legacy_login', legacy_login, methods=['POST'])
+
+
+def make_pooled_server(app, workers):
+    from werkzeug.serving import BaseWSGIServer
+
+    class PooledWSGIServer(BaseWSGIServer):
+        """固定线程池处理请求，线程全部占用时新请求排队"""
+
+        def __init__(self):
+            super().__init__('127.0.0.1', 0, app)
+            self.pool = ThreadPoolExecutor(workers)
+            self.request_queue_size = 1024
+
+        def process_request(self, request, client_address):
+            self.pool.submit(self._handle, request, client_address)
+
+        def _handle(self, request, client_address):
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    return PooledWSGIServer()
+
+
+def serve(workdir, workers, port_queue):
+    """子进程：加载应用、创建测试分享并启动服务器"""
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    app_module = load_app(workdir)
+    add_legacy_login(app_module)
+    for i, code in enumerate(CODES):
+        create_share(app_module, f'login-bench-{i}'.encode(), code)
+    server = make_pooled_server(app_module.app, workers)
+    port_queue.put(server.server_port)
+    server.serve_forever()
+
+
+def request(port, method, path, body=None, ip=None):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    headers = {'Content-Type': 'application/x-www-form-urlencoded'} if body else {}
+    if ip:
+        headers['X-Forwarded-For'] = ip
+    conn.request(method, path, body=body, headers=headers)
+    response = conn.getresponse()
+    response.read()
+    conn.close()
+    return response.status
+
+
+def run_scenario(port, login_path, attackers, interval, downloaders, seconds, scenario_index):
+    deadline = time.perf_counter() + seconds
+    latencies = []
+    logins = [0]
+    lock = threading.Lock()
+
+    def attacker(index):
+        body = urlencode({'admin_password': 'wrong'})
+        ip = f'172.{scenario_index}.{index // 250}.{index % 250 + 1}'
+        count = 0
+        while time.perf_counter() < deadline:
+            request(port, 'POST', login_path, body, ip)
+            count += 1
+            time.sleep(interval)
+        with lock:
+            logins[0] += count
+
+    def downloader(index):
+        n = index
+        local = []
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            request(port, 'GET', f'/download/{CODES[n % len(CODES)]}', ip=f'10.{scenario_index}.{index}.{n % 250 + 1}')
+            local.append(time.perf_counter() - start)
+            n += 1
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=attacker, args=(i,)) for i in range(attackers if login_path else 0)]
+    threads += [threading.Thread(target=downloader, args=(i,)) for i in range(downloaders)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencies, logins[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=8, help='服务器线程池大小')
+    parser.add_argument('--attackers', type=int, default=50, help='并发错误登录的客户端数')
+    parser.add_argument('--attack-interval', type=float, default=1.0, help='每个攻击线程两次登录之间的间隔(秒)')
+    parser.add_argument('--downloaders', type=int, default=4, help='并发下载客户端数')
+    parser.add_argument('--seconds', type=float, default=10, help='每个场景持续时间(秒)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        port_queue = multiprocessing.Queue()
+        server = multiprocessing.Process(target=serve, args=(workdir, args.workers, port_queue), daemon=True)
+        server.start()
+        port = port_queue.get(timeout=60)
+
+        print(f"{'场景':<16}{'下载次数':>10}{'p50(ms)':>10}{'p99(ms)':>10}{'登录请求':>10}")
+        scenarios = [('无攻击', None), ('旧实现(sleep)', '/legacy-login'), ('新实现(429)', '/admin/login')]
+        for index, (name, path) in enumerate(scenarios, start=1):
+            latencies, logins = run_scenario(port, path, args.attackers, args.attack_interval,
+                                             args.downloaders, args.seconds, index)
+            print(f"{name:<16}{len(latencies):>10}{percentile(latencies, 50) * 1000:>10.1f}"
+                  f"{percentile(latencies, 99) * 1000:>10.1f}{logins:>10}")
+        server.terminate()
+        server.join()
+
+
+if __name__ == '__main__':
+    main()
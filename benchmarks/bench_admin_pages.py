@@ -0,0 +1,142 @@
+"""后台记录页渲染耗时：OFFSET 分页 + 逐文件延迟加载下载记录 vs 键集分页 + 批量加载
+
+用法：python benchmarks/bench_admin_pages.py --files 100000 --downloads 10000000 --repeat 5
+
+旧实现按原来的方式模拟：paginate(page) 的 COUNT(*) + OFFSET 查询，模板中逐个访问 file.downloads
+（每个文件一条查询，读取该文件的全部下载记录）。新实现分别测数据加载（paginate_files +
+recent_downloads）和完整请求 /admin/records（含会话校验和模板渲染）。
+分别测第一页和深页（第 --deep-page 页），同时统计执行的 SQL 条数。
+"""
+import argparse
+import random
+import tempfile
+from datetime import timedelta
+
+from sqlalchemy import event
+
+from _common import Timer, load_app
+
+BATCH = 50000
+
+
+def seed(app_module, files, downloads):
+    """批量插入 files 个文件记录和 downloads 条下载记录（随机分布到各文件）"""
+    db = app_module.db
+    now = app_module.get_eastern8_time()
+    file_table = app_module.FileRecord.__table__
+    download_table = app_module.DownloadRecord.__table__
+
+    batch = []
+    for i in range(files):
+        batch.append({
+            'code': f'P{i:07d}', 'md5_filename': f'{i:032x}', 'original_filename': f'file-{i}.bin',
+            'file_size': 1024, 'file_type': 'bin', 'created_at': now - timedelta(seconds=files - i),
+            'expires_at': now + timedelta(days=30), 'download_count': 0, 'max_downloads': 0,
+            'is_active': True,
+        })
+        if len(batch) >= BATCH or i == files - 1:
+            db.session.execute(file_table.insert(), batch)
+            batch = []
+
+    for i in range(downloads):
+        batch.append({
+            'file_id': random.randint(1, files),
+            'downloader_ip': f'10.0.{i % 250}.{i % 199 + 1}',
+            'download_time': now - timedelta(seconds=random.randint(0, 30 * 86400)),
+            'user_agent': 'bench',
+        })
+        if len(batch) >= BATCH or i == downloads - 1:
+            db.session.execute(download_table.insert(), batch)
+            batch = []
+    db.session.commit()
+
+
+def legacy_page(app_module, page, per_page):
+    """旧实现的数据加载：OFFSET 分页，模板中逐个访问 file.downloads"""
+    FileRecord = app_module.FileRecord
+    files = FileRecord.query.order_by(FileRecord.created_at.desc()).paginate(
+        page=page, per_page=per_page, error_out=False)
+    for file in files.items:
+        for download in file.downloads:
+            download.download_time
+    app_module.db.session.remove()
+
+
+def keyset_page(app_module, cursor, per_page, download_limit):
+    """新实现的数据加载：键集分页 + 批量加载每个文件最近的下载记录"""
+    from admin_queries import paginate_files, recent_downloads
+    files = paginate_files(app_module.FileRecord.query, per_page, after=cursor)
+    recent_downloads([file.id for file in files.items], download_limit)
+    app_module.db.session.remove()
+
+
+def cursor_for_page(app_module, page, per_page):
+    """新实现中翻到第 page 页所用的 after 游标（即上一页最后一行）"""
+    from admin_queries import encode_cursor
+    FileRecord = app_module.FileRecord
+    if page <= 1:
+        return None
+    row = FileRecord.query.order_by(FileRecord.created_at.desc(), FileRecord.id.desc()).offset(
+        (page - 1) * per_page - 1).first()
+    return encode_cursor(row.created_at, row.id)
+
+
+def measure(func, repeat, counter):
+    best = None
+    for _ in range(repeat):
+        counter[0] = 0
+        with Timer() as t:
+            func()
+        best = t.elapsed if best is None else min(best, t.elapsed)
+    return best, counter[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--files', type=int, default=100000, help='文件记录数量')
+    parser.add_argument('--downloads', type=int, default=1000000, help='下载记录数量（完整测试使用 10000000）')
+    parser.add_argument('--deep-page', type=int, default=2000, help='深页页码')
+    parser.add_argument('--repeat', type=int, default=5, help='每项重复次数（取最小值）')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        app_module = load_app(workdir)
+        app = app_module.app
+        per_page = app.config['DEFALUT_ITEM_EVERY_PAGE']
+        download_limit = app.config['ADMIN_DOWNLOADS_PER_FILE']
+
+        with app.app_context():
+            with Timer() as t:
+                seed(app_module, args.files, args.downloads)
+            print(f'写入 {args.files} 个文件、{args.downloads} 条下载记录：{t.elapsed:.1f}s')
+
+            counter = [0]
+            event.listen(app_module.db.engine, 'before_cursor_execute',
+                         lambda *a: counter.__setitem__(0, counter[0] + 1))
+
+            client = app.test_client()
+            with client.session_transaction() as sess:
+                sess['admin_logged_in'] = True
+
+            print(f"{'实现':<10}{'页码':>8}{'耗时(ms)':>12}{'SQL条数':>10}")
+            for page in (1, args.deep_page):
+                elapsed, queries = measure(lambda: legacy_page(app_module, page, per_page), args.repeat, counter)
+                print(f"{'legacy':<10}{page:>8}{elapsed * 1000:>12.1f}{queries:>10}")
+
+                cursor = cursor_for_page(app_module, page, per_page)
+                elapsed, queries = measure(lambda: keyset_page(app_module, cursor, per_page, download_limit),
+                                           args.repeat, counter)
+                print(f"{'keyset':<10}{page:>8}{elapsed * 1000:>12.1f}{queries:>10}")
+
+                url = '/admin/records' + (f'?after={cursor}' if cursor else '')
+
+                def request_page():
+                    response = client.get(url)
+                    assert response.status_code == 200, response.status_code
+
+                elapsed, queries = measure(request_page, args.repeat, counter)
+                print(f"{'keyset+页面':<10}{page:>8}{elapsed * 1000:>12.1f}{queries:>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+"""大量慢速客户端同时下载：同步服务器（gunicorn gthread）vs 异步下载服务（aiohttp）
+
+用法：python benchmarks/bench_async_download.py --clients 500 --seconds 20 --threads 8
+
+--clients 个慢速客户端同时下载 --file-size 字节的文件，每个客户端把接收缓冲区设得很小，并且每隔
+--read-interval 秒只读取 --read-size 字节（模拟移动网络），服务器无法一次把文件写进套接字缓冲区。
+同时一个探测客户端每 0.2 秒下载一次小文件，测量正常用户在慢速下载占满服务器时的延迟。
+
+同步服务器每个下载占用一个线程直到传输结束，只有 --threads 个下载能同时进行，其余连接和探测
+请求排队；异步服务每个下载只占用一个协程。统计测试窗口内开始接收数据和下载完成的客户端数、
+探测请求的延迟，以及服务器进程树的线程数和内存。
+"""
+import argparse
+import asyncio
+import http.client
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from _common import create_share, free_port, load_app, percentile, process_tree_usage, wait_for_port
+
+SLOW_CODE = 'SLOW01'
+PROBE_CODE = 'PROBE1'
+
+
+def run_server(kind, workdir, port, threads):
+    """子进程入口：加载应用并运行指定的服务器"""
+    app_module = load_app(workdir)
+    if kind == 'sync':
+        settings = app_module.ServerSettings(app_module.app.config, '127.0.0.1', port, workers=1, threads=threads)
+        app_module.serve(app_module.app, settings, post_fork=app_module.reset_after_fork,
+                         worker_exit=app_module.download_log.close)
+    else:
+        config = app_module.app.config
+        server = app_module.AsyncDownloadServer(
+            app_module.app, app_module.authorize_download, app_module.limiter, app_module.storage,
+            chunk_size=config['ASYNC_DOWNLOAD_CHUNK_SIZE'],
+            db_threads=config['ASYNC_DOWNLOAD_DB_THREADS'],
+            io_threads=config['ASYNC_DOWNLOAD_IO_THREADS'])
+        server.run('127.0.0.1', port)
+
+
+def check_download(port, code, data):
+    """下载前先确认服务器返回的完整文件和 Range 续传内容正确"""
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    try:
+        for headers, status, expected in [({}, 200, data),
+                                          ({'Range': 'bytes=1000-'}, 206, data[1000:])]:
+            connection.request('GET', f'/download/{code}', headers={'X-Forwarded-For': '192.0.2.1', **headers})
+            response = connection.getresponse()
+            body = response.read()
+            assert response.status == status and body == expected, (headers, response.status, len(body))
+    finally:
+        connection.close()
+
+
+async def fetch(port, code, ip, read_size=65536, read_interval=0.0, rcvbuf=None, on_header=None):
+    """下载一次，返回完成时间（秒）；收到响应头时调用 on_header(首字节时间)"""
+    started = time.perf_counter()
+    sock = socket.socket()
+    if rcvbuf:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+    sock.setblocking(False)
+    await asyncio.get_running_loop().sock_connect(sock, ('127.0.0.1', port))
+    reader, writer = await asyncio.open_connection(sock=sock, limit=read_size)
+    try:
+        writer.write(f'GET /download/{code} HTTP/1.1\r\nHost: bench\r\nX-Forwarded-For: {ip}\r\n'
+                     f'Connection: close\r\n\r\n'.encode())
+        header = await reader.readuntil(b'\r\n\r\n')
+        status = int(header.split(b' ', 2)[1])
+        if status != 200:
+            raise RuntimeError(f'下载失败：{status}')
+        if on_header:
+            on_header(time.perf_counter() - started)
+        length = next(int(line.split(b':')[1]) for line in header.split(b'\r\n')
+                      if line.lower().startswith(b'content-length:'))
+        while length > 0:
+            data = await reader.read(min(read_size, length))
+            if not data:
+                raise RuntimeError('连接提前关闭')
+            length -= len(data)
+            if read_interval:
+                await asyncio.sleep(read_interval)
+        return time.perf_counter() - started
+    finally:
+        writer.close()
+
+
+async def run_scenario(port, server_pid, args):
+    first_bytes, finished, probes = [], [], []
+    probe_failures = 0
+    peak = [0, 0]
+
+    async def slow_client(index):
+        ip = f'10.{index // 250 % 250}.{index % 250}.1'
+        finished.append(await fetch(port, SLOW_CODE, ip, args.read_size, args.read_interval,
+                                    rcvbuf=4096, on_header=first_bytes.append))
+
+    async def slow_client_logged(index):
+        try:
+            await slow_client(index)
+        except (OSError, RuntimeError, asyncio.IncompleteReadError):
+            pass
+
+    async def probe():
+        nonlocal probe_failures
+        n = 0
+        while True:
+            n += 1
+            try:
+                done = await asyncio.wait_for(fetch(port, PROBE_CODE, f'172.16.{n // 250 % 250}.{n % 250 + 1}'), 10)
+                probes.append(done)
+            except (asyncio.TimeoutError, OSError, RuntimeError):
+                probe_failures += 1
+            await asyncio.sleep(0.2)
+
+    async def sample_usage():
+        while True:
+            threads, rss = process_tree_usage(server_pid)
+            peak[0], peak[1] = max(peak[0], threads), max(peak[1], rss)
+            await asyncio.sleep(0.5)
+
+    tasks = [asyncio.create_task(slow_client_logged(i)) for i in range(args.clients)]
+    helpers = [asyncio.create_task(probe()), asyncio.create_task(sample_usage())]
+    await asyncio.wait(tasks, timeout=args.seconds)
+    for task in tasks + helpers:
+        task.cancel()
+    await asyncio.gather(*tasks, *helpers, return_exceptions=True)
+    # 测试窗口内收到响应头的客户端（包括仍在传输中的）
+    return len(first_bytes), len(finished), first_bytes, probes, probe_failures, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=500, help='慢速客户端数')
+    parser.add_argument('--seconds', type=float, default=20, help='测试窗口(秒)')
+    parser.add_argument('--threads', type=int, default=8, help='同步服务器的线程数（1 个 worker）')
+    parser.add_argument('--file-size', type=int, default=16 * 1024 * 1024, help='慢速下载的文件大小(字节)，需大于内核套接字发送缓冲区上限（一般为4MB）')
+    parser.add_argument('--read-size', type=int, default=16 * 1024, help='慢速客户端每次读取的字节数')
+    parser.add_argument('--read-interval', type=float, default=0.1, help='慢速客户端两次读取之间的间隔(秒)')
+    parser.add_argument('--server', choices=['sync', 'async'], help=argparse.SUPPRESS)
+    parser.add_argument('--workdir', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.server:
+        run_server(args.server, args.workdir, args.port, args.threads)
+        return
+
+    with tempfile.TemporaryDirectory() as workdir:
+        app_module = load_app(workdir)
+        create_share(app_module, os.urandom(args.file_size), SLOW_CODE)
+        probe_data = os.urandom(16 * 1024)
+        create_share(app_module, probe_data, PROBE_CODE)
+        with app_module.app.app_context():
+            app_module.db.engine.dispose()
+
+        print(f"{'服务器':<8}{'接收中':>8}{'完成':>8}{'首字节p99(s)':>14}{'探测p50(ms)':>13}{'探测p99(ms)':>13}"
+              f"{'探测失败':>10}{'线程数':>8}{'内存(MB)':>10}")
+        for kind in ('sync', 'async'):
+            port = free_port()
+            server = subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__), '--server', kind, '--workdir', workdir,
+                 '--port', str(port), '--threads', str(args.threads)],
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                wait_for_port(port)
+                check_download(port, PROBE_CODE, probe_data)
+                receiving, finished, first_bytes, probes, failures, (threads, rss) = asyncio.run(
+                    run_scenario(port, server.pid, args))
+                print(f"{kind:<8}{receiving:>8}{finished:>8}{percentile(first_bytes, 99):>14.2f}"
+                      f"{percentile(probes, 50) * 1000:>13.1f}{percentile(probes, 99) * 1000:>13.1f}"
+                      f"{failures:>10}{threads:>8}{rss / 1024 / 1024:>10.1f}")
+            finally:
+                server.terminate()
+                server.wait()
+
+
+if __name__ == '__main__':
+    main()
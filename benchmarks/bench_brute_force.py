@@ -0,0 +1,97 @@
+"""提取码爆破防护在大规模扫描下的内存和吞吐：原 password_attempts 字典 vs 有界尝试记录
+
+用法：python benchmarks/bench_brute_force.py --ips 100000 --attempts 3 --db-ips 10000
+
+模拟 --ips 个不同IP各尝试 --attempts 次（顺序打乱），统计每秒处理的尝试次数，以及扫描结束后
+尝试记录占用的内存（tracemalloc 统计的 Python 对象内存）。database 后端每次尝试都要读写数据库，
+默认只用 --db-ips 个IP测试，其记录保存在数据库中，不计入进程内存。
+"""
+import argparse
+import random
+import tempfile
+import time
+import tracemalloc
+
+from _common import Timer, load_app
+
+MAX_ATTEMPTS = 5
+BLOCK_TIME = 300
+
+
+class LegacyTracker:
+    """原 check_brute_force 的实现：每个IP一个尝试列表，从不淘汰"""
+
+    def __init__(self):
+        self.password_attempts = {}
+
+    def hit(self, ip, now=None):
+        now = time.time() if now is None else now
+        if ip not in self.password_attempts:
+            self.password_attempts[ip] = {'attempts': [], 'blocked_until': 0}
+        if self.password_attempts[ip]['blocked_until'] > now:
+            return False
+        self.password_attempts[ip]['attempts'].append(now)
+        self.password_attempts[ip]['attempts'] = [
+            t for t in self.password_attempts[ip]['attempts'] if t > now - BLOCK_TIME]
+        if len(self.password_attempts[ip]['attempts']) > MAX_ATTEMPTS:
+            self.password_attempts[ip]['blocked_until'] = now + BLOCK_TIME
+            return False
+        return True
+
+    def __len__(self):
+        return len(self.password_attempts)
+
+
+def scan_order(ips, attempts):
+    order = [f'10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}' for i in range(ips) for _ in range(attempts)]
+    random.shuffle(order)
+    return order
+
+
+def run(name, factory, order, track_memory):
+    tracker = factory()
+    with Timer() as t:
+        for ip in order:
+            tracker.hit(ip)
+
+    memory = 0
+    if track_memory:
+        # 单独再跑一遍统计内存，tracemalloc 会拖慢吞吐测试
+        del tracker
+        tracemalloc.start()
+        tracker = factory()
+        for ip in order:
+            tracker.hit(ip)
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+    print(f"{name:<12}{len(order):>12}{len(order) / t.elapsed:>14.0f}{len(tracker):>12}"
+          f"{memory / 1024 / 1024:>12.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--ips', type=int, default=100000, help='扫描的IP数量')
+    parser.add_argument('--attempts', type=int, default=3, help='每个IP的尝试次数')
+    parser.add_argument('--max-ips', type=int, default=100000, help='有界记录的IP上限（BRUTE_FORCE_MAX_IPS）')
+    parser.add_argument('--db-ips', type=int, default=10000, help='database 后端测试的IP数量')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        app_module = load_app(workdir)
+        from brute_force import DatabaseBruteForceTracker, MemoryBruteForceTracker
+
+        order = scan_order(args.ips, args.attempts)
+        print(f"{'实现':<12}{'尝试次数':>12}{'尝试/s':>14}{'记录IP数':>12}{'内存(MB)':>12}")
+        run('legacy', LegacyTracker, order, True)
+        run('memory', lambda: MemoryBruteForceTracker(MAX_ATTEMPTS, BLOCK_TIME, BLOCK_TIME, args.max_ips),
+            order, True)
+        run('memory/10k', lambda: MemoryBruteForceTracker(MAX_ATTEMPTS, BLOCK_TIME, BLOCK_TIME, 10000),
+            order, True)
+
+        with app_module.app.app_context():
+            run('database', lambda: DatabaseBruteForceTracker(MAX_ATTEMPTS, BLOCK_TIME, BLOCK_TIME, args.max_ips),
+                scan_order(args.db_ips, args.attempts), False)
+
+
+if __name__ == '__main__':
+    main()
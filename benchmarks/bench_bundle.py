@@ -0,0 +1,97 @@
+"""多文件分享：即时生成 ZIP 与预先打包上传的对比
+
+用法：python benchmarks/bench_bundle.py --files 200 --size 1048576
+
+在存储中写入 --files 个 --size 字节的文件（模拟已上传的文件夹），比较两种分享方式：
+
+- 预先打包：用 zipfile 按 STORED 方式打成一个压缩包再作为单个文件上传（原来的做法），统计
+  打包和写入存储的耗时以及额外占用的磁盘
+- 多文件分享：publish_bundle 直接引用已有文件（首次打包时读取文件计算 CRC32），不占用额外磁盘
+
+然后分别下载两种分享 --rounds 次，统计吞吐量和下载过程中 Python 内存分配的峰值（tracemalloc），
+多文件分享的内存占用应与文件总大小无关。
+"""
+import argparse
+import hashlib
+import io
+import os
+import tempfile
+import tracemalloc
+import zipfile
+from datetime import timedelta
+
+from _common import Timer, create_share, load_app, write_blob
+
+
+def download(client, code):
+    """下载一次，返回 (字节数, 内存分配峰值)"""
+    tracemalloc.start()
+    try:
+        response = client.get(f'/download/{code}')
+        size = sum(len(chunk) for chunk in response.response)
+        response.close()
+        return size, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--files', type=int, default=200, help='文件夹中的文件数')
+    parser.add_argument('--size', type=int, default=1024 * 1024, help='每个文件的大小（字节）')
+    parser.add_argument('--rounds', type=int, default=3, help='每种分享的下载次数')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        app_module = load_app(workdir)
+        app, storage = app_module.app, app_module.storage
+        from bulk_upload import StoredFile, publish_bundle
+
+        stored = [StoredFile(f'folder/part-{i:04d}.bin', write_blob(storage, os.urandom(args.size)), args.size)
+                  for i in range(args.files)]
+        total = args.files * args.size
+
+        # 预先打包：压缩包写入临时文件后作为一个新文件上传
+        with Timer() as prebuilt_timer:
+            fd, zip_path = tempfile.mkstemp(dir=workdir)
+            os.close(fd)
+            with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_STORED) as archive:
+                for file in stored:
+                    archive.write(os.path.join(storage.root, storage.locate(file.md5)), file.filename)
+            with open(zip_path, 'rb') as f:
+                data = f.read()
+            os.remove(zip_path)
+            create_share(app_module, data, 'PREBLT', original_filename='folder.zip', file_type='zip')
+        prebuilt_size = len(data)
+        del data
+
+        with Timer() as bundle_timer:
+            with app.app_context():
+                record = publish_bundle(
+                    stored, 'folder', storage, app.config['CODE_LENGTH'],
+                    expires_at=app_module.get_eastern8_time() + timedelta(days=1),
+                    max_downloads=0, description='', uploader_ip=None)
+                code, bundle_size = record.code, record.file_size
+
+        print(f"{args.files} 个文件，共 {total / 1024 ** 2:.1f} MB")
+        print(f"{'方式':<10}{'创建(s)':>10}{'额外磁盘(MB)':>14}{'下载(MB/s)':>12}{'内存峰值(KB)':>14}")
+        client = app.test_client()
+        for name, share_code, elapsed, extra in [('预先打包', 'PREBLT', prebuilt_timer.elapsed, prebuilt_size),
+                                                 ('即时生成', code, bundle_timer.elapsed, 0)]:
+            best, peak = float('inf'), 0
+            for _ in range(args.rounds):
+                with Timer() as timer:
+                    size, memory = download(client, share_code)
+                best, peak = min(best, timer.elapsed), max(peak, memory)
+            print(f"{name:<10}{elapsed:>10.2f}{extra / 1024 ** 2:>14.1f}{size / best / 1024 ** 2:>12.0f}{peak / 1024:>14.0f}")
+
+        # 即时生成的 ZIP 可以正常解压，内容与原文件一致
+        body = b''.join(client.get(f'/download/{code}').response)
+        assert len(body) == bundle_size
+        with zipfile.ZipFile(io.BytesIO(body)) as archive:
+            assert archive.testzip() is None
+            assert hashlib.md5(archive.read(stored[0].filename)).hexdigest() == stored[0].md5
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""压缩传输：各编码的压缩耗时、压缩率，以及下载时实际传输的字节数
+
+用法：python benchmarks/bench_compression.py --file-size 8388608 --downloads 20
+
+生成几类典型内容（日志文本、CSV 表格、已压缩的随机数据）各 --file-size 字节，按上传路径保存后
+用 compress_blob 生成压缩版本（与后台压缩相同），统计每种编码的压缩耗时和压缩后大小；
+然后分别以 identity、gzip、zstd 的 Accept-Encoding 各下载 --downloads 次，统计每次下载的
+传输字节数和应用处理时间。随机数据应被判定为压缩效果不足，始终发送原文件。
+"""
+import argparse
+import os
+import random
+import tempfile
+
+from _common import Timer, create_share, load_app, percentile
+
+ACCEPT = [('identity', 'identity'), ('gzip', 'gzip, deflate'), ('zstd', 'gzip, deflate, br, zstd')]
+
+
+def sample_log(size):
+    rng = random.Random(1)
+    lines, total = [], 0
+    while total < size:
+        line = (f'2025-04-{rng.randint(1, 28):02d} {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:'
+                f'{rng.randint(0, 59):02d} INFO [worker-{rng.randint(1, 8)}] GET /download/{rng.randint(0, 10 ** 6):06d} '
+                f'200 {rng.randint(100, 10 ** 6)} "{rng.choice(["Mozilla/5.0", "curl/8.5", "Wget/1.21"])}"\n')
+        lines.append(line)
+        total += len(line)
+    return ''.join(lines).encode()[:size]
+
+
+def sample_csv(size):
+    rng = random.Random(2)
+    rows, total = ['id,name,amount,created\n'], 0
+    while total < size:
+        row = f'{len(rows)},user{rng.randint(1, 5000)},{rng.random() * 1000:.2f},2025-0{rng.randint(1, 9)}-1{rng.randint(0, 9)}\n'
+        rows.append(row)
+        total += len(row)
+    return ''.join(rows).encode()[:size]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--file-size', type=int, default=8 * 1024 * 1024, help='每个样本文件的大小(字节)')
+    parser.add_argument('--downloads', type=int, default=20, help='每种 Accept-Encoding 的下载次数')
+    args = parser.parse_args()
+
+    samples = [
+        ('log.txt', sample_log(args.file_size)),
+        ('table.xls', sample_csv(args.file_size)),
+        ('random.txt', os.urandom(args.file_size)),
+    ]
+
+    with tempfile.TemporaryDirectory() as workdir:
+        app_module = load_app(workdir)
+        app = app_module.app
+        client = app.test_client()
+
+        print(f"{'文件':<12}{'编码':<10}{'压缩耗时(s)':>12}{'大小':>12}{'压缩率':>8}{'保存':>6}")
+        for index, (filename, data) in enumerate(samples):
+            code = f'CMP{index:03d}'
+            create_share(app_module, data, code, original_filename=filename, file_type=filename.rsplit('.', 1)[1])
+            with app.app_context():
+                md5 = app_module.FileRecord.query.filter_by(code=code).first().md5_filename
+                for encoding in app_module.compression_settings.encodings:
+                    single = app_module.CompressionSettings(app.config)
+                    single.encodings = [encoding]
+                    with Timer() as timer:
+                        results = app_module.compress_blob(app_module.storage, md5, single)
+                    for _, size, stored in results:
+                        print(f"{filename:<12}{encoding:<10}{timer.elapsed:>12.2f}{size:>12}"
+                              f"{size / len(data):>8.1%}{'是' if stored else '否':>6}")
+
+        print()
+        print(f"{'文件':<12}{'Accept-Encoding':<16}{'响应编码':<10}{'传输字节':>12}{'p50(ms)':>10}{'p99(ms)':>10}")
+        for index, (filename, data) in enumerate(samples):
+            code = f'CMP{index:03d}'
+            for label, accept in ACCEPT:
+                times, sent, encoding = [], 0, None
+                for _ in range(args.downloads):
+                    with Timer() as timer:
+                        response = client.get(f'/download/{code}', headers={'Accept-Encoding': accept})
+                        body = response.get_data()
+                    times.append(timer.elapsed)
+                    sent = len(body)
+                    encoding = response.headers.get('Content-Encoding', 'identity')
+                print(f"{filename:<12}{label:<16}{encoding:<10}{sent:>12}"
+                      f"{percentile(times, 50) * 1000:>10.1f}{percentile(times, 99) * 1000:>10.1f}")
+
+        app_module.download_log.flush()
+        with app.app_context():
+            for record in app_module.FileRecord.query.order_by(app_module.FileRecord.code):
+                print(f"{record.original_filename}: 压缩传输共节省 {record.bytes_saved} 字节")
+
+
+if __name__ == '__main__':
+    main()
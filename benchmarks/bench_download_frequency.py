@@ -0,0 +1,73 @@
+"""下载频率检查在 download_record 增长时的延迟：进程内滑动窗口 vs 按下载记录计数
+
+用法：python benchmarks/bench_download_frequency.py --rows 10000,100000,1000000 --checks 2000
+"""
+import argparse
+import random
+import tempfile
+from datetime import timedelta
+
+from _common import Timer, load_app, percentile
+
+
+def random_ip():
+    return f'10.{random.randint(0, 255)}.{random.randint(0, 255)}.{random.randint(1, 254)}'
+
+
+def seed_downloads(app_module, count):
+    """批量插入 count 条随机下载记录"""
+    table = app_module.DownloadRecord.__table__
+    now = app_module.get_eastern8_time()
+    batch = []
+    for i in range(count):
+        batch.append({
+            'file_id': random.randint(1, 1000),
+            'downloader_ip': random_ip(),
+            'download_time': now - timedelta(seconds=random.randint(0, 60 * 86400)),
+            'user_agent': 'bench',
+        })
+        if len(batch) >= 50000 or i == count - 1:
+            app_module.db.session.execute(table.insert(), batch)
+            batch = []
+    app_module.db.session.commit()
+
+
+def time_checks(window, checks):
+    latencies = []
+    for _ in range(checks):
+        ip, file_id = random_ip(), random.randint(1, 1000)
+        with Timer() as t:
+            window.allow(ip, file_id)
+        latencies.append(t.elapsed)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', default='10000,100000,1000000', help='逗号分隔的下载记录数量级')
+    parser.add_argument('--checks', type=int, default=2000, help='每个数量级的检查次数')
+    args = parser.parse_args()
+    levels = [int(x) for x in args.rows.split(',')]
+
+    with tempfile.TemporaryDirectory() as workdir:
+        app_module = load_app(workdir)
+        from rate_window import create_rate_window
+        windows = {
+            'memory://': create_rate_window('memory://', 3, 5),
+            'database': create_rate_window('database', 3, 5),
+        }
+
+        print(f"{'下载记录数':>12}{'后端':>12}{'平均(us)':>12}{'p99(us)':>12}")
+        seeded = 0
+        with app_module.app.app_context():
+            for level in levels:
+                seed_downloads(app_module, level - seeded)
+                seeded = level
+                for name, window in windows.items():
+                    latencies = time_checks(window, args.checks)
+                    print(f"{level:>12}{name:>12}{sum(latencies) / len(latencies) * 1e6:>12.1f}"
+                          f"{percentile(latencies, 99) * 1e6:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
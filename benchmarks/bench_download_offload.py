@@ -0,0 +1,68 @@
+"""比较 send_from_directory 与 X-Accel-Redirect 两种下载模式下 Flask worker 的占用时间和吞吐
+
+用法：python benchmarks/bench_download_offload.py --size-mb 50 --downloads 20 --client-mbps 20
+
+worker 占用时间 = 从请求进入 Flask 到响应体被完全消费的时间。--client-mbps 模拟客户端带宽，
+回退模式下文件体经由 Flask 发送，占用时间随文件大小/带宽线性增长；卸载模式下文件体由 nginx
+发送，Flask 只返回响应头。
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from _common import Timer, create_share, load_app, percentile
+
+
+def run_mode(app_module, code, downloads, client_bps, offload):
+    app = app_module.app
+    app.config['DOWNLOAD_OFFLOAD'] = offload
+    client = app.test_client()
+    occupancy = []
+    flask_bytes = 0
+
+    for _ in range(downloads):
+        with Timer() as t:
+            response = client.get(f'/download/{code}', buffered=False)
+            assert response.status_code == 200, response.status_code
+            for chunk in response.response:
+                flask_bytes += len(chunk)
+                if client_bps:
+                    time.sleep(len(chunk) / client_bps)  # 模拟慢速客户端的背压
+            response.close()
+        occupancy.append(t.elapsed)
+
+    total = sum(occupancy)
+    return {
+        'mode': 'x-accel-redirect' if offload else 'send_from_directory',
+        'mean_ms': total / downloads * 1000,
+        'p99_ms': percentile(occupancy, 99) * 1000,
+        'flask_mb': flask_bytes / 1024 / 1024,
+        'downloads_per_worker_s': downloads / total if total else float('inf'),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size-mb', type=int, default=50, help='测试文件大小(MB)')
+    parser.add_argument('--downloads', type=int, default=20, help='每种模式的下载次数')
+    parser.add_argument('--client-mbps', type=float, default=0, help='模拟客户端带宽(MB/s)，0 表示不限速')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        app_module = load_app(workdir)
+        code = 'Bench1'
+        create_share(app_module, os.urandom(args.size_mb * 1024 * 1024), code)
+
+        client_bps = args.client_mbps * 1024 * 1024
+        print(f"文件大小 {args.size_mb}MB，每种模式 {args.downloads} 次下载，客户端带宽 "
+              f"{args.client_mbps or '不限'} MB/s")
+        print(f"{'模式':<22}{'平均占用(ms)':>14}{'p99(ms)':>12}{'经Flask(MB)':>14}{'单worker下载/s':>18}")
+        for offload in (False, True):
+            r = run_mode(app_module, code, args.downloads, client_bps, offload)
+            print(f"{r['mode']:<22}{r['mean_ms']:>14.2f}{r['p99_ms']:>12.2f}"
+                  f"{r['flask_mb']:>14.1f}{r['downloads_per_worker_s']:>18.1f}")
+
+
+if __name__ == '__main__':
+    main()
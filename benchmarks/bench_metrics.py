@@ -0,0 +1,93 @@
+"""运行指标的开销：关闭 / 开启 METRICS_ENABLED 时各路由的处理时间
+
+用法：python benchmarks/bench_metrics.py --requests 200 --rounds 5
+
+以开启指标的配置加载应用，“关闭”时移除指标的请求钩子和数据库事件并把 enabled 设为 False
+（与未启用时的状态相同）。两种状态交替运行 --rounds 轮，每轮用测试客户端依次请求首页、提取码
+校验、下载和管理员搜索（带数据库查询）各 --requests 次，取各轮中最快的平均处理时间，减小
+机器负载波动的影响。最后统计一次 /admin/metrics 输出的耗时和大小。
+"""
+import argparse
+import tempfile
+
+from sqlalchemy import event
+
+from _common import Timer, create_share, load_app
+
+CODE = 'METRIC'
+ROUTES = [
+    ('index', 'GET', '/'),
+    ('check_code', 'POST', '/'),
+    ('download', 'GET', f'/download/{CODE}'),
+    ('admin_search', 'GET', '/admin/search?q=report'),
+]
+
+
+def set_enabled(app, engine, metrics, enabled):
+    hooks = [(app.before_request_funcs[None], metrics._before_request),
+             (app.after_request_funcs[None], metrics._after_request),
+             (app.teardown_request_funcs[None], metrics._teardown_request)]
+    listeners = [('before_cursor_execute', metrics._before_cursor_execute),
+                 ('after_cursor_execute', metrics._after_cursor_execute)]
+    metrics.enabled = enabled
+    for funcs, hook in hooks:
+        if enabled:
+            funcs.insert(0, hook)  # 与 init_app 相同：before_request 在最前面，其余钩子的顺序不影响计时
+        else:
+            funcs.remove(hook)
+    for name, listener in listeners:
+        if enabled:
+            event.listen(engine, name, listener)
+        else:
+            event.remove(engine, name, listener)
+
+
+def measure(client, method, path, requests):
+    with Timer() as timer:
+        for _ in range(requests):
+            if method == 'POST':
+                client.post(path, data={'code': CODE}).get_data()
+            else:
+                client.get(path).get_data()
+    return timer.elapsed / requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=200, help='每轮每个路由的请求次数')
+    parser.add_argument('--rounds', type=int, default=5, help='关闭/开启交替的轮数')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        app_module = load_app(workdir, METRICS_ENABLED=True)
+        app, metrics = app_module.app, app_module.metrics
+        for i in range(200):
+            create_share(app_module, f'file {i}'.encode(), f'M{i:05d}', original_filename=f'report-{i}.txt')
+        create_share(app_module, b'x' * 64 * 1024, CODE)
+        with app.app_context():
+            engine = app_module.db.engine
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['admin_logged_in'] = True
+        for _, method, path in ROUTES:
+            measure(client, method, path, 20)  # 预热
+
+        best = {mode: {name: float('inf') for name, _, _ in ROUTES} for mode in ('off', 'on')}
+        for _ in range(args.rounds):
+            for mode in ('off', 'on'):
+                set_enabled(app, engine, metrics, mode == 'on')
+                for name, method, path in ROUTES:
+                    best[mode][name] = min(best[mode][name], measure(client, method, path, args.requests))
+
+        print(f"{'路由':<14}{'关闭(us)':>12}{'开启(us)':>12}{'增加(us)':>12}")
+        for name, _, _ in ROUTES:
+            off, on = best['off'][name], best['on'][name]
+            print(f"{name:<14}{off * 1e6:>12.0f}{on * 1e6:>12.0f}{(on - off) * 1e6:>12.0f}")
+
+        with Timer() as timer:
+            body = client.get('/admin/metrics').get_data()
+        print(f"/admin/metrics 输出：{timer.elapsed * 1000:.1f} ms，{len(body)} 字节")
+
+
+if __name__ == '__main__':
+    main()
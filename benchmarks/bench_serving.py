@@ -0,0 +1,120 @@
+"""开发服务器（app.run）与生产服务器（python app.py --serve，gunicorn）的吞吐和延迟对比
+
+用法：python benchmarks/bench_serving.py --clients 8 --seconds 10 --workers 4 --threads 8
+
+每种服务器在单独的进程中运行，使用同一个临时数据库和上传目录。--clients 个客户端进程各自用一个
+keep-alive 连接循环请求，分别测试首页、下载（--file-size 字节的文件，不限下载次数）和管理员
+首页（先登录，带会话 Cookie 请求），统计每秒请求数、p50/p99 延迟和失败数。
+"""
+import argparse
+import http.client
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from _common import Client, create_share, free_port, load_app, login, percentile, wait_for_port
+
+CODES = [f'S{i:05d}' for i in range(50)]
+
+
+def run_server(kind, workdir, port, workers, threads):
+    """子进程入口：加载应用并运行指定的服务器"""
+    app_module = load_app(workdir)
+    if kind == 'dev':
+        import logging
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+        app_module.app.run(host='127.0.0.1', port=port, debug=False)
+    else:
+        settings = app_module.ServerSettings(app_module.app.config, '127.0.0.1', port,
+                                             workers=workers, threads=threads)
+        app_module.serve(app_module.app, settings, post_fork=app_module.reset_after_fork,
+                         worker_exit=app_module.download_log.close)
+
+
+def client_loop(port, target, seconds, index, password):
+    """客户端进程：在 seconds 秒内循环请求 target，返回 (延迟列表, 失败数)"""
+    client = Client(port)
+    headers = {}
+    if target == 'admin':
+        headers['Cookie'] = login(client, password)
+    latencies, errors = [], 0
+    n = index
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        if target == 'index':
+            path = '/'
+        elif target == 'download':
+            path = f'/download/{CODES[n % len(CODES)]}'
+            headers['X-Forwarded-For'] = f'10.{index}.{n // 250 % 250}.{n % 250 + 1}'
+        else:
+            path = '/admin'
+        n += 1
+        start = time.perf_counter()
+        try:
+            response, _ = client.request('GET', path, headers=headers)
+            ok = response.status == 200
+        except (http.client.HTTPException, OSError):
+            ok = False
+        if ok:
+            latencies.append(time.perf_counter() - start)
+        else:
+            errors += 1
+    client.close()
+    return latencies, errors
+
+
+def measure(port, target, clients, seconds, password):
+    with multiprocessing.Pool(clients) as pool:
+        results = pool.starmap(client_loop, [(port, target, seconds, i, password) for i in range(clients)])
+    latencies = [t for result, _ in results for t in result]
+    errors = sum(e for _, e in results)
+    return len(latencies) / seconds, percentile(latencies, 50), percentile(latencies, 99), errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=8, help='并发客户端（进程）数')
+    parser.add_argument('--seconds', type=float, default=10, help='每项测试的持续时间(秒)')
+    parser.add_argument('--workers', type=int, default=4, help='生产服务器 worker 进程数')
+    parser.add_argument('--threads', type=int, default=8, help='生产服务器每个 worker 的线程数')
+    parser.add_argument('--file-size', type=int, default=64 * 1024, help='下载文件大小(字节)')
+    parser.add_argument('--server', choices=['dev', 'prod'], help=argparse.SUPPRESS)
+    parser.add_argument('--workdir', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.server:
+        run_server(args.server, args.workdir, args.port, args.workers, args.threads)
+        return
+
+    with tempfile.TemporaryDirectory() as workdir:
+        app_module = load_app(workdir)
+        password = app_module.app.config['ADMIN_PASSWORD']
+        for i, code in enumerate(CODES):
+            data = os.urandom(args.file_size - 8) + i.to_bytes(8, 'big')
+            create_share(app_module, data, code)
+        with app_module.app.app_context():
+            app_module.db.engine.dispose()
+
+        print(f"{'服务器':<8}{'接口':<10}{'请求/s':>10}{'p50(ms)':>10}{'p99(ms)':>10}{'失败':>8}")
+        for kind in ('dev', 'prod'):
+            port = free_port()
+            server = subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__), '--server', kind, '--workdir', workdir,
+                 '--port', str(port), '--workers', str(args.workers), '--threads', str(args.threads)],
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                wait_for_port(port)
+                for target in ('index', 'download', 'admin'):
+                    rps, p50, p99, errors = measure(port, target, args.clients, args.seconds, password)
+                    print(f"{kind:<8}{target:<10}{rps:>10.0f}{p50 * 1000:>10.1f}{p99 * 1000:>10.1f}{errors:>8}")
+            finally:
+                server.terminate()
+                server.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""并发下载吞吐：SQLite 默认配置 vs 性能配置（WAL、synchronous=NORMAL、busy_timeout、连接池）
+
+用法：python benchmarks/bench_sqlite_concurrency.py --clients 1,8,32 --seconds 5
+
+每次下载都会写入下载记录并更新下载计数。每种配置在独立子进程中启动多线程 WSGI 服务器，
+N 个客户端线程持续请求下载接口（文件只有几个字节，耗时主要在数据库），统计成功下载/s
+和失败数（如 database is locked 导致的 500）。
+"""
+import argparse
+import http.client
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from _common import create_share, load_app, percentile
+
+PROFILES = {
+    # 原始配置：默认 journal_mode=DELETE，无 busy_timeout，SQLAlchemy 默认连接池
+    'default': {'SQLITE_PRAGMAS': {}, 'SQLALCHEMY_ENGINE_OPTIONS': {}},
+    # config.py 中的性能配置
+    'tuned': {},
+}
+
+
+def run_profile(profile, clients, seconds, shares):
+    from werkzeug.serving import make_server
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)  # 关闭逐请求的访问日志
+
+    with tempfile.TemporaryDirectory() as workdir:
+        app_module = load_app(workdir, **PROFILES[profile])
+        codes = [f'B{i:05d}' for i in range(shares)]
+        for i, code in enumerate(codes):
+            create_share(app_module, f'share-{i}'.encode(), code)
+
+        server = make_server('127.0.0.1', 0, app_module.app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        port = server.server_port
+
+        results = {'ok': 0, 'errors': 0, 'latencies': []}
+        lock = threading.Lock()
+        deadline = time.perf_counter() + seconds
+
+        def client(index):
+            conn = http.client.HTTPConnection('127.0.0.1', port)
+            ok = errors = 0
+            latencies = []
+            n = index
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                conn.request('GET', f'/download/{codes[n % len(codes)]}',
+                             headers={'X-Forwarded-For': f'10.0.{index}.{n % 250 + 1}'})
+                response = conn.getresponse()
+                response.read()
+                latencies.append(time.perf_counter() - start)
+                if response.status == 200:
+                    ok += 1
+                else:
+                    errors += 1
+                n += 1
+            conn.close()
+            with lock:
+                results['ok'] += ok
+                results['errors'] += errors
+                results['latencies'].extend(latencies)
+
+        threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        server.shutdown()
+
+        return {
+            'profile': profile,
+            'clients': clients,
+            'downloads_per_s': results['ok'] / seconds,
+            'errors': results['errors'],
+            'p99_ms': percentile(results['latencies'], 99) * 1000,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', default='1,8,32', help='逗号分隔的并发客户端数')
+    parser.add_argument('--seconds', type=float, default=5, help='每轮持续时间(秒)')
+    parser.add_argument('--shares', type=int, default=50, help='参与测试的分享数量')
+    parser.add_argument('--profile', choices=list(PROFILES), help='仅在子进程内部使用')
+    args = parser.parse_args()
+
+    if args.profile:
+        print(json.dumps(run_profile(args.profile, int(args.clients), args.seconds, args.shares)))
+        return
+
+    print(f"{'配置':<10}{'客户端':>8}{'下载/s':>10}{'失败数':>8}{'p99(ms)':>10}")
+    for clients in args.clients.split(','):
+        for profile in PROFILES:
+            output = subprocess.check_output([
+                sys.executable, __file__, '--profile', profile, '--clients', clients,
+                '--seconds', str(args.seconds), '--shares', str(args.shares),
+            ], env=dict(os.environ, PYTHONWARNINGS='ignore'))
+            r = json.loads(output.decode().strip().splitlines()[-1])
+            print(f"{r['profile']:<10}{r['clients']:>8}{r['downloads_per_s']:>10.1f}"
+                  f"{r['errors']:>8}{r['p99_ms']:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""本地存储目录布局对比：全部平铺在上传目录中 vs 按哈希前缀分层（ab/<md5>、ab/cd/<md5>）
+
+用法：python benchmarks/bench_storage_layout.py --files 200000 --lookups 20000 --depths 0,1,2
+
+在临时目录中分别以 --depths 中的每个 STORAGE_SHARD_DEPTH 创建 --files 个小文件（通过 LocalStorage.put_file，
+与上传路径相同），然后测量：
+
+- 写入：put_file 的总耗时
+- 查找：随机文件名的 exists（下载前的存在性检查）和 open 的 p50/p99 延迟
+- 遍历：scan 整个存储（孤立文件清理）的耗时
+- 列根目录：os.scandir(上传目录) 的耗时（平铺时包含所有文件，分层时最多 256 个子目录）
+
+--drop-caches 会在查找和遍历前清空页缓存（需要 root 权限），测量冷缓存下的表现。
+"""
+import argparse
+import hashlib
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from _common import APP_DIR, Timer, percentile
+
+sys.path.insert(0, APP_DIR)
+from storage import LocalStorage  # noqa: E402
+
+
+def drop_caches():
+    os.sync()
+    try:
+        with open('/proc/sys/vm/drop_caches', 'w') as f:
+            f.write('3')
+    except OSError as e:
+        print(f"无法清空页缓存（{e}），继续使用热缓存")
+
+
+def fill(storage, names, payload):
+    temp_dir = storage.temp_dir
+    for name in names:
+        temp_path = os.path.join(temp_dir, '.upload-' + name)
+        with open(temp_path, 'wb') as f:
+            f.write(payload)
+        storage.put_file(temp_path, name)
+
+
+def measure_lookups(storage, names, lookups):
+    exists_times, open_times = [], []
+    for name in random.sample(names, min(lookups, len(names))):
+        start = time.perf_counter()
+        storage.exists(name)
+        exists_times.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        storage.open(name).close()
+        open_times.append(time.perf_counter() - start)
+    return exists_times, open_times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--files', type=int, default=200000, help='文件数')
+    parser.add_argument('--lookups', type=int, default=20000, help='随机查找次数')
+    parser.add_argument('--file-size', type=int, default=64, help='每个文件的大小(字节)')
+    parser.add_argument('--depths', default='0,1,2', help='要比较的分层层数，逗号分隔')
+    parser.add_argument('--drop-caches', action='store_true', help='查找和遍历前清空页缓存（需要 root）')
+    args = parser.parse_args()
+
+    names = [hashlib.md5(str(i).encode()).hexdigest() for i in range(args.files)]
+    payload = os.urandom(args.file_size)
+
+    print(f"{'布局':<10}{'写入(s)':>10}{'exists p50(us)':>16}{'exists p99(us)':>16}"
+          f"{'open p50(us)':>14}{'open p99(us)':>14}{'遍历(s)':>10}{'列根目录(ms)':>14}")
+    for depth in (int(value) for value in args.depths.split(',')):
+        label = f'depth={depth}'
+        root = tempfile.mkdtemp(prefix=f'bench-{label}-')
+        try:
+            storage = LocalStorage(root, shard_depth=depth)
+            with Timer() as write:
+                fill(storage, names, payload)
+
+            if args.drop_caches:
+                drop_caches()
+            exists_times, open_times = measure_lookups(storage, names, args.lookups)
+
+            if args.drop_caches:
+                drop_caches()
+            with Timer() as scan:
+                # 平铺布局中所有文件都在根目录，scan 只遍历分层目录，这里一并计入根目录（同样读取 stat）
+                scanned = sum(1 for _ in storage.scan()) + sum(
+                    1 for entry in os.scandir(root) if entry.is_file() and entry.stat())
+            with Timer() as listing:
+                sum(1 for _ in os.scandir(root))
+            assert scanned == args.files, (scanned, args.files)
+
+            print(f"{label:<10}{write.elapsed:>10.2f}"
+                  f"{percentile(exists_times, 50) * 1e6:>16.1f}{percentile(exists_times, 99) * 1e6:>16.1f}"
+                  f"{percentile(open_times, 50) * 1e6:>14.1f}{percentile(open_times, 99) * 1e6:>14.1f}"
+                  f"{scan.elapsed:>10.2f}{listing.elapsed * 1000:>14.1f}")
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
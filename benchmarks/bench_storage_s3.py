@@ -0,0 +1,104 @@
+"""S3 存储后端：预签名 URL 重定向 vs 应用流式转发
+
+用法：python benchmarks/bench_storage_s3.py --downloads 50 --file-size 4194304
+      python benchmarks/bench_storage_s3.py --endpoint http://127.0.0.1:9000 --bucket share  # 使用已有的 MinIO
+
+未指定 --endpoint 时启动本地 moto_server（pip install "moto[server]"）作为 S3 的替身。
+依次以两种方式各下载 --downloads 次同一个分享，校验内容并统计应用处理时间（校验 + 生成响应，
+流式转发时包括整个文件体经过应用的时间）和端到端时间：
+
+- presigned：应用返回 302 到预签名 URL，客户端直接从对象存储下载
+- streamed：应用从对象存储读取并转发文件体（STORAGE_S3_PRESIGNED_DOWNLOADS=False）
+
+另外测试流式转发的 Range 请求（续传）只读取请求的范围。
+"""
+import argparse
+import hashlib
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from _common import create_share, free_port, load_app, percentile, wait_for_port
+
+CODE = 'S3BENC'
+
+
+def start_moto():
+    port = free_port()
+    server = subprocess.Popen(['moto_server', '-p', str(port)],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    wait_for_port(port)
+    return server, f'http://127.0.0.1:{port}'
+
+
+def measure(client, app_module, data, downloads, presigned):
+    app_module.app.config['STORAGE_S3_PRESIGNED_DOWNLOADS'] = presigned
+    app_times, total_times = [], []
+    for i in range(downloads):
+        started = time.perf_counter()
+        response = client.get(f'/download/{CODE}', headers={'X-Forwarded-For': f'10.0.{i // 250}.{i % 250 + 1}'})
+        if presigned:
+            if response.status_code != 302:
+                raise RuntimeError(f'下载失败：{response.status_code}')
+            app_times.append(time.perf_counter() - started)
+            with urllib.request.urlopen(response.headers['Location']) as remote:
+                body = remote.read()
+        else:
+            body = response.get_data()  # 流式响应在读取时才从对象存储拉取
+            app_times.append(time.perf_counter() - started)
+        total_times.append(time.perf_counter() - started)
+        if body != data:
+            raise RuntimeError('下载内容不一致')
+    return app_times, total_times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--downloads', type=int, default=50, help='每种方式的下载次数')
+    parser.add_argument('--file-size', type=int, default=4 * 1024 * 1024, help='文件大小(字节)')
+    parser.add_argument('--endpoint', help='S3 兼容服务地址（默认启动 moto_server）')
+    parser.add_argument('--bucket', default='bench-share', help='存储桶（不存在时创建）')
+    args = parser.parse_args()
+
+    server = None
+    endpoint = args.endpoint
+    if endpoint is None:
+        os.environ.setdefault('AWS_ACCESS_KEY_ID', 'bench')
+        os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'bench')
+        server, endpoint = start_moto()
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            app_module = load_app(workdir, STORAGE_BACKEND='s3', STORAGE_S3_BUCKET=args.bucket,
+                                  STORAGE_S3_ENDPOINT_URL=endpoint, STORAGE_S3_REGION='us-east-1',
+                                  STORAGE_S3_PREFIX='files/')
+            client_s3 = app_module.storage.client
+            if args.bucket not in [b['Name'] for b in client_s3.list_buckets()['Buckets']]:
+                client_s3.create_bucket(Bucket=args.bucket)
+
+            data = os.urandom(args.file_size)
+            create_share(app_module, data, CODE)
+            client = app_module.app.test_client()
+
+            print(f"{'方式':<12}{'应用p50(ms)':>14}{'应用p99(ms)':>14}{'端到端p50(ms)':>16}{'端到端p99(ms)':>16}")
+            for label, presigned in (('presigned', True), ('streamed', False)):
+                app_times, total_times = measure(client, app_module, data, args.downloads, presigned)
+                print(f"{label:<12}{percentile(app_times, 50) * 1000:>14.1f}{percentile(app_times, 99) * 1000:>14.1f}"
+                      f"{percentile(total_times, 50) * 1000:>16.1f}{percentile(total_times, 99) * 1000:>16.1f}")
+
+            # 续传：只转发请求的范围
+            start = args.file_size // 2
+            response = client.get(f'/download/{CODE}', headers={
+                'Range': f'bytes={start}-', 'If-Range': f'"{hashlib.md5(data).hexdigest()}"'})
+            ok = response.status_code == 206 and response.get_data() == data[start:]
+            print(f"Range 续传：{response.status_code}，{response.headers.get('Content-Range')}，内容{'一致' if ok else '不一致'}")
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
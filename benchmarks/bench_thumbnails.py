@@ -0,0 +1,66 @@
+"""图片预览：缩略图生成与缓存命中的耗时，以及预览与下载原图的流量对比
+
+用法：python benchmarks/bench_thumbnails.py --images 20 --width 4000 --height 3000
+
+生成 --images 张 --width x --height 的 JPEG 照片（随机噪声，接近真实照片的大小），依次测量：
+
+- 首次预览：缩略图由后台线程池生成（包含 JPEG 按缩小尺寸解码），请求等待生成完成
+- 再次预览：直接发送磁盘缓存中的缩略图
+- 下载原图：用户原来只能下载整张图片确认内容
+
+并输出每张图片的平均响应字节数。
+"""
+import argparse
+import io
+import os
+import tempfile
+
+from PIL import Image
+
+from _common import Timer, create_share, load_app
+
+
+def make_photo(width, height):
+    """随机噪声放大后的 JPEG，压缩率接近普通照片"""
+    noise = Image.frombytes('RGB', (width // 8, height // 8), os.urandom(width // 8 * (height // 8) * 3))
+    buffer = io.BytesIO()
+    noise.resize((width, height), Image.Resampling.BILINEAR).save(buffer, 'JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--images', type=int, default=20, help='图片数量')
+    parser.add_argument('--width', type=int, default=4000, help='图片宽度（像素）')
+    parser.add_argument('--height', type=int, default=3000, help='图片高度（像素）')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        app_module = load_app(workdir, ADMIN_PASSWORD='bench', THUMBNAIL_WAIT=60)
+        client = app_module.app.test_client()
+        client.post('/admin/login', data={'admin_password': 'bench'})
+
+        ids, codes = [], []
+        for i in range(args.images):
+            code = f'IMG{i:03d}'
+            ids.append(create_share(app_module, make_photo(args.width, args.height), code,
+                                    original_filename=f'{code}.jpg', file_type='jpg'))
+            codes.append(code)
+
+        print(f"{args.images} 张 {args.width}x{args.height} 的 JPEG")
+        print(f"{'请求':<10}{'平均耗时(ms)':>14}{'平均大小(KB)':>14}")
+        for name, paths in [('首次预览', [f'/admin/file/{file_id}/thumbnail' for file_id in ids]),
+                            ('再次预览', [f'/admin/file/{file_id}/thumbnail' for file_id in ids]),
+                            ('下载原图', [f'/download/{code}' for code in codes])]:
+            size = 0
+            with Timer() as timer:
+                for path in paths:
+                    response = client.get(path)
+                    assert response.status_code == 200, (path, response.status_code)
+                    size += sum(len(chunk) for chunk in response.response)
+                    response.close()
+            print(f"{name:<10}{timer.elapsed / len(paths) * 1000:>14.1f}{size / len(paths) / 1024:>14.1f}")
+
+
+if __name__ == '__main__':
+    main()
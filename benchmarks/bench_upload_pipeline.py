@@ -0,0 +1,84 @@
+"""比较单次流式上传与原多次读取上传的耗时和峰值内存
+
+用法：python benchmarks/bench_upload_pipeline.py --size-mb 200 --uploads 3
+
+每种模式在独立子进程中运行，峰值 RSS 取子进程的 ru_maxrss。legacy 模式使用 Flask 默认的
+请求类（Werkzeug 先写入 SpooledTemporaryFile，再经 MD5、seek、save 多次读取），
+streaming 模式使用 ingest.StreamingUploadRequest。
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+
+from _common import Timer, load_app
+
+
+def run_mode(mode, size_mb, uploads):
+    with tempfile.TemporaryDirectory() as workdir:
+        app_module = load_app(workdir)
+        app = app_module.app
+        if mode == 'legacy':
+            from flask import Request
+            app.request_class = Request
+
+        source = os.path.join(workdir, 'source.bin')
+        with open(source, 'wb') as f:
+            for _ in range(size_mb):
+                f.write(os.urandom(1024 * 1024))
+
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['admin_logged_in'] = True
+
+        baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        elapsed = []
+        for i in range(uploads):
+            with open(source, 'rb') as f:
+                with Timer() as t:
+                    response = client.post('/admin/add', data={
+                        'file': (f, f'upload{i}.zip'),
+                        'expire_days': '7',
+                        'max_downloads': '1',
+                    }, content_type='multipart/form-data')
+            assert response.status_code == 302, response.status_code
+            elapsed.append(t.elapsed)
+
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return {
+            'mode': mode,
+            'mean_s': sum(elapsed) / len(elapsed),
+            'mb_per_s': size_mb * uploads / sum(elapsed),
+            'peak_rss_mb': peak_rss / 1024,
+            'rss_growth_mb': (peak_rss - baseline_rss) / 1024,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size-mb', type=int, default=200, help='上传文件大小(MB)')
+    parser.add_argument('--uploads', type=int, default=3, help='每种模式的上传次数')
+    parser.add_argument('--mode', choices=['legacy', 'streaming'], help='仅在子进程内部使用')
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run_mode(args.mode, args.size_mb, args.uploads)))
+        return
+
+    print(f"文件大小 {args.size_mb}MB，每种模式上传 {args.uploads} 次")
+    print(f"{'模式':<12}{'平均耗时(s)':>12}{'吞吐(MB/s)':>12}{'峰值RSS(MB)':>14}{'RSS增长(MB)':>14}")
+    for mode in ('legacy', 'streaming'):
+        output = subprocess.check_output([
+            sys.executable, __file__, '--mode', mode,
+            '--size-mb', str(args.size_mb), '--uploads', str(args.uploads),
+        ])
+        r = json.loads(output.decode().strip().splitlines()[-1])
+        print(f"{r['mode']:<12}{r['mean_s']:>12.3f}{r['mb_per_s']:>12.1f}"
+              f"{r['peak_rss_mb']:>14.1f}{r['rss_growth_mb']:>14.1f}")
+
+
+if __name__ == '__main__':
+    main()
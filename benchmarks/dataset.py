@@ -0,0 +1,191 @@
+"""基准测试数据集：按指定规模生成分享、文件实体、下载记录和管理员登录记录
+
+用法：python benchmarks/dataset.py --workdir /tmp/share-bench --files 100000 --downloads 1000000 \\
+          --login-attempts 50000 --blobs 500 --blob-sizes 4096,65536,1048576 --seed 1
+
+在 --workdir 中生成数据库（bench.db）和上传目录（files/），与 load_app 的布局相同。同一组参数
+（包括 --seed）生成的数据完全相同；目录中已有相同参数的数据集时直接复用。生成后写入
+dataset.json，记录参数和测试时使用的有效提取码、搜索词，run_suite.py 读取它驱动各个接口。
+
+- 文件实体：--blobs 个不同内容的文件，大小从 --blob-sizes 中随机选取，按存储后端的布局写入
+- 分享：--files 个，依次引用各文件实体（同内容多次分享），分布在过去 30 天内创建；其中
+  --expired-ratio 已过期、--used-up-ratio 下载次数已用完、--inactive-ratio 已禁用（留给清理
+  和列表页），其余有效且不限下载次数（压测期间不会用完）
+- 下载记录：--downloads 条，随机分布到各分享和过去 60 天内（部分超过保留期，留给清理）
+- 管理员登录记录：--login-attempts 条，分布在过去 14 天内，约十分之一成功
+
+生成后重建文件引用计数、后台统计和全文索引，与正常运行积累的数据状态一致。
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+from datetime import timedelta
+
+from _common import load_app, write_blob
+
+BATCH = 50000
+MANIFEST = 'dataset.json'
+WORDS = ['report', 'invoice', 'photo', 'backup', 'slides', 'contract', 'budget', 'manual', 'video', 'archive']
+TYPES = ['pdf', 'zip', 'txt', 'jpg', 'docx', 'mp4', 'xlsx']
+SAMPLE_CODES = 1000  # dataset.json 中保存的有效提取码数
+
+
+def dataset_spec(args):
+    """决定数据集内容的参数（相同参数生成相同数据）"""
+    return {
+        'files': args.files,
+        'downloads': args.downloads,
+        'login_attempts': args.login_attempts,
+        'blobs': args.blobs,
+        'blob_sizes': sorted(int(size) for size in args.blob_sizes.split(',')),
+        'expired_ratio': args.expired_ratio,
+        'used_up_ratio': args.used_up_ratio,
+        'inactive_ratio': args.inactive_ratio,
+        'seed': args.seed,
+    }
+
+
+def add_dataset_arguments(parser):
+    parser.add_argument('--files', type=int, default=20000, help='分享数')
+    parser.add_argument('--downloads', type=int, default=200000, help='下载记录数')
+    parser.add_argument('--login-attempts', type=int, default=10000, help='管理员登录记录数')
+    parser.add_argument('--blobs', type=int, default=200, help='不同内容的文件实体数')
+    parser.add_argument('--blob-sizes', default='4096,65536,1048576', help='文件实体大小(字节)，逗号分隔，随机选取')
+    parser.add_argument('--expired-ratio', type=float, default=0.1, help='已过期分享的比例')
+    parser.add_argument('--used-up-ratio', type=float, default=0.05, help='下载次数已用完的分享比例')
+    parser.add_argument('--inactive-ratio', type=float, default=0.02, help='已禁用分享的比例')
+    parser.add_argument('--seed', type=int, default=1, help='随机种子')
+
+
+def load_manifest(workdir):
+    try:
+        with open(os.path.join(workdir, MANIFEST)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def ensure_dataset(workdir, spec, log=print):
+    """workdir 中没有相同参数的数据集时生成，返回 dataset.json 的内容"""
+    manifest = load_manifest(workdir)
+    if manifest is not None and manifest['spec'] == spec:
+        return manifest
+    if manifest is not None or os.path.exists(os.path.join(workdir, 'bench.db')):
+        raise RuntimeError(f'{workdir} 中已有其他参数的数据集，请换一个目录')
+    os.makedirs(workdir, exist_ok=True)
+    app_module = load_app(workdir)
+    manifest = generate(app_module, spec, log)
+    with app_module.app.app_context():
+        app_module.db.engine.dispose()
+    # 合并 WAL，数据集只剩 bench.db 一个文件，便于复制
+    with sqlite3.connect(os.path.join(workdir, 'bench.db')) as conn:
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    with open(os.path.join(workdir, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def generate(app_module, spec, log=print):
+    from models import AdminLoginAttempt  # load_app 之后 app 目录才在 sys.path 中
+
+    rng = random.Random(spec['seed'])
+    app = app_module.app
+    db = app_module.db
+    now = app_module.get_eastern8_time()
+
+    blobs = []
+    for i in range(spec['blobs']):
+        size = rng.choice(spec['blob_sizes'])
+        data = rng.randbytes(size - 8) + i.to_bytes(8, 'big')  # 末尾序号保证内容互不相同
+        md5 = write_blob(app_module.storage, data)
+        blobs.append((md5, size))
+    log(f'写入 {len(blobs)} 个文件实体')
+
+    valid_codes, terms = [], set()
+    with app.app_context():
+        file_table = app_module.FileRecord.__table__
+        batch = []
+        for i in range(spec['files']):
+            md5, size = blobs[i % len(blobs)]
+            word = rng.choice(WORDS)
+            file_type = rng.choice(TYPES)
+            code = f'D{i:07d}'
+            kind = rng.random()
+            expired = kind < spec['expired_ratio']
+            used_up = not expired and kind < spec['expired_ratio'] + spec['used_up_ratio']
+            inactive = (not expired and not used_up and
+                        kind < spec['expired_ratio'] + spec['used_up_ratio'] + spec['inactive_ratio'])
+            created_at = now - timedelta(seconds=rng.randint(60, 30 * 86400))
+            batch.append({
+                'code': code, 'md5_filename': md5, 'original_filename': f'{word}-{i}.{file_type}',
+                'file_size': size, 'file_type': file_type, 'uploader_ip': f'192.168.{i // 250 % 250}.{i % 250 + 1}',
+                'created_at': created_at,
+                'expires_at': created_at + timedelta(days=1) if expired else now + timedelta(days=30),
+                'download_count': 1 if used_up else 0, 'max_downloads': 1 if used_up else 0,
+                'is_active': not inactive, 'description': f'{word} {file_type} #{i}', 'bytes_saved': 0,
+            })
+            if not (expired or used_up or inactive):
+                if len(valid_codes) < SAMPLE_CODES:
+                    valid_codes.append(code)
+                terms.add(word)
+            if len(batch) >= BATCH or i == spec['files'] - 1:
+                db.session.execute(file_table.insert(), batch)
+                batch = []
+        db.session.commit()
+        log(f"写入 {spec['files']} 个分享")
+
+        download_table = app_module.DownloadRecord.__table__
+        for i in range(spec['downloads']):
+            batch.append({
+                'file_id': rng.randint(1, spec['files']),
+                'downloader_ip': f'10.{i // 62500 % 250}.{i // 250 % 250}.{i % 250 + 1}',
+                'download_time': now - timedelta(seconds=rng.randint(0, 60 * 86400)),
+                'user_agent': rng.choice(['Mozilla/5.0', 'curl/8.5', 'Wget/1.21']),
+            })
+            if len(batch) >= BATCH or i == spec['downloads'] - 1:
+                db.session.execute(download_table.insert(), batch)
+                batch = []
+        db.session.commit()
+        log(f"写入 {spec['downloads']} 条下载记录")
+
+        login_table = AdminLoginAttempt.__table__
+        for i in range(spec['login_attempts']):
+            batch.append({
+                'ip': f'172.16.{i // 250 % 250}.{i % 250 + 1}',
+                'attempt_time': now - timedelta(seconds=rng.randint(0, 14 * 86400)),
+                'username': 'admin',
+                'successful': rng.random() < 0.1,
+            })
+            if len(batch) >= BATCH or i == spec['login_attempts'] - 1:
+                db.session.execute(login_table.insert(), batch)
+                batch = []
+        db.session.commit()
+        log(f"写入 {spec['login_attempts']} 条管理员登录记录")
+
+        app_module.rebuild_blob_refs()
+        app_module.reconcile_stats(app.config['STATS_RECONCILE_HOURS'])
+        app_module.rebuild_search_index()
+        log('已重建文件引用计数、后台统计和全文索引')
+
+    return {
+        'spec': spec,
+        'valid_codes': valid_codes,
+        'search_terms': sorted(terms),
+        'admin_password': app.config['ADMIN_PASSWORD'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workdir', required=True, help='数据集目录（数据库和上传目录）')
+    add_dataset_arguments(parser)
+    args = parser.parse_args()
+    manifest = ensure_dataset(args.workdir, dataset_spec(args))
+    print(f"数据集：{args.workdir}，{len(manifest['valid_codes'])} 个示例提取码，"
+          f"搜索词 {', '.join(manifest['search_terms'])}")
+
+
+if __name__ == '__main__':
+    main()
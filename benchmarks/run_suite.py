@@ -0,0 +1,343 @@
+"""完整基准测试：在生成的数据集上启动本地服务器，用多进程负载生成器驱动各个接口
+
+用法：python benchmarks/run_suite.py --dataset /tmp/share-bench --files 100000 --downloads 1000000 \\
+          --output base.json
+      python benchmarks/run_suite.py --dataset /tmp/share-bench --files 100000 --downloads 1000000 \\
+          --output new.json --baseline base.json
+      python benchmarks/run_suite.py --compare base.json new.json
+
+数据集由 dataset.py 生成（参数相同时复用 --dataset 中已有的，未指定 --dataset 时生成在临时目录）。
+每次运行把数据集复制到临时目录（上传目录用硬链接），测试写入的数据不影响数据集，多次运行的
+起点相同。在副本上以生产服务器（gunicorn，--workers x --threads）启动应用，关闭速率限制和
+后台定时清理（客户端每次请求使用不同的 IP，不触发提取码爆破限制），依次运行各场景：
+
+- index：GET /
+- extract：POST / 提交有效提取码（302 到下载地址）
+- download：GET /download/<提取码>，每次使用不同的客户端 IP
+- upload：管理员登录后 POST /admin/add 上传 --upload-size 字节的新文件（成功数按新增的文件记录计）
+- admin：管理员首页、文件记录页、所有文件页轮流请求
+- search：GET /admin/search?q=<搜索词>
+- cleanup：停止服务器后在单独进程中执行一次完整清理（与 flask cleanup 相同，批间不暂停）
+
+每个 HTTP 场景先预热 --warmup 秒，再由 --clients 个客户端进程各用一个 keep-alive 连接运行
+--seconds 秒，统计吞吐、p50/p90/p99 延迟、失败数和服务器进程树（主进程加各 worker）的 RSS
+峰值。结果以 JSON 写入 --output，包括运行环境、代码版本和数据集参数；--baseline 或 --compare
+对比两次结果，列出各项的变化。
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+from _common import (APP_DIR, Client, free_port, load_app, login, percentile, process_tree_usage,
+                     wait_for_port)
+from dataset import add_dataset_arguments, dataset_spec, ensure_dataset
+
+HTTP_SCENARIOS = ['index', 'extract', 'download', 'upload', 'admin', 'search']
+SCENARIOS = HTTP_SCENARIOS + ['cleanup']
+ADMIN_PAGES = ['/admin', '/admin/records', '/admin/files']
+RESULT_VERSION = 1
+
+# 服务器进程中覆盖的配置：后台定时清理关闭，清理单独测量（速率限制由 load_app 关闭，
+# 提取码爆破限制按 IP 计算，客户端每次请求使用不同的 IP）
+SERVER_OVERRIDES = {
+    'CLEANUP_SCHEDULER_ENABLED': False,
+}
+
+
+def copy_dataset(dataset_dir, run_dir):
+    """复制数据库，上传目录逐个文件硬链接（不支持时复制）"""
+    shutil.copy2(os.path.join(dataset_dir, 'bench.db'), os.path.join(run_dir, 'bench.db'))
+
+    def link(source, target):
+        try:
+            os.link(source, target)
+        except OSError:
+            shutil.copy2(source, target)
+
+    shutil.copytree(os.path.join(dataset_dir, 'files'), os.path.join(run_dir, 'files'), copy_function=link)
+
+
+def run_server(workdir, port, workers, threads):
+    """子进程入口：在数据集副本上运行生产服务器"""
+    app_module = load_app(workdir, **SERVER_OVERRIDES)
+    settings = app_module.ServerSettings(app_module.app.config, '127.0.0.1', port, workers=workers, threads=threads)
+    app_module.serve(app_module.app, settings, post_fork=app_module.reset_after_fork,
+                     worker_exit=app_module.close_worker)
+
+
+def run_cleanup(workdir):
+    """子进程入口：执行一次完整清理，输出耗时、各项数量和进程 RSS 峰值（JSON）"""
+    app_module = load_app(workdir, CLEANUP_BATCH_PAUSE=0, **SERVER_OVERRIDES)
+    started = time.perf_counter()
+    result = app_module.cleanup_scheduler.run_once()
+    elapsed = time.perf_counter() - started
+    json.dump({
+        'duration_s': round(elapsed, 3),
+        'removed': {key: value for key, value in result.items() if key != 'duration'},
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }, sys.stdout)
+
+
+def multipart(filename, data):
+    boundary = uuid.uuid4().hex
+    fields = {'expire_days': '1', 'max_downloads': '0', 'description': 'benchmark upload'}
+    parts = [f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+             for name, value in fields.items()]
+    parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+                 f'Content-Type: application/octet-stream\r\n\r\n'.encode() + data + b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+def client_loop(port, scenario, seconds, index, manifest, upload_size):
+    """客户端进程：在 seconds 秒内循环运行 scenario，返回 (成功请求的延迟列表, 失败数)"""
+    client = Client(port)
+    headers = {}
+    if scenario in ('upload', 'admin', 'search'):
+        headers['Cookie'] = login(client, manifest['admin_password'])
+    codes, terms = manifest['valid_codes'], manifest['search_terms']
+    latencies, errors = [], 0
+    n = index
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        method, body, expected = 'GET', None, 200
+        headers['X-Forwarded-For'] = f'10.{index % 250}.{n // 250 % 250}.{n % 250 + 1}'
+        if scenario == 'index':
+            path = '/'
+        elif scenario == 'extract':
+            method, path, expected = 'POST', '/', 302
+            body = f'code={codes[n % len(codes)]}'
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        elif scenario == 'download':
+            path = f'/download/{codes[n % len(codes)]}'
+        elif scenario == 'upload':
+            method, path, expected = 'POST', '/admin/add', 302
+            body, headers['Content-Type'] = multipart(f'bench-{index}-{n}.zip', os.urandom(upload_size))
+        elif scenario == 'admin':
+            path = ADMIN_PAGES[n % len(ADMIN_PAGES)]
+        else:
+            path = f'/admin/search?q={terms[n % len(terms)]}'
+        n += 1
+        start = time.perf_counter()
+        try:
+            response, _ = client.request(method, path, body, headers)
+            ok = response.status == expected
+            if ok and scenario == 'extract':
+                ok = '/download/' in response.getheader('Location', '')
+        except (http.client.HTTPException, OSError):
+            ok = False
+        if ok:
+            latencies.append(time.perf_counter() - start)
+        else:
+            errors += 1
+    client.close()
+    return latencies, errors
+
+
+def file_count(workdir):
+    with sqlite3.connect(os.path.join(workdir, 'bench.db')) as conn:
+        return conn.execute('SELECT COUNT(*) FROM file_record').fetchone()[0]
+
+
+def run_http_scenario(port, server_pid, scenario, args, manifest, workdir):
+    with multiprocessing.Pool(args.clients) as pool:
+        if args.warmup:
+            pool.starmap(client_loop, [(port, scenario, args.warmup, i, manifest, args.upload_size)
+                                       for i in range(args.clients)])
+
+        files_before = file_count(workdir) if scenario == 'upload' else 0
+        peak = [0]
+        sampling = threading.Event()
+
+        def sample():
+            while not sampling.wait(0.05):
+                peak[0] = max(peak[0], process_tree_usage(server_pid)[1])
+
+        sampler = threading.Thread(target=sample, daemon=True)
+        sampler.start()
+        started = time.perf_counter()
+        results = pool.starmap(client_loop, [(port, scenario, args.seconds, args.clients + i, manifest,
+                                              args.upload_size) for i in range(args.clients)])
+        elapsed = time.perf_counter() - started
+        sampling.set()
+        sampler.join()
+
+    latencies = [t for result, _ in results for t in result]
+    errors = sum(e for _, e in results)
+    succeeded = len(latencies)
+    if scenario == 'upload':
+        # 上传失败同样返回 302（带提示信息），成功数以实际新增的文件记录为准
+        succeeded = file_count(workdir) - files_before
+        errors += len(latencies) - succeeded
+    return {
+        'requests': succeeded,
+        'errors': errors,
+        'throughput_rps': round(succeeded / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p90_ms': round(percentile(latencies, 90) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'peak_rss_mb': round(peak[0] / 1024 / 1024, 1),
+    }
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=APP_DIR, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=APP_DIR,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        commit, dirty = None, None
+    return {
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'git_commit': commit,
+        'git_dirty': dirty,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def run_suite(args):
+    spec = dataset_spec(args)
+    scenarios = [name for name in args.scenarios.split(',') if name]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        raise SystemExit(f"未知的场景：{', '.join(sorted(unknown))}")
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        dataset_dir = args.dataset or os.path.join(tempdir, 'dataset')
+        log = lambda message: print(message, file=sys.stderr)
+        manifest = ensure_dataset(dataset_dir, spec, log)
+        run_dir = os.path.join(tempdir, 'run')
+        os.makedirs(run_dir)
+        copy_dataset(dataset_dir, run_dir)
+
+        results = {}
+        port = free_port()
+        server_log = open(args.server_log, 'w') if args.server_log else subprocess.DEVNULL
+        server = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), '--server', '--workdir', run_dir, '--port', str(port),
+             '--workers', str(args.workers), '--threads', str(args.threads)],
+            stdout=server_log, stderr=server_log)
+        try:
+            wait_for_port(port)
+            for scenario in scenarios:
+                if scenario in HTTP_SCENARIOS:
+                    log(f'运行 {scenario} ...')
+                    results[scenario] = run_http_scenario(port, server.pid, scenario, args, manifest, run_dir)
+        finally:
+            server.terminate()
+            server.wait()
+            if args.server_log:
+                server_log.close()
+
+        if 'cleanup' in scenarios:
+            log('运行 cleanup ...')
+            output = subprocess.run([sys.executable, os.path.abspath(__file__), '--cleanup-run', '--workdir', run_dir],
+                                    check=True, capture_output=True, text=True).stdout
+            results['cleanup'] = json.loads(output)
+
+    return {
+        'version': RESULT_VERSION,
+        'environment': environment(),
+        'options': {'clients': args.clients, 'seconds': args.seconds, 'warmup': args.warmup,
+                    'workers': args.workers, 'threads': args.threads, 'upload_size': args.upload_size},
+        'dataset': spec,
+        'scenarios': {name: results[name] for name in scenarios},
+    }
+
+
+def print_results(report):
+    print(f"{'场景':<10}{'请求/s':>10}{'p50(ms)':>10}{'p90(ms)':>10}{'p99(ms)':>10}{'失败':>8}{'RSS峰值(MB)':>14}")
+    for name, result in report['scenarios'].items():
+        if name == 'cleanup':
+            continue
+        print(f"{name:<10}{result['throughput_rps']:>10.1f}{result['p50_ms']:>10.2f}{result['p90_ms']:>10.2f}"
+              f"{result['p99_ms']:>10.2f}{result['errors']:>8}{result['peak_rss_mb']:>14.1f}")
+    cleanup = report['scenarios'].get('cleanup')
+    if cleanup:
+        removed = '，'.join(f'{key} {value}' for key, value in cleanup['removed'].items() if value)
+        print(f"cleanup：{cleanup['duration_s']:.2f} 秒，RSS峰值 {cleanup['peak_rss_mb']:.1f} MB（{removed or '无'}）")
+
+
+def print_comparison(base, new):
+    """列出两次结果的变化（吞吐越高越好，延迟和内存越低越好）"""
+    if base['dataset'] != new['dataset'] or base['options'] != new['options']:
+        print('注意：两次运行的数据集参数或测试选项不同，结果不能直接比较')
+    print(f"基准 {base['environment']['git_commit'] or '?'}（{base['environment']['created_at']}）"
+          f" -> {new['environment']['git_commit'] or '?'}（{new['environment']['created_at']}）")
+    print(f"{'场景':<10}{'指标':<14}{'基准':>12}{'本次':>12}{'变化':>10}")
+    for name, result in new['scenarios'].items():
+        old = base['scenarios'].get(name)
+        if old is None:
+            continue
+        keys = ['duration_s', 'peak_rss_mb'] if name == 'cleanup' else ['throughput_rps', 'p50_ms', 'p99_ms', 'peak_rss_mb']
+        for key in keys:
+            before, after = old[key], result[key]
+            change = f'{(after - before) / before:+.1%}' if before else '-'
+            print(f"{name:<10}{key:<14}{before:>12}{after:>12}{change:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--dataset', help='数据集目录（不存在时生成，参数相同时复用；默认生成在临时目录）')
+    add_dataset_arguments(parser)
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='运行的场景，逗号分隔')
+    parser.add_argument('--clients', type=int, default=8, help='并发客户端（进程）数')
+    parser.add_argument('--seconds', type=float, default=10, help='每个场景的测量时间(秒)')
+    parser.add_argument('--warmup', type=float, default=1, help='每个场景测量前的预热时间(秒)')
+    parser.add_argument('--workers', type=int, default=2, help='生产服务器 worker 进程数')
+    parser.add_argument('--threads', type=int, default=8, help='生产服务器每个 worker 的线程数')
+    parser.add_argument('--upload-size', type=int, default=256 * 1024, help='upload 场景每个文件的大小(字节)')
+    parser.add_argument('--output', help='结果写入的 JSON 文件')
+    parser.add_argument('--server-log', help='服务器输出写入的文件（排查失败的请求）')
+    parser.add_argument('--baseline', help='与之对比的上一次结果（JSON 文件）')
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'NEW'), help='只对比两个结果文件，不运行测试')
+    parser.add_argument('--server', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--cleanup-run', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--workdir', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.server:
+        run_server(args.workdir, args.port, args.workers, args.threads)
+        return
+    if args.cleanup_run:
+        run_cleanup(args.workdir)
+        return
+    if args.compare:
+        reports = []
+        for path in args.compare:
+            with open(path) as f:
+                reports.append(json.load(f))
+        print_comparison(*reports)
+        return
+
+    report = run_suite(args)
+    print_results(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'结果已写入 {args.output}')
+    if args.baseline:
+        with open(args.baseline) as f:
+            print()
+            print_comparison(json.load(f), report)
+
+
+if __name__ == '__main__':
+    main()